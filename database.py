@@ -1,14 +1,102 @@
 import firebase_admin
 from firebase_admin import firestore
 from models import ChatMessage, ChatSession, UserSettings
-from typing import List, Optional
+from parallel_utils import run_blocking
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
 import uuid
 import re
 from datetime import datetime, timedelta, timezone
 
+MEMORY_COMMANDS = ("remember this", "save to memory", "store this")
+NAME_PATTERN = re.compile(r"my name is ([^.!?\n]+)")
+
+def chat_title_from_message(first_message: str) -> str:
+    """Chat title derived from the first message, truncated to 50 characters"""
+    title = first_message[:50].strip()
+    if len(first_message) > 50:
+        title += "..."
+    return title
+
+# A write is (batch method, document reference, data, keyword options), e.g. ("set", ref, data, {"merge": True})
+Write = Tuple[str, Any, dict, Dict[str, Any]]
+
+class BufferedWriter:
+    """Coalesces writes from concurrent requests into shared Firestore batches,
+    committed once max_items turns are queued or max_delay seconds have passed"""
+    
+    def __init__(self, max_items: int = 20, max_delay: float = 0.025, max_queue: int = 1000):
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+    
+    async def write(self, db, writes: List[Write]) -> None:
+        """Queue one turn's writes and wait until they are committed"""
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue(self.max_queue)
+            self.worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((db, writes, future))
+        except asyncio.QueueFull:
+            await run_blocking(self._commit, db, writes)  # Overloaded: write directly
+            return
+        await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(pending) < self.max_items:
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(pending)
+    
+    async def _flush(self, pending: list):
+        try:
+            await run_blocking(self._commit, pending[0][0], [write for _, writes, _ in pending for write in writes])
+            results = [None] * len(pending)
+        except Exception:
+            # One bad write fails the whole batch; retry each turn alone so only it fails
+            results = []
+            for db, writes, _ in pending:
+                try:
+                    await run_blocking(self._commit, db, writes)
+                    results.append(None)
+                except Exception as e:
+                    results.append(e)
+        for (_, _, future), error in zip(pending, results):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+    
+    @staticmethod
+    def _commit(db, writes: List[Write]):
+        batch = db.batch()
+        for method, ref, data, options in writes:
+            getattr(batch, method)(ref, data, **options)
+        batch.commit()
+
 class DatabaseManager:
     def __init__(self):
         self.db = None
+        self.writer = BufferedWriter()
+        self.user_versions = {}  # Bumped whenever a user's settings or memory change
+        self.recent_query_failed = False  # Set once the ordered recent-messages query is rejected
+    
+    def get_user_version(self, user_id: str) -> int:
+        return self.user_versions.get(user_id, 0)
+    
+    def bump_user_version(self, user_id: str):
+        self.user_versions[user_id] = self.user_versions.get(user_id, 0) + 1
     
     def get_db(self):
         if self.db is None:
@@ -31,7 +119,7 @@ class DatabaseManager:
         }
         db = self.get_db()
         if db:
-            db.collection("chat_sessions").document(chat_id).set(chat_data)
+            await run_blocking(db.collection("chat_sessions").document(chat_id).set, chat_data)
         return chat_id
     
     async def get_user_chats(self, user_id: str) -> List[dict]:
@@ -39,8 +127,8 @@ class DatabaseManager:
         if not db:
             return []
         try:
-            chats = db.collection("chat_sessions").where(filter=firestore.FieldFilter("user_id", "==", user_id)).stream()
-            chat_list = [chat.to_dict() for chat in chats]
+            query = db.collection("chat_sessions").where(filter=firestore.FieldFilter("user_id", "==", user_id))
+            chat_list = await run_blocking(lambda: [chat.to_dict() for chat in query.stream()])
             chat_list.sort(key=lambda x: x.get('updated_at', datetime.min), reverse=True)
             return chat_list
         except Exception as e:
@@ -65,12 +153,8 @@ class DatabaseManager:
             if chat_doc.exists:
                 chat_data = chat_doc.to_dict()
                 if chat_data.get("title") == "New Chat":
-                    new_title = first_message[:50].strip()
-                    if len(first_message) > 50:
-                        new_title += "..."
-                    
                     db.collection("chat_sessions").document(chat_id).update({
-                        "title": new_title,
+                        "title": chat_title_from_message(first_message),
                         "updated_at": datetime.now()
                     })
         except Exception as e:
@@ -102,31 +186,91 @@ class DatabaseManager:
         }
         db = self.get_db()
         if db:
-            db.collection("chat_messages").document(message_id).set(message_data)
-            db.collection("chat_sessions").document(chat_id).update({
-                "updated_at": datetime.now()
-            })
+            await self.writer.write(db, [
+                ("set", db.collection("chat_messages").document(message_id), message_data, {}),
+                ("update", db.collection("chat_sessions").document(chat_id), {"updated_at": datetime.now()}, {})
+            ])
+    
+    async def finalize_turn(self, user_id: str, chat_id: str, message: str, response: str, agent_type: str, update_memory: bool = False):
+        """Save a chat turn, touch the chat (title if still new) and update memory in one write,
+        batched with other requests' turns by the buffered writer"""
+        db = self.get_db()
+        if not db:
+            return
+        
+        try:
+            now = datetime.now()
+            message_id = str(uuid.uuid4())
+            writes = [("set", db.collection("chat_messages").document(message_id), {
+                "id": message_id,
+                "user_id": user_id,
+                "chat_id": chat_id,
+                "message": message,
+                "response": response,
+                "agent_type": agent_type,
+                "timestamp": now
+            }, {})]
+            
+            session_ref = db.collection("chat_sessions").document(chat_id)
+            session_doc = await run_blocking(session_ref.get, field_paths=["title"])
+            if session_doc.exists:
+                session_update = {"updated_at": now}
+                if session_doc.to_dict().get("title") == "New Chat":
+                    session_update["title"] = chat_title_from_message(message)
+                writes.append(("update", session_ref, session_update, {}))
+            
+            memory = await self.memory_from_message(user_id, message) if update_memory else None
+            if memory is not None:
+                writes.append(("set", db.collection("user_memory").document(user_id), self.memory_document(user_id, memory), {"merge": True}))
+            
+            await self.writer.write(db, writes)
+            # Bump only once the new memory is committed, so nothing caches the old one under the new version
+            if memory is not None:
+                self.bump_user_version(user_id)
+        except Exception as e:
+            print(f"Error finalizing chat turn: {e}")
     
     async def get_chat_messages(self, chat_id: str) -> List[dict]:
         db = self.get_db()
         if not db:
             return []
         try:
-            messages = db.collection("chat_messages").where(filter=firestore.FieldFilter("chat_id", "==", chat_id)).stream()
-            message_list = [message.to_dict() for message in messages]
+            query = db.collection("chat_messages").where(filter=firestore.FieldFilter("chat_id", "==", chat_id))
+            message_list = await run_blocking(lambda: [message.to_dict() for message in query.stream()])
             message_list.sort(key=lambda x: x.get('timestamp', datetime.min))
             return message_list
         except Exception as e:
             print(f"Error getting chat messages: {e}")
             return []
     
+    async def get_recent_chat_messages(self, chat_id: str, limit: int = 3) -> List[dict]:
+        """Last `limit` messages of a chat, oldest first, with only the fields used for context"""
+        db = self.get_db()
+        if not db:
+            return []
+        if not self.recent_query_failed:
+            try:
+                query = (db.collection("chat_messages")
+                         .where(filter=firestore.FieldFilter("chat_id", "==", chat_id))
+                         .order_by("timestamp", direction=firestore.Query.DESCENDING)
+                         .limit(limit)
+                         .select(["message", "response", "timestamp"]))
+                message_list = await run_blocking(lambda: [message.to_dict() for message in query.stream()])
+                message_list.reverse()
+                return message_list
+            except Exception as e:
+                # The ordered query needs the composite index in firestore.indexes.json
+                print(f"Recent chat messages query failed, falling back to full reads: {e}")
+                self.recent_query_failed = True
+        return (await self.get_chat_messages(chat_id))[-limit:]
+    
     async def get_all_user_messages(self, user_id: str) -> List[dict]:
         db = self.get_db()
         if not db:
             return []
         try:
-            messages = db.collection("chat_messages").where(filter=firestore.FieldFilter("user_id", "==", user_id)).stream()
-            message_list = [message.to_dict() for message in messages]
+            query = db.collection("chat_messages").where(filter=firestore.FieldFilter("user_id", "==", user_id))
+            message_list = await run_blocking(lambda: [message.to_dict() for message in query.stream()])
             message_list.sort(key=lambda x: x.get('timestamp', datetime.min))
             return message_list
         except Exception as e:
@@ -139,53 +283,57 @@ class DatabaseManager:
         if not db:
             return UserSettings(user_id=user_id).dict()
         
-        doc = db.collection("user_settings").document(user_id).get()
+        doc_ref = db.collection("user_settings").document(user_id)
+        doc = await run_blocking(doc_ref.get)
         if doc.exists:
             return doc.to_dict()
         else:
             default_settings = UserSettings(user_id=user_id).dict()
-            db.collection("user_settings").document(user_id).set(default_settings)
+            await run_blocking(doc_ref.set, default_settings)
             return default_settings
     
     async def update_user_settings(self, user_id: str, settings: dict):
+        self.bump_user_version(user_id)
         db = self.get_db()
         if db:
             db.collection("user_settings").document(user_id).update(settings)
     
     # User Memory Management
     async def save_user_memory(self, user_id: str, memory_data: dict):
+        self.bump_user_version(user_id)
         db = self.get_db()
         if not db:
             return
         
         try:
-            memory_doc = {
-                "user_id": user_id,
-                "name": memory_data.get("name", ""),
-                "occupation": memory_data.get("occupation", ""),
-                "background": memory_data.get("background", ""),
-                "skills": memory_data.get("skills", ""),
-                "goals": memory_data.get("goals", ""),
-                "projects": memory_data.get("projects", ""),
-                "interests": memory_data.get("interests", ""),
-                "learning_path": memory_data.get("learning_path", ""),
-                "response_tone": memory_data.get("response_tone", ""),
-                "response_format": memory_data.get("response_format", ""),
-                "language_style": memory_data.get("language_style", ""),
-                "detail_level": memory_data.get("detail_level", ""),
-                "use_emojis": memory_data.get("use_emojis", False),
-                "code_preference": memory_data.get("code_preference", ""),
-                "explanation_style": memory_data.get("explanation_style", ""),
-                "context_notes": memory_data.get("context_notes", ""),
-                "last_updated": datetime.now(),
-                "created_at": memory_data.get("created_at", datetime.now())
-            }
-            
-            db.collection("user_memory").document(user_id).set(memory_doc, merge=True)
-            
+            await run_blocking(db.collection("user_memory").document(user_id).set, self.memory_document(user_id, memory_data), merge=True)
         except Exception as e:
             print(f"Error saving user memory: {e}")
     
+    def memory_document(self, user_id: str, memory_data: dict) -> dict:
+        """Normalized user_memory document for a memory dict"""
+        return {
+            "user_id": user_id,
+            "name": memory_data.get("name", ""),
+            "occupation": memory_data.get("occupation", ""),
+            "background": memory_data.get("background", ""),
+            "skills": memory_data.get("skills", ""),
+            "goals": memory_data.get("goals", ""),
+            "projects": memory_data.get("projects", ""),
+            "interests": memory_data.get("interests", ""),
+            "learning_path": memory_data.get("learning_path", ""),
+            "response_tone": memory_data.get("response_tone", ""),
+            "response_format": memory_data.get("response_format", ""),
+            "language_style": memory_data.get("language_style", ""),
+            "detail_level": memory_data.get("detail_level", ""),
+            "use_emojis": memory_data.get("use_emojis", False),
+            "code_preference": memory_data.get("code_preference", ""),
+            "explanation_style": memory_data.get("explanation_style", ""),
+            "context_notes": memory_data.get("context_notes", ""),
+            "last_updated": datetime.now(),
+            "created_at": memory_data.get("created_at", datetime.now())
+        }
+    
     # 2FA Management
     async def save_2fa_secret(self, user_id: str, secret: str):
         db = self.get_db()
@@ -230,7 +378,8 @@ class DatabaseManager:
             return {}
         
         try:
-            doc = db.collection("user_memory").document(user_id).get()
+            doc_ref = db.collection("user_memory").document(user_id)
+            doc = await run_blocking(doc_ref.get)
             if doc.exists:
                 return doc.to_dict()
             else:
@@ -246,28 +395,35 @@ class DatabaseManager:
                     "created_at": datetime.now(),
                     "last_updated": datetime.now()
                 }
-                db.collection("user_memory").document(user_id).set(empty_memory)
+                await run_blocking(doc_ref.set, empty_memory)
                 return empty_memory
         except Exception as e:
             print(f"Error getting user memory: {e}")
             return {}
     
+    async def memory_from_message(self, user_id: str, message: str) -> Optional[dict]:
+        """Updated memory when the message asks to remember something or states a name, else None"""
+        message_lower = message.lower().strip()
+        
+        if any(cmd in message_lower for cmd in MEMORY_COMMANDS):
+            current_memory = await self.get_user_memory(user_id)
+            current_memory["context_notes"] = current_memory.get("context_notes", "") + f"; {message}"
+            return current_memory
+        
+        if "my name is" in message_lower:
+            name_match = NAME_PATTERN.search(message_lower)
+            if name_match:
+                current_memory = await self.get_user_memory(user_id)
+                current_memory["name"] = name_match.group(1).strip().title()
+                return current_memory
+        
+        return None
+    
     async def update_user_memory_from_conversation(self, user_id: str, message: str, response: str):
         try:
-            message_lower = message.lower().strip()
-            current_memory = await self.get_user_memory(user_id)
-            
-            if any(cmd in message_lower for cmd in ["remember this", "save to memory", "store this"]):
-                current_memory["context_notes"] = current_memory.get("context_notes", "") + f"; {message}"
-                await self.save_user_memory(user_id, current_memory)
-                return
-            
-            if "my name is" in message_lower:
-                name_match = re.search(r"my name is ([^.!?\n]+)", message_lower)
-                if name_match:
-                    current_memory["name"] = name_match.group(1).strip().title()
-                    await self.save_user_memory(user_id, current_memory)
-                
+            memory = await self.memory_from_message(user_id, message)
+            if memory is not None:
+                await self.save_user_memory(user_id, memory)
         except Exception as e:
             print(f"Error updating user memory: {e}")
     
@@ -4,6 +4,12 @@ from googleapiclient.http import MediaIoBaseDownload
 import io
 import tempfile
 import os
+from fast_cache import drive_cache
+
+# Read-only uploads never change in place, so keep them longer than
+# native Google Docs which are edited collaboratively
+READ_ONLY_CACHE_TTL = 3600
+EDITABLE_CACHE_TTL = 300
 
 class GoogleDriveService:
     def __init__(self, access_token):
@@ -14,7 +20,16 @@ class GoogleDriveService:
         """Download file content temporarily for AI analysis"""
         try:
             # Get file metadata
-            file_metadata = self.service.files().get(fileId=file_id).execute()
+            file_metadata = self.service.files().get(
+                fileId=file_id,
+                fields='id,name,mimeType,modifiedTime,size'
+            ).execute()
+            
+            # Serve repeat fetches of an unchanged file from cache
+            cache_key = f"drive:{file_id}:{file_metadata.get('modifiedTime', '')}"
+            cached = await drive_cache.get(cache_key)
+            if cached is not None:
+                return cached
             
             # Download file content
             request = self.service.files().get_media(fileId=file_id)
@@ -32,25 +47,31 @@ class GoogleDriveService:
             mime_type = file_metadata.get('mimeType', '')
             
             if mime_type.startswith('text/') or file_metadata['name'].endswith(('.txt', '.md', '.py', '.js', '.html')):
-                return {
+                result = {
                     'content': content_bytes.decode('utf-8')[:10000],
                     'type': 'text',
                     'name': file_metadata['name']
                 }
             elif mime_type.startswith('image/'):
                 import base64
-                return {
+                # Only the first 50000 base64 chars are kept, so encode just
+                # the 37500 source bytes they represent
+                result = {
                     'content': f"[Image: {file_metadata['name']}]",
-                    'base64': base64.b64encode(content_bytes).decode('utf-8')[:50000],
+                    'base64': base64.b64encode(content_bytes[:37500]).decode('ascii'),
                     'type': 'image',
                     'name': file_metadata['name']
                 }
             else:
-                return {
+                result = {
                     'content': f"[File: {file_metadata['name']} - {len(content_bytes)} bytes]",
                     'type': 'binary',
                     'name': file_metadata['name']
                 }
+            
+            ttl = EDITABLE_CACHE_TTL if mime_type.startswith('application/vnd.google-apps.') else READ_ONLY_CACHE_TTL
+            await drive_cache.set(cache_key, result, ttl=ttl)
+            return result
                 
         except Exception as e:
             return {
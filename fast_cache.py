@@ -5,43 +5,88 @@ Reduces API calls and improves response times
 
 import asyncio
 import hashlib
+import logging
+import os
+import sys
 import time
 from typing import Dict, Any, Optional
-import json
+import orjson
+from parallel_utils import env_int
+
+logger = logging.getLogger("novax")
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis is optional; caches stay in-process without it
+    aioredis = None
+
+REDIS_URL = os.getenv("REDIS_URL")
+RESPONSE_CACHE_TTL = env_int("NOVAX_RESPONSE_CACHE_TTL", 3600)
+CACHE_MODEL = "gemini-2.5-flash"
+
+def hash_key_parts(*parts: str) -> str:
+    """Hash key parts incrementally with separators, without building a joined string"""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode())
+        h.update(b'\x00')
+    return h.hexdigest()
 
 class FastCache:
-    """Lightweight in-memory cache with TTL"""
+    """Lightweight in-memory cache with TTL, optionally capped to max_entries
+    (least recently used entries are evicted first)"""
     
-    def __init__(self, default_ttl: int = 300):  # 5 minutes default
+    def __init__(self, default_ttl: int = 300, max_entries: Optional[int] = None):  # 5 minutes default
         self.cache: Dict[str, Dict[str, Any]] = {}
         self.default_ttl = default_ttl
+        self.max_entries = max_entries
         self.lock = asyncio.Lock()
+        self._bytes = 0  # Approximate size of cached keys and values
+        self.hits = 0
+        self.misses = 0
     
     def _hash_key(self, key: str) -> str:
         """Create hash for cache key"""
-        return hashlib.md5(key.encode()).hexdigest()[:16]
+        return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
     
     async def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
+        hashed_key = self._hash_key(key)
         async with self.lock:
-            hashed_key = self._hash_key(key)
             if hashed_key in self.cache:
                 entry = self.cache[hashed_key]
                 if time.time() < entry['expires']:
+                    self.hits += 1
+                    if self.max_entries is not None:
+                        self.cache[hashed_key] = self.cache.pop(hashed_key)  # Mark most recently used
                     return entry['value']
                 else:
-                    del self.cache[hashed_key]
+                    self._evict(hashed_key)
+            self.misses += 1
             return None
     
     async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
         """Set value in cache"""
+        hashed_key = self._hash_key(key)
         async with self.lock:
-            hashed_key = self._hash_key(key)
             expires = time.time() + (ttl or self.default_ttl)
+            size = sys.getsizeof(hashed_key) + sys.getsizeof(value)
+            if hashed_key in self.cache:
+                self._evict(hashed_key)
             self.cache[hashed_key] = {
                 'value': value,
-                'expires': expires
+                'expires': expires,
+                'size': size
             }
+            self._bytes += size
+            if self.max_entries is not None:
+                while len(self.cache) > self.max_entries:
+                    self._evict(next(iter(self.cache)))
+    
+    def _evict(self, hashed_key: str) -> None:
+        """Remove an entry and release its byte count (caller holds lock)"""
+        entry = self.cache.pop(hashed_key)
+        self._bytes -= entry['size']
     
     async def clear_expired(self) -> None:
         """Remove expired entries"""
@@ -52,35 +97,147 @@ class FastCache:
                 if current_time >= v['expires']
             ]
             for key in expired_keys:
-                del self.cache[key]
+                self._evict(key)
+    
+    async def clear(self) -> None:
+        """Remove every entry"""
+        async with self.lock:
+            self.cache.clear()
+            self._bytes = 0
     
     def get_stats(self) -> Dict[str, int]:
         """Get cache statistics"""
         return {
+            'backend': 'memory',
             'total_entries': len(self.cache),
-            'memory_usage_kb': len(str(self.cache)) // 1024
+            'memory_usage_kb': self._bytes // 1024,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+class RedisCache:
+    """Redis-backed cache shared across workers, same interface as FastCache"""
+    
+    def __init__(self, client, prefix: str, default_ttl: int = 300):
+        self.client = client
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+    
+    async def get(self, key: str) -> Optional[Any]:
+        """Get value from Redis, treating connection errors and corrupt values as a miss"""
+        try:
+            payload = await self.client.get(self.prefix + key)
+            value = orjson.loads(payload) if payload is not None else None
+        except Exception as e:
+            logger.warning("Redis get error: %s", e)
+            payload = None
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+    
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Set value in Redis with expiry"""
+        try:
+            await self.client.setex(self.prefix + key, ttl or self.default_ttl, orjson.dumps(value))
+        except Exception as e:
+            logger.warning("Redis set error: %s", e)
+    
+    async def clear_expired(self) -> None:
+        """Redis expires keys on its own"""
+        return None
+    
+    async def clear(self) -> None:
+        """Delete every key under this cache's prefix"""
+        try:
+            keys = [key async for key in self.client.scan_iter(match=self.prefix + "*")]
+            if keys:
+                await self.client.delete(*keys)
+        except Exception as e:
+            logger.warning("Redis clear error: %s", e)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        return {
+            'backend': 'redis',
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+class TieredCache:
+    """In-process cache in front of a shared one (Redis); shared hits are copied
+    into the local tier, so repeats skip the network, and entries survive restarts"""
+    
+    def __init__(self, local: FastCache, shared: RedisCache):
+        self.local = local
+        self.shared = shared
+    
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self.local.get(key)
+        if value is None:
+            value = await self.shared.get(key)
+            if value is not None:
+                await self.local.set(key, value)
+        return value
+    
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        await self.local.set(key, value, ttl)
+        await self.shared.set(key, value, ttl)
+    
+    async def clear_expired(self) -> None:
+        await self.local.clear_expired()
+    
+    async def clear(self) -> None:
+        await self.local.clear()
+        await self.shared.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics for both tiers"""
+        return {
+            'backend': 'tiered',
+            'local': self.local.get_stats(),
+            'shared': self.shared.get_stats()
         }
 
 # Global cache instances
-response_cache = FastCache(default_ttl=300)  # 5 min for responses
-search_cache = FastCache(default_ttl=600)    # 10 min for search results
+# Responses and search results move to Redis when REDIS_URL is set so every
+# worker and instance shares them
+redis_client = aioredis.from_url(REDIS_URL) if (REDIS_URL and aioredis) else None
+if redis_client is not None:
+    response_cache = RedisCache(redis_client, "novax:resp:", default_ttl=RESPONSE_CACHE_TTL)
+    search_cache = RedisCache(redis_client, "novax:search:", default_ttl=600)
+else:
+    response_cache = FastCache(default_ttl=RESPONSE_CACHE_TTL)
+    search_cache = FastCache(default_ttl=600)    # 10 min for search results
 datetime_cache = FastCache(default_ttl=60)   # 1 min for datetime
+drive_cache = FastCache(default_ttl=1800)    # 30 min for Drive files
+tts_cache = FastCache(default_ttl=3600, max_entries=1024)  # 1 hour for synthesized speech
+if redis_client is not None:
+    # Synthesized speech is kept a day in Redis, shared by every worker and restart
+    tts_cache = TieredCache(tts_cache, RedisCache(redis_client, "novax:tts:", default_ttl=86400))
+
+def response_cache_key(prompt: str) -> str:
+    """Hash the model and full prompt (personalization included) into a key"""
+    return hash_key_parts(CACHE_MODEL, prompt)
 
 async def cache_ai_response(prompt: str, response: str) -> None:
     """Cache AI response"""
-    await response_cache.set(f"ai:{prompt[:100]}", response)
+    await response_cache.set(response_cache_key(prompt), response)
 
 async def get_cached_response(prompt: str) -> Optional[str]:
     """Get cached AI response"""
-    return await response_cache.get(f"ai:{prompt[:100]}")
+    return await response_cache.get(response_cache_key(prompt))
 
 async def cache_search_results(query: str, results: Dict) -> None:
     """Cache search results"""
-    await search_cache.set(f"search:{query}", results)
+    await search_cache.set(hash_key_parts("search", query), results)
 
 async def get_cached_search(query: str) -> Optional[Dict]:
     """Get cached search results"""
-    return await search_cache.get(f"search:{query}")
+    return await search_cache.get(hash_key_parts("search", query))
 
 # Auto cleanup task
 async def cleanup_caches():
@@ -90,15 +247,27 @@ async def cleanup_caches():
         await response_cache.clear_expired()
         await search_cache.clear_expired()
         await datetime_cache.clear_expired()
+        await drive_cache.clear_expired()
+        await tts_cache.clear_expired()
 
-# Cleanup task will be started when event loop is running
-_cleanup_task = None
+# Cleanup task is started from app startup so it runs on the server's loop
+_cleanup_task: Optional[asyncio.Task] = None
+
+async def start_cache_cleanup() -> None:
+    """Start the periodic cache cleanup task"""
+    global _cleanup_task
+    if _cleanup_task is None or _cleanup_task.done():
+        _cleanup_task = asyncio.create_task(cleanup_caches())
 
-def start_cleanup_task():
-    """Start cleanup task when event loop is available"""
+async def stop_cache_cleanup() -> None:
+    """Cancel the cleanup task on shutdown"""
     global _cleanup_task
-    if _cleanup_task is None:
+    if _cleanup_task is not None:
+        _cleanup_task.cancel()
         try:
-            _cleanup_task = asyncio.create_task(cleanup_caches())
-        except RuntimeError:
-            pass  # No event loop running yet
+            await _cleanup_task
+        except asyncio.CancelledError:
+            pass
+        _cleanup_task = None
+    if redis_client is not None:
+        await redis_client.close()
@@ -1,10 +1,15 @@
 import asyncio
 import random
 import time
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 import google.generativeai as genai
 from dataclasses import dataclass
 import logging
+from parallel_utils import TokenBucket
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0, jitter: float = 0.5) -> float:
+    """Exponential backoff with random jitter so concurrent retries do not fire in lockstep"""
+    return min(cap, base * (2 ** attempt) * (1 + random.random() * jitter))
 
 @dataclass
 class APIKeyStatus:
@@ -21,18 +26,23 @@ class GeminiAPIPool:
         self.current_index = 0
         self.lock = asyncio.Lock()
         
+        # Rate limiting settings
+        self.max_requests_per_minute = 60
+        self.cooldown_duration = 60  # seconds
+        
+        # Each key spends from its own bucket refilled at the per-minute quota, so
+        # bursts are spread across keys instead of running into 429 backoffs
+        self.key_buckets: Dict[str, TokenBucket] = {}
+        
         # Initialize key status
         for key in api_keys:
+            self.key_buckets[key] = TokenBucket(self.max_requests_per_minute, 60.0)
             self.key_status[key] = APIKeyStatus(
                 key=key,
                 last_used=0,
                 request_count=0
             )
         
-        # Rate limiting settings
-        self.max_requests_per_minute = 60
-        self.cooldown_duration = 60  # seconds
-        
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
     
@@ -47,10 +57,10 @@ class GeminiAPIPool:
                     status.is_available = True
                     status.request_count = 0
             
-            # Find available keys
+            # Find available keys: not cooling down and with quota left in their bucket
             available_keys = [
                 status for status in self.key_status.values() 
-                if status.is_available and status.request_count < self.max_requests_per_minute
+                if status.is_available and self.key_buckets[status.key].available() >= 1
             ]
             
             if not available_keys:
@@ -58,9 +68,10 @@ class GeminiAPIPool:
                 self.logger.warning("All API keys rate limited, waiting...")
                 return None
             
-            # Round-robin selection with least recently used preference
-            available_keys.sort(key=lambda x: (x.request_count, x.last_used))
+            # Key with the most quota left, least recently used on ties
+            available_keys.sort(key=lambda x: (-self.key_buckets[x.key].tokens, x.last_used))
             selected_key = available_keys[0].key
+            self.key_buckets[selected_key].try_take()
             
             # Update usage stats
             self.key_status[selected_key].last_used = current_time
@@ -77,16 +88,16 @@ class GeminiAPIPool:
                 status.cooldown_until = time.time() + self.cooldown_duration
                 self.logger.warning(f"API key marked as failed: {error_type}")
     
-    async def generate_content_with_retry(self, prompt: str, max_retries: int = 5) -> Optional[str]:
-        """Generate content with automatic retry across different API keys"""
+    async def generate_content_with_retry(self, prompt: Union[str, list], max_retries: int = 5) -> Optional[str]:
+        """Generate content with automatic retry across different API keys; prompt may be a text+image parts list"""
         for attempt in range(max_retries):
             api_key = await self.get_available_key()
             
             if not api_key:
                 if attempt < max_retries - 1:
                     # Wait longer between retries when all keys are exhausted
-                    wait_time = min(2 ** attempt, 10)  # Exponential backoff, max 10 seconds
-                    self.logger.info(f"All keys exhausted, waiting {wait_time}s before retry {attempt + 1}/{max_retries}")
+                    wait_time = backoff_delay(attempt)
+                    self.logger.info(f"All keys exhausted, waiting {wait_time:.1f}s before retry {attempt + 1}/{max_retries}")
                     await asyncio.sleep(wait_time)
                     continue
                 else:
@@ -97,8 +108,8 @@ class GeminiAPIPool:
                 genai.configure(api_key=api_key)
                 model = genai.GenerativeModel('gemini-2.5-flash')
                 
-                # Generate content
-                response = model.generate_content(prompt)
+                # Generate content without blocking the event loop
+                response = await model.generate_content_async(prompt)
                 return response.text
                 
             except Exception as e:
@@ -120,21 +131,24 @@ class GeminiAPIPool:
                     else:
                         raise e
                 
-                # Brief delay before trying next key
-                await asyncio.sleep(0.5)
+                # Back off before trying the next key; rate limits back off exponentially
+                if "quota" in error_msg or "rate" in error_msg:
+                    await asyncio.sleep(backoff_delay(attempt, base=0.5))
+                else:
+                    await asyncio.sleep(0.5)
         
         return None
     
-    async def generate_content_stream_with_retry(self, prompt: str, max_retries: int = 5):
-        """Generate streaming content with automatic retry and better error handling"""
+    async def generate_content_stream_with_retry(self, prompt: Union[str, list], max_retries: int = 5):
+        """Generate streaming content with automatic retry and better error handling; prompt may be a text+image parts list"""
         for attempt in range(max_retries):
             api_key = await self.get_available_key()
             
             if not api_key:
                 if attempt < max_retries - 1:
                     # Wait longer between retries when all keys are exhausted
-                    wait_time = min(2 ** attempt, 10)  # Exponential backoff, max 10 seconds
-                    self.logger.info(f"All keys exhausted, waiting {wait_time}s before retry {attempt + 1}/{max_retries}")
+                    wait_time = backoff_delay(attempt)
+                    self.logger.info(f"All keys exhausted, waiting {wait_time:.1f}s before retry {attempt + 1}/{max_retries}")
                     await asyncio.sleep(wait_time)
                     continue
                 else:
@@ -144,7 +158,8 @@ class GeminiAPIPool:
                 genai.configure(api_key=api_key)
                 model = genai.GenerativeModel('gemini-2.5-flash')
                 
-                response = model.generate_content(prompt, stream=True)
+                # Async stream: chunks are awaited, so waiting never blocks the event loop
+                response = await model.generate_content_async(prompt, stream=True)
                 return response
                 
             except Exception as e:
@@ -166,8 +181,11 @@ class GeminiAPIPool:
                     else:
                         raise e
                 
-                # Brief delay before trying next key
-                await asyncio.sleep(0.5)
+                # Back off before trying the next key; rate limits back off exponentially
+                if "quota" in error_msg or "rate" in error_msg:
+                    await asyncio.sleep(backoff_delay(attempt, base=0.5))
+                else:
+                    await asyncio.sleep(0.5)
         
         return None
     
@@ -1,12 +1,15 @@
 import pyotp
 import qrcode
 import io
-import base64
+try:
+    import pybase64 as base64  # SIMD-accelerated drop-in for the stdlib module
+except ImportError:
+    import base64
 from analytics_service import get_analytics_service
 from voice_service import get_voice_service
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse, ORJSONResponse
 from models import ChatRequest, ChatResponse, UserSettings, ShareRequest, SharedChat
 import google.generativeai as genai
 import firebase_admin
@@ -16,23 +19,53 @@ from search_service import novax_search
 from image_service import image_generator
 from gemini_pool import initialize_gemini_pool, get_gemini_pool
 from pool_status import router as pool_router
-from parallel_utils import FastParallelProcessor, optimize_for_render
-from fast_cache import response_cache, search_cache, get_cached_response, cache_ai_response, get_cached_search, cache_search_results, start_cleanup_task
+from parallel_utils import AdmissionController, SingleFlight, drain_background_tasks, load_render_config, run_blocking, set_thread_limit, spawn_background
+from fast_cache import response_cache, search_cache, drive_cache, tts_cache, response_cache_key, get_cached_search, cache_search_results, start_cache_cleanup, stop_cache_cleanup
 import os
+import logging
 import re
+import sys
+import html
 import uuid
-import json
+import orjson
 import asyncio
+import time
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 import pytz
-from typing import List
-from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Final, List, NamedTuple, Optional, Union
+from dataclasses import dataclass, field
+from functools import lru_cache
+from contextlib import asynccontextmanager
 import threading
+from types import MappingProxyType
 
 load_dotenv()
 
-app = FastAPI(title="NovaX AI Platform API", version="2.0.0")
+# Request-path logging; set NOVAX_LOG_LEVEL=DEBUG for the verbose per-request traces
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("novax")
+log_level = (os.getenv("NOVAX_LOG_LEVEL") or "INFO").upper()
+if log_level not in logging.getLevelNamesMapping():
+    logger.warning("Ignoring invalid NOVAX_LOG_LEVEL=%r, using INFO", log_level)
+    log_level = "INFO"
+logger.setLevel(log_level)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize Firebase and the Gemini pool in parallel once the server starts"""
+    set_thread_limit(render_config['max_workers'])
+    await asyncio.gather(
+        run_blocking(init_firebase),
+        run_blocking(init_gemini)
+    )
+    await start_cache_cleanup()
+    yield
+    await drain_background_tasks()
+    await stop_cache_cleanup()
+    await novax_search.close()
+
+app = FastAPI(title="NovaX AI Platform API", version="2.0.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Include pool monitoring routes
 app.include_router(pool_router)
@@ -51,92 +84,132 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Firebase Admin
+# Set by the lifespan handler at startup
 firebase_initialized = False
-try:
-    if not firebase_admin._apps:
-        # Try FIREBASE_SERVICE_ACCOUNT_JSON first (Render), then FIREBASE_SERVICE_ACCOUNT (local)
-        service_account_json = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
-        service_account_path = os.getenv("FIREBASE_SERVICE_ACCOUNT")
-        
-        if service_account_json:
-            # Direct JSON content (Render environment)
-            import json
-            import html
-            # Decode HTML entities from Render environment
-            decoded_json = html.unescape(service_account_json)
-            service_account_info = json.loads(decoded_json)
-            cred = credentials.Certificate(service_account_info)
-        elif service_account_path:
-            # Check if it's a file path or JSON content
-            if service_account_path.startswith('{'):
-                # Direct JSON content
-                import json
-                service_account_info = json.loads(service_account_path)
+use_pool = False
+
+def init_firebase() -> None:
+    """Initialize Firebase Admin"""
+    global firebase_initialized
+    try:
+        if not firebase_admin._apps:
+            # Try FIREBASE_SERVICE_ACCOUNT_JSON first (Render), then FIREBASE_SERVICE_ACCOUNT (local)
+            service_account_json = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
+            service_account_path = os.getenv("FIREBASE_SERVICE_ACCOUNT")
+            
+            if service_account_json:
+                # Direct JSON content (Render environment)
+                # Decode HTML entities from Render environment
+                decoded_json = html.unescape(service_account_json)
+                service_account_info = orjson.loads(decoded_json)
                 cred = credentials.Certificate(service_account_info)
-            else:
-                # File path (local development)
-                if os.path.exists(service_account_path):
-                    cred = credentials.Certificate(service_account_path)
+            elif service_account_path:
+                # Check if it's a file path or JSON content
+                if service_account_path.startswith('{'):
+                    # Direct JSON content
+                    service_account_info = orjson.loads(service_account_path)
+                    cred = credentials.Certificate(service_account_info)
                 else:
-                    raise FileNotFoundError(f"Service account file not found: {service_account_path}")
-        else:
-            print("⚠️ No Firebase service account configured")
-            firebase_initialized = False
-        
-        firebase_admin.initialize_app(cred)
+                    # File path (local development)
+                    if os.path.exists(service_account_path):
+                        cred = credentials.Certificate(service_account_path)
+                    else:
+                        raise FileNotFoundError(f"Service account file not found: {service_account_path}")
+            else:
+                print("⚠️ No Firebase service account configured")
+                print("Running without Firebase authentication")
+                return
+            
+            firebase_admin.initialize_app(cred)
         firebase_initialized = True
         print("✅ Firebase initialized successfully")
-except Exception as e:
-    print(f"Firebase initialization error: {e}")
-    print("Running without Firebase authentication")
-
-# Initialize Gemini API Pool with multiple keys for parallel processing
-api_keys = []
-for i in range(1, 11):  # Load 10 API keys
-    key_name = "GEMINI_API_KEY" if i == 1 else f"GEMINI_API_KEY_{i}"
-    api_key = os.getenv(key_name)
-    if api_key and api_key != "your_gemini_api_key_here":
-        api_keys.append(api_key)
-
-if not api_keys:
-    print("⚠️ No valid Gemini API keys found. Please add keys to .env file")
-    # Fallback to single key for development
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-    use_pool = False
-else:
-    print(f"🚀 Initializing Gemini pool with {len(api_keys)} API keys for parallel processing")
-    initialize_gemini_pool(api_keys)
-    use_pool = True
+    except Exception as e:
+        print(f"Firebase initialization error: {e}")
+        print("Running without Firebase authentication")
+
+# Verified Firebase ID tokens, kept until they expire
+TOKEN_CACHE_SIZE = 10000
+token_cache: Dict[str, tuple] = {}
+
+async def verify_token(token: str) -> dict:
+    """Verify a Firebase ID token off the event loop, reusing earlier verifications"""
+    cached = token_cache.get(token)
+    if cached and cached[1] > time.time():
+        return cached[0]
+    
+    decoded_token = await run_blocking(auth.verify_id_token, token)
+    if token not in token_cache and len(token_cache) >= TOKEN_CACHE_SIZE:
+        token_cache.pop(next(iter(token_cache)))
+    token_cache[token] = (decoded_token, decoded_token.get('exp', 0))
+    return decoded_token
+
+async def resolve_user_id(token: Optional[str]) -> str:
+    """User id for a token, falling back to demo_user when auth is off or the token is invalid"""
+    if not (firebase_initialized and token):
+        return "demo_user"
+    try:
+        decoded_token = await verify_token(token)
+        return decoded_token['uid']
+    except Exception as token_error:
+        logger.warning("Token validation failed: %s", token_error)
+        return "demo_user"
+
+def init_gemini() -> None:
+    """Initialize Gemini API Pool with multiple keys for parallel processing"""
+    global use_pool
+    api_keys = []
+    for i in range(1, 11):  # Load 10 API keys
+        key_name = "GEMINI_API_KEY" if i == 1 else f"GEMINI_API_KEY_{i}"
+        api_key = os.getenv(key_name)
+        if api_key and api_key != "your_gemini_api_key_here":
+            api_keys.append(api_key)
+    
+    if not api_keys:
+        print("⚠️ No valid Gemini API keys found. Please add keys to .env file")
+        # Fallback to single key for development
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        use_pool = False
+    else:
+        print(f"🚀 Initializing Gemini pool with {len(api_keys)} API keys for parallel processing")
+        initialize_gemini_pool(api_keys)
+        use_pool = True
 
 # Enterprise-scale configuration for 2000+ concurrent users
-render_config = {
-    'max_workers': 50,
-    'semaphore_limit': 2000,
-    'batch_size': 25,
-    'timeout': 120
-}
-executor = ThreadPoolExecutor(max_workers=render_config['max_workers'])
-request_semaphore = asyncio.Semaphore(render_config['semaphore_limit'])
-fast_processor = FastParallelProcessor(max_workers=render_config['max_workers'])
+# Gemini calls are I/O-bound, so concurrency is capped by the admission
+# controller; max_workers caps the shared AnyIO threadpool that runs the
+# few blocking SDK calls left (see run_blocking).
+# Tune per deployment with NOVAX_MAX_WORKERS / NOVAX_SEM_LIMIT /
+# NOVAX_BATCH_SIZE / NOVAX_TIMEOUT.
+render_config = load_render_config()
+request_admission = AdmissionController(render_config['semaphore_limit'])
+# Identical prompts arriving together share one Gemini call
+gemini_flight = SingleFlight()
 
 # Real-time information functions
+# Common timezones, looked up once at import
+TIMEZONES = (
+    ('UTC', pytz.utc),
+    ('EST', pytz.timezone('US/Eastern')),
+    ('PST', pytz.timezone('US/Pacific')),
+    ('GMT', pytz.timezone('GMT')),
+    ('IST', pytz.timezone('Asia/Kolkata')),
+    ('JST', pytz.timezone('Asia/Tokyo')),
+    ('CET', pytz.timezone('Europe/Berlin'))
+)
+
+# Date/time info and rendered prompt blocks for the current second, shared by every request in it
+datetime_info_cache = (0, {})
+datetime_block_cache: Dict[bool, tuple] = {}
+
 def get_current_datetime_info() -> dict:
-    """Get comprehensive current date and time information"""
-    now_utc = datetime.now(timezone.utc)
-    
-    # Common timezones
-    timezones = {
-        'UTC': now_utc,
-        'EST': now_utc.astimezone(pytz.timezone('US/Eastern')),
-        'PST': now_utc.astimezone(pytz.timezone('US/Pacific')),
-        'GMT': now_utc.astimezone(pytz.timezone('GMT')),
-        'IST': now_utc.astimezone(pytz.timezone('Asia/Kolkata')),
-        'JST': now_utc.astimezone(pytz.timezone('Asia/Tokyo')),
-        'CET': now_utc.astimezone(pytz.timezone('Europe/Berlin'))
-    }
-    
-    return {
+    """Get comprehensive current date and time information (computed once per second; read-only)"""
+    global datetime_info_cache
+    second = int(time.time())
+    if datetime_info_cache[0] == second:
+        return datetime_info_cache[1]
+    
+    now_utc = datetime.fromtimestamp(second, timezone.utc)
+    info = {
         'current_utc': now_utc.strftime('%Y-%m-%d %H:%M:%S UTC'),
         'current_date': now_utc.strftime('%A, %B %d, %Y'),
         'current_time_utc': now_utc.strftime('%H:%M:%S UTC'),
@@ -144,8 +217,140 @@ def get_current_datetime_info() -> dict:
         'month': now_utc.strftime('%B'),
         'year': now_utc.year,
         'unix_timestamp': int(now_utc.timestamp()),
-        'timezones': {tz: time.strftime('%Y-%m-%d %H:%M:%S %Z') for tz, time in timezones.items()}
+        'timezones': {label: now_utc.astimezone(tz).strftime('%Y-%m-%d %H:%M:%S %Z') for label, tz in TIMEZONES}
     }
+    datetime_info_cache = (second, info)
+    return info
+
+# Prompt blocks carrying the real date/time
+DATETIME_INFO_TEMPLATE = (
+    "\n\nCurrent Real-time Information:\n"
+    "📅 Date: {current_date}\n"
+    "🕐 UTC Time: {current_time_utc}\n"
+    "🌍 Timezones:\n"
+)
+DATETIME_MANDATORY_TEMPLATE = (
+    "\n\n=== MANDATORY REAL-TIME INFORMATION ===\n"
+    "📅 TODAY'S ACTUAL DATE: {current_date}\n"
+    "🕐 CURRENT ACTUAL UTC TIME: {current_time_utc}\n"
+    "📆 CURRENT ACTUAL YEAR: {year}\n"
+    "📅 DAY OF WEEK: {day_of_week}\n"
+    "📅 MONTH: {month}\n"
+    "\n🚨 CRITICAL INSTRUCTION: You MUST use ONLY the above real date/time information. Do NOT generate any other dates. The user is asking for the ACTUAL current date/time, so respond with the EXACT information provided above.\n"
+    "=== END MANDATORY INFORMATION ===\n"
+)
+
+def build_datetime_block(datetime_info: dict, mandatory: bool = False) -> str:
+    """Date/time prompt block: informational (with timezones) or the mandatory-answer variant"""
+    cached = datetime_block_cache.get(mandatory)
+    if cached and cached[0] == datetime_info['unix_timestamp']:
+        return cached[1]
+    
+    if mandatory:
+        block = DATETIME_MANDATORY_TEMPLATE.format_map(datetime_info)
+    else:
+        block = DATETIME_INFO_TEMPLATE.format_map(datetime_info) + "".join(
+            f"   {tz}: {time_str}\n" for tz, time_str in datetime_info['timezones'].items()
+        )
+    datetime_block_cache[mandatory] = (datetime_info['unix_timestamp'], block)
+    return block
+
+# Response-format instructions placed between the context and the user message
+TIME_QUERY_INSTRUCTIONS = """IMPORTANT: User is asking for current date/time. You MUST respond with this EXACT information:
+TODAY'S DATE: {current_date}
+CURRENT TIME: {current_time_utc}
+YEAR: {year}
+
+Do NOT generate any other dates. Use ONLY the above real information.
+
+For simple queries, respond in NovaX style:
+- Start with a friendly emoji intro (⚡, 🚀, or 💫)
+- Give the EXACT date/time from above
+- Keep it warm and professional"""
+
+SIMPLE_INSTRUCTIONS = """For simple queries, respond in NovaX style:
+- Start with a friendly emoji intro (⚡, 🚀, or 💫)
+- Give a direct, clear answer (1-2 sentences)
+- Keep it warm and professional"""
+
+BASIC_INSTRUCTIONS = """Respond in clean NovaX style:
+- Start with friendly emoji intro (⚡ or 🚀)
+- Give clear, helpful answer
+- Use proper formatting
+- Keep it professional but warm"""
+
+CHAT_INSTRUCTIONS = MappingProxyType({
+    'simple': SIMPLE_INSTRUCTIONS,
+    'high': """Use the full NovaX structured format:
+1. Start with emoji intro line (⚡ or 🚀)
+2. Use structured sections with emojis:
+   - 🧠 Explanation
+   - 📌 Steps (if applicable)
+   - 🔧 Code (if applicable)
+   - 📊 Examples
+   - ⚠️ Notes
+   - 🎯 Summary
+3. Keep paragraphs short (2-3 lines max)
+4. Use **bold** for key points, *italics* for emphasis
+5. Use ✅ for allowed/good things, ❌ for not allowed/bad things
+6. Use numbered emojis (1️⃣ 2️⃣ 3️⃣) for sequences
+7. Use bullet points with emojis for features
+8. End with helpful offer""",
+    'medium': """Use NovaX structured format:
+1. Start with emoji intro line (⚡ or 🚀)
+2. Organize with clear sections and emojis
+3. Use ✅ for good/allowed, ❌ for bad/not allowed
+4. Keep paragraphs short (2-3 lines max)
+5. Use **bold** for key points
+6. Provide clear explanation with brief reasoning
+7. End with helpful suggestion"""
+})
+
+DEEP_THINKING_INSTRUCTIONS = """Use the full NovaX structured format with perfect formatting:
+1. Start with a NovaX intro line with emoji (🧠 Analyzing... or 🚀 Let's solve...)
+2. Use structured sections with emojis (🧠 Explanation, 📌 Steps, 🔧 Code, etc.)
+3. Keep paragraphs short (2-3 lines max)
+4. Use **bold** for key points, *italics* for emphasis
+5. Use ✅ for allowed/good things, ❌ for not allowed/bad things
+6. Use numbered emojis (1️⃣ 2️⃣) for step sequences
+7. Use bullet points with emojis for lists
+8. End with a helpful offer"""
+
+THINKING_INSTRUCTIONS = """Use NovaX structured format:
+1. Start with an emoji intro line (⚡ or 🚀)
+2. Organize with clear sections and emojis
+3. Use ✅ for good/allowed, ❌ for bad/not allowed
+4. Keep paragraphs short (2-3 lines max)
+5. Use **bold** for key points
+6. Keep it readable and well-formatted
+7. End with a helpful suggestion"""
+
+STREAM_STANDARD_INSTRUCTIONS = """Use NovaX structured format:
+- Start with emoji intro line (⚡ or 🚀)
+- Organize with clear sections and emojis
+- Keep it readable and well-formatted
+- End with helpful suggestion"""
+
+# Steps shown to the client while a complex answer is prepared
+THINKING_STEPS = (
+    "🧠 Analyzing your request…",
+    "🔍 Identifying the best solution…",
+    "📊 Evaluating different approaches…",
+    "⚙️ Considering best practices…",
+    "🚀 Formulating comprehensive response…"
+)
+
+def assemble_prompt(personalized_prompt: str, context_str: str, context_instruction: str, instructions: str, message: str) -> str:
+    """Full model prompt: persona, context, format instructions and the user message,
+    leaving out empty sections so no blank padding is sent upstream"""
+    segments = [personalized_prompt]
+    if context_str:
+        segments.append(context_str)
+    if context_instruction:
+        segments.append(context_instruction.strip())
+    segments.append(instructions)
+    segments.append(f"User: {message}\n\nNovaX AI:")
+    return "\n\n".join(segments)
 
 # NovaX AI Enhanced Personality System
 # NovaX Nano - Image Prompt Enhancement Layer
@@ -168,10 +373,10 @@ async def enhance_image_prompt(user_prompt: str) -> str:
     """Enhance image prompt using NovaX Nano (Gemini 2.5 Flash)"""
     try:
         full_prompt = f"{NOVAX_NANO_PROMPT}\n\nUser request: {user_prompt}\n\nEnhanced prompt:"
-        response = nano_model.generate_content(full_prompt)
+        response = await nano_model.generate_content_async(full_prompt)
         return response.text.strip()
     except Exception as e:
-        print(f"Nano enhancement error: {e}")
+        logger.error("Nano enhancement error: %s", e)
         return user_prompt  # Fallback to original
 
 NOVAX_SYSTEM_PROMPT = """
@@ -391,194 +596,368 @@ You are NovaX AI from NovaX Technologies. This is your permanent persona. Follow
 model = genai.GenerativeModel('gemini-2.5-flash')
 
 # Brand Safety Filter
-def filter_brand_unsafe_content(response_text: str) -> str:
-    """Filter out any mentions of underlying models or providers and fix HTML entities"""
-    import html
-    
-    # First decode HTML entities
-    filtered_text = html.unescape(response_text)
-    
-    forbidden_terms = [
-        'google', 'gemini', 'openai', 'gpt', 'chatgpt', 'meta', 'anthropic', 
-        'llama', 'claude', 'api key', 'model version', 'training data',
-        'language model', 'ai model', 'based on', 'powered by'
-    ]
+FORBIDDEN_TERMS = (
+    'google', 'gemini', 'openai', 'gpt', 'chatgpt', 'meta', 'anthropic', 
+    'llama', 'claude', 'api key', 'model version', 'training data',
+    'language model', 'ai model', 'based on', 'powered by'
+)
+
+# Identity signatures and agent prefixes
+IDENTITY_PATTERN = re.compile(
+    r'NovaX AI — from NovaX Technologies\.?\s*|As your NovaX [A-Za-z]+,?\s*',
+    re.IGNORECASE
+)
+
+def forbidden_pattern(terms, flags: int = 0) -> re.Pattern:
+    """Whole-word alternation over forbidden terms, longest first"""
+    return re.compile(r'\b(' + '|'.join(map(re.escape, sorted(terms, key=len, reverse=True))) + r')\b', flags)
+
+# Provider and model names in any case; multi-word phrases only in lowercase, so
+# sentence openers like "Based on" and "Powered by" are left alone
+FORBIDDEN_PATTERN = forbidden_pattern([t for t in FORBIDDEN_TERMS if ' ' not in t], re.IGNORECASE)
+FORBIDDEN_PHRASE_PATTERN = forbidden_pattern([t for t in FORBIDDEN_TERMS if ' ' in t])
+
+# Bare URLs; ones already used as a markdown link target are left alone
+URL_PATTERN = re.compile(r'(?<!\]\()https?://([^/\s]+)[^\s]*')
+
+def markdown_link(match: re.Match) -> str:
+    """Markdown link for a bare URL, labelled with its domain"""
+    return f"[{match.group(1).replace('www.', '')}]({match.group(0)})"
+
+def linkify_urls(text: str) -> str:
+    """Turn every bare URL into a clickable markdown link in one pass"""
+    return URL_PATTERN.sub(markdown_link, text)
+
+def forbidden_replacement(term: str) -> str:
+    """Branding that replaces a forbidden term"""
+    if 'model' in term:
+        return 'NovaX AI system'
+    if term in ('google', 'openai', 'meta', 'anthropic'):
+        return 'NovaX Technologies'
+    return 'NovaX AI'
+
+FORBIDDEN_REPLACEMENTS = {term: forbidden_replacement(term) for term in FORBIDDEN_TERMS}
+
+# Tail kept back while streaming; longer than any forbidden term or signature
+STREAM_FILTER_HOLDBACK = 64
+
+def filter_brand_terms(response_text: str) -> str:
+    """Decode HTML entities and replace identity/provider mentions, keeping whitespace"""
+    # First decode HTML entities; most chunks carry none
+    filtered_text = html.unescape(response_text) if '&' in response_text else response_text
     
     # Remove identity signatures and agent prefixes
-    filtered_text = re.sub(r'NovaX AI — from NovaX Technologies\.?\s*', '', filtered_text, flags=re.IGNORECASE)
-    filtered_text = re.sub(r'As your NovaX [A-Za-z]+,?\s*', '', filtered_text, flags=re.IGNORECASE)
+    filtered_text = IDENTITY_PATTERN.sub('', filtered_text)
     
     # Replace forbidden terms with NovaX AI branding
-    for term in forbidden_terms:
-        if term.lower() in filtered_text.lower():
-            if 'model' in term.lower():
-                filtered_text = filtered_text.replace(term, 'NovaX AI system')
-            elif any(provider in term.lower() for provider in ['google', 'openai', 'meta', 'anthropic']):
-                filtered_text = filtered_text.replace(term, 'NovaX Technologies')
-            else:
-                filtered_text = filtered_text.replace(term, 'NovaX AI')
+    filtered_text = FORBIDDEN_PATTERN.sub(
+        lambda match: FORBIDDEN_REPLACEMENTS[match.group(1).lower()], filtered_text
+    )
+    filtered_text = FORBIDDEN_PHRASE_PATTERN.sub(
+        lambda match: FORBIDDEN_REPLACEMENTS[match.group(1)], filtered_text
+    )
     
-    return filtered_text.strip()
+    return filtered_text
+
+def filter_brand_unsafe_content(response_text: str) -> str:
+    """Filter out any mentions of underlying models or providers and fix HTML entities"""
+    return filter_brand_terms(response_text).strip()
+
+class BrandSafeStream:
+    """Brand filter for streamed text that holds back a short tail so terms
+    split across upstream chunks are still caught"""
+    
+    def __init__(self):
+        self.pending = ""
+    
+    def feed(self, text: str) -> str:
+        """Add a raw chunk and return the filtered text that is safe to send"""
+        self.pending += text
+        cut = len(self.pending) - STREAM_FILTER_HOLDBACK
+        if cut <= 0:
+            return ""
+        
+        # Cut after whitespace so words and HTML entities are never split;
+        # only a very long unbroken run (e.g. a URL) is cut mid-token
+        space = max(self.pending.rfind(' ', 0, cut), self.pending.rfind('\n', 0, cut))
+        if space >= 0:
+            cut = space + 1
+        elif cut < STREAM_FILTER_HOLDBACK * 4:
+            return ""
+        
+        # Move the cut before any multi-word match that straddles it; the
+        # buffer is scanned once and the (usually empty) spans reused
+        spans = [match.span() for pattern in (IDENTITY_PATTERN, FORBIDDEN_PATTERN, FORBIDDEN_PHRASE_PATTERN)
+                 for match in pattern.finditer(self.pending)]
+        moved = bool(spans)
+        while moved and cut > 0:
+            moved = False
+            for start, end in spans:
+                if start < cut < end:
+                    cut = start
+                    moved = True
+        if cut <= 0:
+            return ""
+        
+        ready, self.pending = self.pending[:cut], self.pending[cut:]
+        return filter_brand_terms(ready)
+    
+    def flush(self) -> str:
+        """Return whatever is left once the upstream stream ends"""
+        ready, self.pending = self.pending, ""
+        return filter_brand_terms(ready)
 
 # Agent Role Detection with Real-time Keywords
-def is_time_date_query(message: str) -> bool:
+# Keyword tables are built once at import instead of on every request
+TIME_SINGLE_WORD_QUERIES = frozenset(['time', 'date', 'today', 'now'])
+
+TIME_DATE_PATTERNS = (
+    'what time is it', 'current time', 'what\'s the time', 'time now', 'time right now',
+    'what date is it', 'current date', 'what\'s the date', 'today\'s date', 'date today', 'todays date',
+    'what is today date', 'what is todays date', 'what is the date today', 'what is this date',
+    'what day is it', 'what\'s today', 'today is', 'current day',
+    'what year is it', 'current year', 'what month', 'current month', 'what minute',
+    'what hour', 'current hour', 'current minute', 'time zone', 'timezone'
+)
+
+TIME_WORDS = frozenset(['time', 'date', 'day', 'year', 'month', 'hour', 'minute', 'second'])
+TIME_QUESTION_WORDS = frozenset(['what', 'current', 'now', 'today', 'todays'])
+
+IMAGE_KEYWORDS = (
+    'generate image', 'create image', 'make image', 'draw image',
+    'generate picture', 'create picture', 'make picture', 'draw picture',
+    'generate photo', 'create photo', 'make photo',
+    'image of', 'picture of', 'photo of',
+    'show me image', 'show me picture',
+    'visualize', 'illustrate', 'generate'
+)
+
+CEO_KEYWORDS = (
+    'ceo', 'founder', 'created you', 'made you', 'who created', 'who made',
+    'rishav', 'rishav jha', 'creator', 'novacloud', 'nova cloud'
+)
+
+# Enhanced web search detection
+SEARCH_KEYWORDS = (
+    'search for', 'search about', 'find information', 'lookup', 'look up',
+    'latest news', 'breaking news', 'current news', 'recent news', 'news about',
+    'what\'s happening', 'happening today', 'live news', 'trending',
+    'weather in', 'weather for', 'temperature in',
+    'stock price', 'share price', 'market price', 'crypto price',
+    'latest update', 'recent update', 'current status',
+    'find out about', 'tell me about current', 'what\'s new',
+    'real-time', 'live data', 'current information'
+)
+
+# Web search trigger patterns
+SEARCH_PATTERNS = (
+    'search', 'find', 'lookup', 'latest', 'current', 'recent', 'breaking',
+    'news', 'weather', 'stock', 'price', 'trending', 'happening', 'update'
+)
+
+# Personal questions that should NOT trigger web search
+PERSONAL_KEYWORDS = ('what is my', 'my name', 'who am i', 'tell me about me', 'remember', 'my previous')
+
+DEVELOPER_KEYWORDS = ('code', 'debug', 'program', 'function', 'api', 'database')
+WRITER_KEYWORDS = ('write', 'email', 'blog', 'content', 'seo', 'summary')
+ANALYST_KEYWORDS = ('analyze', 'data', 'calculate', 'pattern', 'logic')
+CREATOR_KEYWORDS = ('create', 'design', 'idea', 'ux', 'ui')
+TUTOR_KEYWORDS = ('teach', 'explain', 'learn', 'tutorial', 'how')
+
+def compile_keywords(keywords) -> re.Pattern:
+    """Compile a keyword table into one alternation with plain substring semantics"""
+    return re.compile('|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)))
+
+def compile_keyword_counter(keywords) -> re.Pattern:
+    """Like compile_keywords, but matches at every position so distinct hits can be counted"""
+    return re.compile('(?=(' + compile_keywords(keywords).pattern + '))')
+
+# Keyword categories as bit flags, all scanned by one helper
+KW_CEO = 1 << 0
+KW_IMAGE = 1 << 1
+KW_PERSONAL = 1 << 2
+KW_SEARCH = 1 << 3
+KW_SEARCH_PATTERN = 1 << 4
+KW_DEVELOPER = 1 << 5
+KW_WRITER = 1 << 6
+KW_ANALYST = 1 << 7
+KW_CREATOR = 1 << 8
+KW_TUTOR = 1 << 9
+
+CEO_PATTERN = compile_keywords(CEO_KEYWORDS)
+IMAGE_PATTERN = compile_keywords(IMAGE_KEYWORDS)
+TIME_DATE_PATTERN = compile_keywords(TIME_DATE_PATTERNS)
+
+INTENT_KEYWORD_PATTERNS = (
+    (KW_CEO, CEO_PATTERN),
+    (KW_IMAGE, IMAGE_PATTERN),
+    (KW_PERSONAL, compile_keywords(PERSONAL_KEYWORDS)),
+    (KW_SEARCH, compile_keywords(SEARCH_KEYWORDS)),
+    (KW_SEARCH_PATTERN, compile_keywords(SEARCH_PATTERNS)),
+    (KW_DEVELOPER, compile_keywords(DEVELOPER_KEYWORDS)),
+    (KW_WRITER, compile_keywords(WRITER_KEYWORDS)),
+    (KW_ANALYST, compile_keywords(ANALYST_KEYWORDS)),
+    (KW_CREATOR, compile_keywords(CREATOR_KEYWORDS)),
+    (KW_TUTOR, compile_keywords(TUTOR_KEYWORDS))
+)
+
+def scan_intent_keywords(message_lower: str) -> int:
+    """Return a bitmask of the keyword categories present in the message"""
+    flags = 0
+    for flag, pattern in INTENT_KEYWORD_PATTERNS:
+        if pattern.search(message_lower):
+            flags |= flag
+    return flags
+
+# Agent names, interned so every agent_type handed around is one shared object
+AGENT_TYPES = tuple(sys.intern(agent) for agent in (
+    'NovaX Assistant', 'NovaX Explorer', 'NovaX Developer', 'NovaX Writer',
+    'NovaX Analyst', 'NovaX Creator', 'NovaX Tutor'
+))
+
+# Agent priority, highest first (time/date queries are checked after image)
+INTENT_PRIORITY = (
+    (KW_CEO, 'NovaX Assistant'),
+    (KW_IMAGE, 'NovaX Creator'),
+    (KW_PERSONAL, 'NovaX Assistant'),  # Don't use Explorer for personal questions
+    (KW_SEARCH, 'NovaX Explorer'),
+    (KW_SEARCH_PATTERN, 'NovaX Explorer'),
+    (KW_DEVELOPER, 'NovaX Developer'),
+    (KW_WRITER, 'NovaX Writer'),
+    (KW_ANALYST, 'NovaX Analyst'),
+    (KW_CREATOR, 'NovaX Creator'),
+    (KW_TUTOR, 'NovaX Tutor')
+)
+
+def resolve_intent(flags: int) -> str:
+    """Pick the highest-priority agent for a keyword bitmask"""
+    for flag, agent in INTENT_PRIORITY:
+        if flags & flag:
+            return agent
+    return 'NovaX Assistant'
+
+# Every flag combination resolved once at import
+INTENT_BY_FLAGS = tuple(sys.intern(resolve_intent(flags)) for flags in range(1 << len(INTENT_KEYWORD_PATTERNS)))
+
+@dataclass(frozen=True, slots=True)
+class NormalizedMessage:
+    """A message lowercased and split once, shared by all query helpers"""
+    raw: str
+    lower: str = field(compare=False)  # Lowercased and stripped
+    words: tuple = field(compare=False)
+    word_count: int = field(compare=False)
+
+@lru_cache(maxsize=4096)
+def normalize_message(message: str) -> NormalizedMessage:
+    """Build the canonical form of a message"""
+    lower = message.lower().strip()
+    words = tuple(lower.split())
+    return NormalizedMessage(message, lower, words, len(words))
+
+def as_normalized(message: Union[str, NormalizedMessage]) -> NormalizedMessage:
+    """Accept either a raw message or an already normalized one"""
+    if isinstance(message, NormalizedMessage):
+        return message
+    return normalize_message(message)
+
+@lru_cache(maxsize=4096)
+def is_time_date_query(message: Union[str, NormalizedMessage]) -> bool:
     """Check if the message is asking for current time or date"""
-    message_lower = message.lower().strip()
+    nm = as_normalized(message)
+    message_lower = nm.lower
     
     # PRIORITY: Single word time/date queries (most common issue)
-    single_word_queries = ['time', 'date', 'today', 'now']
-    if message_lower in single_word_queries:
-        print(f"DEBUG: Single word query detected: {message_lower}")
+    if message_lower in TIME_SINGLE_WORD_QUERIES:
+        logger.debug("Single word query detected: %s", message_lower)
         return True
     
-    # Direct time/date queries
-    time_date_patterns = [
-        'what time is it', 'current time', 'what\'s the time', 'time now', 'time right now',
-        'what date is it', 'current date', 'what\'s the date', 'today\'s date', 'date today', 'todays date',
-        'what is today date', 'what is todays date', 'what is the date today', 'what is this date',
-        'what day is it', 'what\'s today', 'today is', 'current day',
-        'what year is it', 'current year', 'what month', 'current month', 'what minute',
-        'what hour', 'current hour', 'current minute', 'time zone', 'timezone'
-    ]
-    
     # Check for exact patterns
-    if any(pattern in message_lower for pattern in time_date_patterns):
-        print(f"DEBUG: Pattern query detected: {message_lower}")
+    if TIME_DATE_PATTERN.search(message_lower):
+        logger.debug("Pattern query detected: %s", message_lower)
         return True
     
     # Check for simple time/date words with question structure
-    simple_time_words = ['time', 'date', 'day', 'year', 'month', 'hour', 'minute', 'second']
-    question_words = ['what', 'current', 'now', 'today', 'todays']
-    
-    words = message_lower.split()
-    if len(words) <= 8:  # Extended for more time queries
-        has_time_word = any(word in words for word in simple_time_words)
-        has_question_word = any(word in words for word in question_words)
+    words = nm.words
+    if nm.word_count <= 8:  # Extended for more time queries
+        has_time_word = not TIME_WORDS.isdisjoint(words)
+        has_question_word = not TIME_QUESTION_WORDS.isdisjoint(words)
         if has_time_word and has_question_word:
-            print(f"DEBUG: Combined query detected: {message_lower}")
+            logger.debug("Combined query detected: %s", message_lower)
             return True
     
-    print(f"DEBUG: No time/date query detected: {message_lower}")
+    logger.debug("No time/date query detected: %s", message_lower)
     return False
 
-def is_image_generation_query(message: str) -> bool:
+@lru_cache(maxsize=4096)
+def is_image_generation_query(message: Union[str, NormalizedMessage]) -> bool:
     """Check if the message is requesting image generation"""
-    message_lower = message.lower().strip()
-    
-    image_keywords = [
-        'generate image', 'create image', 'make image', 'draw image',
-        'generate picture', 'create picture', 'make picture', 'draw picture',
-        'generate photo', 'create photo', 'make photo',
-        'image of', 'picture of', 'photo of',
-        'show me image', 'show me picture',
-        'visualize', 'illustrate', 'generate'
-    ]
-    
-    return any(keyword in message_lower for keyword in image_keywords)
+    return IMAGE_PATTERN.search(as_normalized(message).lower) is not None
 
-def is_ceo_founder_query(message: str) -> bool:
+@lru_cache(maxsize=4096)
+def is_ceo_founder_query(message: Union[str, NormalizedMessage]) -> bool:
     """Check if user is asking about CEO or founder"""
-    message_lower = message.lower()
-    ceo_keywords = ['ceo', 'founder', 'created you', 'made you', 'who created', 'who made', 'rishav', 'rishav jha', 'creator', 'novacloud', 'nova cloud']
-    return any(keyword in message_lower for keyword in ceo_keywords)
+    return CEO_PATTERN.search(as_normalized(message).lower) is not None
 
-def detect_user_intent(message: str) -> str:
+@lru_cache(maxsize=4096)
+def detect_user_intent(message: Union[str, NormalizedMessage]) -> str:
     """Detect what type of NovaX AI agent should respond"""
-    message_lower = message.lower()
-    
-    # Check for CEO/founder queries first
-    if is_ceo_founder_query(message):
-        return 'NovaX Assistant'
-    
-    # Check for image generation first
-    if is_image_generation_query(message):
-        return 'NovaX Creator'
-    
-    # Check for time/date queries first (these should NOT use web search)
-    if is_time_date_query(message):
-        return 'NovaX Assistant'  # Use Assistant for direct time/date, not Explorer
-    
-    # Enhanced web search detection
-    search_keywords = [
-        'search for', 'search about', 'find information', 'lookup', 'look up',
-        'latest news', 'breaking news', 'current news', 'recent news', 'news about',
-        'what\'s happening', 'happening today', 'live news', 'trending',
-        'weather in', 'weather for', 'temperature in',
-        'stock price', 'share price', 'market price', 'crypto price',
-        'latest update', 'recent update', 'current status',
-        'find out about', 'tell me about current', 'what\'s new',
-        'real-time', 'live data', 'current information'
-    ]
-    
-    # Web search trigger patterns
-    search_patterns = [
-        'search', 'find', 'lookup', 'latest', 'current', 'recent', 'breaking',
-        'news', 'weather', 'stock', 'price', 'trending', 'happening', 'update'
-    ]
-    
-    # Personal questions that should NOT trigger web search
-    personal_keywords = ['what is my', 'my name', 'who am i', 'tell me about me', 'remember', 'my previous']
-    
-    # Don't use Explorer for personal questions
-    if any(personal in message_lower for personal in personal_keywords):
-        return 'NovaX Assistant'
-    elif any(keyword in message_lower for keyword in search_keywords):
-        return 'NovaX Explorer'
-    elif any(pattern in message_lower for pattern in search_patterns) and len(message.split()) > 2:
-        return 'NovaX Explorer'
-    elif any(word in message_lower for word in ['code', 'debug', 'program', 'function', 'api', 'database']):
-        return 'NovaX Developer'
-    elif any(word in message_lower for word in ['write', 'email', 'blog', 'content', 'seo', 'summary']):
-        return 'NovaX Writer'
-    elif any(word in message_lower for word in ['analyze', 'data', 'calculate', 'pattern', 'logic']):
-        return 'NovaX Analyst'
-    elif any(word in message_lower for word in ['create', 'design', 'idea', 'ux', 'ui']):
-        return 'NovaX Creator'
-    elif any(word in message_lower for word in ['teach', 'explain', 'learn', 'tutorial', 'how']):
-        return 'NovaX Tutor'
-    else:
-        return 'NovaX Assistant'
-
-def analyze_topic_relevance(current_message: str, chat_history: list) -> dict:
+    return classify_message(message).agent_type
+
+# Topic relevance word tables
+TOPIC_STOPWORDS = frozenset([
+    'what', 'how', 'when', 'where', 'why', 'this', 'that', 'with', 'from', 'they', 'have', 'been',
+    'were', 'said', 'each', 'which', 'their', 'time', 'will', 'about', 'would', 'there', 'could', 'other'
+])
+CONTINUITY_PATTERN = compile_keywords(['also', 'additionally', 'furthermore', 'moreover', 'besides', 'continue', 'next', 'then', 'after', 'following', 'where we left', 'where you left', 'from before', 'last time'])
+CONTINUATION_PATTERN = compile_keywords(['continue', 'continue where', 'where we left', 'where you left', 'from before', 'last time', 'previous', 'earlier'])
+REFERENCE_PATTERN = compile_keywords(['it', 'this', 'that', 'these', 'those', 'above', 'previous', 'earlier', 'before'])
+TOPIC_CHANGE_PATTERN = compile_keywords(['now', 'instead', 'different', 'new', 'another', 'switch', 'change', 'moving on', 'by the way', 'btw'])
+SHORT_REPLY_PATTERN = compile_keywords(['yes', 'no', 'ok', 'sure', 'thanks', 'continue'])
+ACK_WORDS = frozenset(['yes', 'no', 'ok', 'okay', 'sure', 'thanks', 'continue'])
+
+@lru_cache(maxsize=4096)
+def topic_keywords(text: Union[str, NormalizedMessage]) -> tuple:
+    """Content words (longer than 3 chars, not stopwords) of a message, in order"""
+    return tuple(w for w in as_normalized(text).words if len(w) > 3 and w not in TOPIC_STOPWORDS)
+
+def analyze_topic_relevance(current_message: Union[str, NormalizedMessage], chat_history: list) -> dict:
     """Analyze if current message is related to previous chat context"""
     if not chat_history or len(chat_history) == 0:
         return {'is_related': False, 'context_needed': False, 'reason': 'no_history'}
     
-    current_lower = current_message.lower().strip()
+    nm = as_normalized(current_message)
+    current_lower = nm.lower
+    
+    # Short acknowledgements ("yes", "ok thanks") always continue the current
+    # topic unless they announce a change, so skip the history walk
+    if (0 < nm.word_count <= 3 and nm.words[0].rstrip('!.,?') in ACK_WORDS
+            and TOPIC_CHANGE_PATTERN.search(current_lower) is None):
+        return {'is_related': True, 'context_needed': True, 'reason': 'short_response', 'overlap_ratio': 1.0, 'keyword_overlap': 0}
     
     # Get last few messages for context analysis
     recent_messages = chat_history[-3:] if len(chat_history) >= 3 else chat_history
     
-    # Extract keywords from recent conversation
+    # Extract keywords from recent conversation (top 5 words per message);
+    # history messages repeat every turn, so their tokens are cached
     conversation_keywords = set()
     for msg in recent_messages:
         if 'message' in msg:
-            words = msg['message'].lower().split()
-            # Filter out common words
-            filtered_words = [w for w in words if len(w) > 3 and w not in 
-                            ['what', 'how', 'when', 'where', 'why', 'this', 'that', 'with', 'from', 'they', 'have', 'been', 'were', 'said', 'each', 'which', 'their', 'time', 'will', 'about', 'would', 'there', 'could', 'other']]
-            conversation_keywords.update(filtered_words[:5])  # Take top 5 words per message
+            conversation_keywords.update(topic_keywords(msg['message'])[:5])
     
     # Extract keywords from current message
-    current_words = current_lower.split()
-    current_keywords = [w for w in current_words if len(w) > 3 and w not in 
-                       ['what', 'how', 'when', 'where', 'why', 'this', 'that', 'with', 'from', 'they', 'have', 'been', 'were', 'said', 'each', 'which', 'their', 'time', 'will', 'about', 'would', 'there', 'could', 'other']]
+    current_keywords = topic_keywords(nm)
     
     # Check for topic continuity indicators
-    continuity_words = ['also', 'additionally', 'furthermore', 'moreover', 'besides', 'continue', 'next', 'then', 'after', 'following', 'where we left', 'where you left', 'from before', 'last time']
-    has_continuity = any(word in current_lower for word in continuity_words)
+    has_continuity = CONTINUITY_PATTERN.search(current_lower) is not None
     
     # Check for explicit continuation requests
-    continuation_phrases = ['continue', 'continue where', 'where we left', 'where you left', 'from before', 'last time', 'previous', 'earlier']
-    has_explicit_continuation = any(phrase in current_lower for phrase in continuation_phrases)
+    has_explicit_continuation = CONTINUATION_PATTERN.search(current_lower) is not None
     
     # Check for reference words
-    reference_words = ['it', 'this', 'that', 'these', 'those', 'above', 'previous', 'earlier', 'before']
-    has_reference = any(word in current_lower for word in reference_words)
+    has_reference = REFERENCE_PATTERN.search(current_lower) is not None
     
     # Check for topic change indicators
-    topic_change_words = ['now', 'instead', 'different', 'new', 'another', 'switch', 'change', 'moving on', 'by the way', 'btw']
-    has_topic_change = any(phrase in current_lower for phrase in topic_change_words)
+    has_topic_change = TOPIC_CHANGE_PATTERN.search(current_lower) is not None
     
     # Calculate keyword overlap
     keyword_overlap = len(set(current_keywords) & conversation_keywords)
@@ -600,7 +979,7 @@ def analyze_topic_relevance(current_message: str, chat_history: list) -> dict:
     elif overlap_ratio >= 0.3:  # 30% keyword overlap
         is_related = True
         reason = 'keyword_overlap'
-    elif len(current_message.split()) <= 5 and any(word in current_lower for word in ['yes', 'no', 'ok', 'sure', 'thanks', 'continue']):
+    elif nm.word_count <= 5 and SHORT_REPLY_PATTERN.search(current_lower):
         is_related = True
         reason = 'short_response'
     else:
@@ -615,74 +994,84 @@ def analyze_topic_relevance(current_message: str, chat_history: list) -> dict:
         'keyword_overlap': keyword_overlap
     }
 
-def analyze_query_complexity(message: str) -> dict:
+# Query complexity keyword tables
+SIMPLE_GREETING_PATTERN = compile_keywords(['hi', 'hello', 'hey', 'thanks', 'thank you', 'ok', 'okay', 'yes', 'no'])
+
+# Simple factual questions (who, what, when, where + is/are/was/were)
+SIMPLE_FACT_PATTERN = compile_keywords([
+    'who is', 'who was', 'who are', 'what is', 'what was', 'what are',
+    'when is', 'when was', 'when did', 'where is', 'where was',
+    'what time', 'current time', 'today\'s date', 'current date'
+])
+
+# Medium complexity indicators (explanatory questions)
+MEDIUM_INDICATOR_COUNTER = compile_keyword_counter([
+    'how do', 'how to', 'what are', 'benefits of', 'advantages of', 'compare', 'difference between',
+    'explain', 'learn', 'understand', 'tutorial', 'guide', 'steps to', 'create', 'build', 'make'
+])
+
+# High complexity indicators (analysis, strategy, design)
+HIGH_INDICATOR_COUNTER = compile_keyword_counter([
+    'analyze', 'evaluate', 'design', 'implement', 'optimize', 'strategy', 'approach',
+    'pros and cons', 'trade-offs', 'considerations', 'factors', 'implications',
+    'architecture', 'scalable', 'best practice', 'framework', 'comprehensive'
+])
+
+# Technical/analytical keywords
+TECHNICAL_KEYWORD_COUNTER = compile_keyword_counter([
+    'algorithm', 'database', 'performance', 'security', 'api',
+    'deployment', 'scaling', 'optimization', 'debugging', 'testing',
+    'microservices', 'system', 'infrastructure', 'code', 'programming'
+])
+
+# Decision-making keywords
+DECISION_KEYWORD_COUNTER = compile_keyword_counter([
+    'should', 'choose', 'decide', 'select', 'recommend', 'suggest', 'advice',
+    'opinion', 'thoughts', 'perspective', 'consideration', 'help me'
+])
+
+class QueryComplexity(NamedTuple):
+    """Immutable (cacheable) form of the analyze_query_complexity result"""
+    complexity: str
+    format: str
+    needs_thinking: bool
+    reasoning_depth: str
+    response_style: str
+
+SIMPLE_GREETING_RESULT = QueryComplexity('simple', 'greeting', False, 'minimal', 'direct_friendly')
+SIMPLE_FACT_RESULT = QueryComplexity('simple', 'factual', False, 'minimal', 'direct_answer')
+HIGH_COMPLEXITY_RESULT = QueryComplexity('high', 'structured_comprehensive', True, 'deep', 'full_novax_format')
+MEDIUM_COMPLEXITY_RESULT = QueryComplexity('medium', 'structured_moderate', True, 'moderate', 'novax_sections')
+LOW_COMPLEXITY_RESULT = QueryComplexity('low', 'simple_structured', False, 'basic', 'clean_direct')
+
+def count_keywords(counter: re.Pattern, text: str) -> int:
+    """Number of distinct keywords from a counter pattern found in text"""
+    return len(set(counter.findall(text)))
+
+@lru_cache(maxsize=4096)
+def classify_query_complexity(message: Union[str, NormalizedMessage]) -> QueryComplexity:
     """Analyze query complexity and determine NovaX response format needed"""
-    message_lower = message.lower().strip()
-    word_count = len(message.split())
+    nm = as_normalized(message)
+    message_lower = nm.lower
+    word_count = nm.word_count
     
     # Simple greetings and acknowledgments
-    simple_patterns = ['hi', 'hello', 'hey', 'thanks', 'thank you', 'ok', 'okay', 'yes', 'no']
-    if any(message_lower.startswith(pattern) for pattern in simple_patterns) and word_count <= 3:
-        return {
-            'complexity': 'simple', 
-            'format': 'greeting',
-            'needs_thinking': False, 
-            'reasoning_depth': 'minimal',
-            'response_style': 'direct_friendly'
-        }
+    if SIMPLE_GREETING_PATTERN.match(message_lower) and word_count <= 3:
+        return SIMPLE_GREETING_RESULT
     
-    # Simple factual questions (who, what, when, where + is/are/was/were)
-    simple_fact_patterns = [
-        'who is', 'who was', 'who are', 'what is', 'what was', 'what are',
-        'when is', 'when was', 'when did', 'where is', 'where was',
-        'what time', 'current time', 'today\'s date', 'current date'
-    ]
-    
-    if any(pattern in message_lower for pattern in simple_fact_patterns) and word_count <= 8:
-        return {
-            'complexity': 'simple', 
-            'format': 'factual',
-            'needs_thinking': False, 
-            'reasoning_depth': 'minimal',
-            'response_style': 'direct_answer'
-        }
-    
-    # Medium complexity indicators (explanatory questions)
-    medium_indicators = [
-        'how do', 'how to', 'what are', 'benefits of', 'advantages of', 'compare', 'difference between',
-        'explain', 'learn', 'understand', 'tutorial', 'guide', 'steps to', 'create', 'build', 'make'
-    ]
-    
-    # High complexity indicators (analysis, strategy, design)
-    high_indicators = [
-        'analyze', 'evaluate', 'design', 'implement', 'optimize', 'strategy', 'approach',
-        'pros and cons', 'trade-offs', 'considerations', 'factors', 'implications',
-        'architecture', 'scalable', 'best practice', 'framework', 'comprehensive'
-    ]
-    
-    # Technical/analytical keywords
-    technical_keywords = [
-        'algorithm', 'database', 'performance', 'security', 'api',
-        'deployment', 'scaling', 'optimization', 'debugging', 'testing',
-        'microservices', 'system', 'infrastructure', 'code', 'programming'
-    ]
-    
-    # Decision-making keywords
-    decision_keywords = [
-        'should', 'choose', 'decide', 'select', 'recommend', 'suggest', 'advice',
-        'opinion', 'thoughts', 'perspective', 'consideration', 'help me'
-    ]
+    if SIMPLE_FACT_PATTERN.search(message_lower) and word_count <= 8:
+        return SIMPLE_FACT_RESULT
     
     # Calculate complexity score
     complexity_score = 0
     
     # Check for high complexity first
-    high_score = sum(1 for indicator in high_indicators if indicator in message_lower)
-    high_score += sum(1 for keyword in technical_keywords if keyword in message_lower) * 1.5
-    high_score += sum(1 for keyword in decision_keywords if keyword in message_lower) * 1.2
+    high_score = count_keywords(HIGH_INDICATOR_COUNTER, message_lower)
+    high_score += count_keywords(TECHNICAL_KEYWORD_COUNTER, message_lower) * 1.5
+    high_score += count_keywords(DECISION_KEYWORD_COUNTER, message_lower) * 1.2
     
     # Check for medium complexity
-    medium_score = sum(1 for indicator in medium_indicators if indicator in message_lower)
+    medium_score = count_keywords(MEDIUM_INDICATOR_COUNTER, message_lower)
     
     # Length-based complexity boost
     if word_count > 15:
@@ -692,269 +1081,382 @@ def analyze_query_complexity(message: str) -> dict:
     
     # Determine final complexity and format
     if high_score >= 1 or complexity_score >= 2:
-        return {
-            'complexity': 'high', 
-            'format': 'structured_comprehensive',
-            'needs_thinking': True, 
-            'reasoning_depth': 'deep',
-            'response_style': 'full_novax_format'
-        }
+        return HIGH_COMPLEXITY_RESULT
     elif medium_score >= 1 or word_count > 6:
-        return {
-            'complexity': 'medium', 
-            'format': 'structured_moderate',
-            'needs_thinking': True, 
-            'reasoning_depth': 'moderate',
-            'response_style': 'novax_sections'
-        }
+        return MEDIUM_COMPLEXITY_RESULT
     else:
-        return {
-            'complexity': 'low', 
-            'format': 'simple_structured',
-            'needs_thinking': False, 
-            'reasoning_depth': 'basic',
-            'response_style': 'clean_direct'
-        }
+        return LOW_COMPLEXITY_RESULT
 
-def is_simple_greeting(message: str) -> bool:
+def analyze_query_complexity(message: Union[str, NormalizedMessage]) -> dict:
+    """Analyze query complexity and determine NovaX response format needed"""
+    return classify_query_complexity(message)._asdict()
+
+@lru_cache(maxsize=4096)
+def is_simple_greeting(message: Union[str, NormalizedMessage]) -> bool:
     """Check if message is a simple greeting that needs minimal response"""
-    analysis = analyze_query_complexity(message)
-    return analysis['complexity'] == 'simple'
+    return classify_query_complexity(message).complexity == 'simple'
+
+@dataclass(frozen=True, slots=True)
+class MessageClassification:
+    """Every message-only signal the chat handlers need, computed in one pass"""
+    complexity: QueryComplexity
+    agent_type: str
+    is_time_query: bool
+    is_image_query: bool
+    is_ceo_query: bool
+
+@lru_cache(maxsize=4096)
+def classify_message(message: Union[str, NormalizedMessage]) -> MessageClassification:
+    """Classify a message with a single keyword scan shared by intent, image and CEO detection"""
+    nm = as_normalized(message)
+    flags = scan_intent_keywords(nm.lower)
+    is_time_query = is_time_date_query(nm)
+    
+    # Search trigger words only count in messages longer than two words
+    intent_flags = flags & ~KW_SEARCH_PATTERN if nm.word_count <= 2 else flags
+    
+    # CEO/founder and image requests win; then time/date queries, which
+    # should NOT use web search
+    if not flags & (KW_CEO | KW_IMAGE) and is_time_query:
+        agent_type = AGENT_TYPES[0]  # Use Assistant for direct time/date, not Explorer
+    else:
+        agent_type = INTENT_BY_FLAGS[intent_flags]
+    
+    return MessageClassification(
+        complexity=classify_query_complexity(nm),
+        agent_type=agent_type,
+        is_time_query=is_time_query,
+        is_image_query=bool(flags & KW_IMAGE),
+        is_ceo_query=bool(flags & KW_CEO)
+    )
+
+# Canned replies for bare greetings, answered without calling Gemini. Acknowledgements
+# like "ok" or "thanks" are left out: mid-conversation they depend on the history
+CANNED_REPLIES = MappingProxyType({
+    "hi": "⚡ Hi! How can I help you today?",
+    "hello": "⚡ Hello! How can I help you today?",
+    "hey": "🚀 Hey there! What can I do for you?",
+    "yo": "🚀 Hey there! What can I do for you?",
+    "sup": "🚀 Hey there! What can I do for you?",
+    "good morning": "⚡ Good morning! How can I help you today?",
+    "good afternoon": "⚡ Good afternoon! How can I help you today?",
+    "good evening": "⚡ Good evening! How can I help you today?"
+})
+
+def get_canned_reply(message: Union[str, NormalizedMessage]) -> Optional[str]:
+    """Canned reply for a bare greeting, or None"""
+    nm = as_normalized(message)
+    if nm.word_count > 3:
+        return None
+    # "Good   morning !!" -> "good morning"
+    return CANNED_REPLIES.get(" ".join(nm.words).rstrip('!.? '))
 
 # Personalization Engine
+PERSONALITY_PROMPTS = MappingProxyType({
+    "Friendly": "Respond in a warm, friendly, and approachable manner.",
+    "Professional": "Maintain a professional, business-appropriate tone.",
+    "Sarcastic": "Use subtle sarcasm and wit in your responses.",
+    "Developer": "Focus on technical accuracy and provide code examples when relevant.",
+    "Creative": "Be imaginative and think outside the box in your responses."
+})
+DEFAULT_PERSONALITY_PROMPT = PERSONALITY_PROMPTS['Professional']
+
+# Behavior rules keyed by the setting that enables them (all default on)
+BEHAVIOR_RULES = (
+    ('novax_step_by_step', "- Give step-by-step instructions when the user asks 'how to'."),
+    ('novax_production_code', "- Provide production-ready code when the user asks for code."),
+    ('novax_security_warnings', "- Add warnings for security, API keys, backend issues, or database risks when needed."),
+    ('novax_prompt_improvement', "- Improve user prompts automatically if they are unclear."),
+    ('novax_dual_answers', "- Provide both basic and advanced versions of answers."),
+    ('novax_project_suggestions', "- Suggest improvements the user can add to their app or project.")
+)
+
+# Memory and context rules keyed by the setting that enables them (all default on)
+MEMORY_RULES = (
+    ('novax_memory_enabled', (
+        "- Always remember my ongoing projects unless I disable it.",
+        "- Remember that I build AI apps, cloud platforms, and experimental features."
+    )),
+    ('novax_chat_history_context', (
+        "- Use recent chat history to keep context in long conversations.",
+        "- If context is missing, ask clarifying questions instead of assuming."
+    )),
+    ('novax_realtime_search', (
+        "- When web search is enabled, verify facts through real data.",
+        "- If web search is disabled, say 'Web search is off—enable it for real-time results.'"
+    ))
+)
+
+PERSONALIZATION_CACHE_SIZE = 10000
+
+# Section banners of the personalization block
+BANNER_RULE: Final[str] = "===================================================="
+USER_CONTEXT_BANNER: Final[str] = f"\n\n{BANNER_RULE}\n🎯 USER CONTEXT\n{BANNER_RULE}\n"
+CUSTOM_INSTRUCTIONS_BANNER: Final[str] = f"\n\n{BANNER_RULE}\n📋 CUSTOM INSTRUCTIONS\n{BANNER_RULE}\n"
+BEHAVIOR_RULES_BANNER: Final[str] = f"\n\n{BANNER_RULE}\n⚙️ BEHAVIOR RULES\n{BANNER_RULE}\n"
+MEMORY_RULES_BANNER: Final[str] = f"\n\n{BANNER_RULE}\n🧠 MEMORY & CONTEXT SETTINGS\n{BANNER_RULE}\n"
+
 def apply_personalization(base_prompt: str, settings: dict) -> str:
     """Apply user personalization settings to the base prompt"""
-    personality_prompts = {
-        "Friendly": "Respond in a warm, friendly, and approachable manner.",
-        "Professional": "Maintain a professional, business-appropriate tone.",
-        "Sarcastic": "Use subtle sarcasm and wit in your responses.",
-        "Developer": "Focus on technical accuracy and provide code examples when relevant.",
-        "Creative": "Be imaginative and think outside the box in your responses."
-    }
-    
-    # Add personality instruction
+    # Reduce the settings to the hashable values the prompt depends on
     personality = settings.get('personality', 'Professional')
-    personality_instruction = personality_prompts.get(personality, personality_prompts['Professional'])
-    
-    # Add tone and creativity instructions
-    tone = settings.get('tone', 50)
-    creativity = settings.get('creativity', 50)
-    detail_level = settings.get('detail_level', 50)
-    response_length = settings.get('response_length', 'Medium')
-    
-    # Nova X AI Personalization
-    novax_personalization = ""
+    args = (
+        base_prompt,
+        PERSONALITY_PROMPTS.get(personality, DEFAULT_PERSONALITY_PROMPT),
+        settings.get('tone', 50),
+        settings.get('creativity', 50),
+        settings.get('detail_level', 50),
+        settings.get('response_length', 'Medium'),
+        settings.get('novax_nickname'),
+        settings.get('novax_occupation'),
+        settings.get('novax_interests'),
+        settings.get('novax_custom_instructions'),
+        tuple(bool(settings.get(setting, True)) for setting, _ in BEHAVIOR_RULES),
+        tuple(bool(settings.get(setting, True)) for setting, _ in MEMORY_RULES)
+    )
+    try:
+        return build_personalized_prompt(*args)
+    except TypeError:
+        # Unhashable setting value, build without the cache
+        return build_personalized_prompt.__wrapped__(*args)
+
+@lru_cache(maxsize=PERSONALIZATION_CACHE_SIZE, typed=True)
+def build_personalized_prompt(base_prompt: str, personality_instruction: str, tone, creativity, detail_level,
+                              response_length, nickname, occupation, interests, custom_instructions,
+                              behavior_flags: tuple, memory_flags: tuple) -> str:
+    """Build the personalized prompt; pure, so results are shared across turns and users"""
+    parts = [base_prompt, f"""
+{personality_instruction}
+
+Personalization Settings:
+- Tone Level: {tone}/100 (0=Very Formal, 100=Very Casual)
+- Creativity: {creativity}/100 (0=Conservative, 100=Highly Creative)
+- Detail Level: {detail_level}/100 (0=Brief, 100=Comprehensive)
+- Response Length: {response_length}
+
+Apply these settings to your response style.
+"""]
     
     # Add user context if provided
-    if settings.get('novax_nickname') or settings.get('novax_occupation') or settings.get('novax_interests'):
-        novax_personalization += "\n\n====================================================\n"
-        novax_personalization += "🎯 USER CONTEXT\n"
-        novax_personalization += "====================================================\n"
+    if nickname or occupation or interests:
+        parts.append(USER_CONTEXT_BANNER)
         
-        if settings.get('novax_nickname'):
-            novax_personalization += f"User's Nickname: {settings['novax_nickname']}\n"
+        if nickname:
+            parts.append(f"User's Nickname: {nickname}\n")
         
-        if settings.get('novax_occupation'):
-            novax_personalization += f"User's Occupation: {settings['novax_occupation']}\n"
+        if occupation:
+            parts.append(f"User's Occupation: {occupation}\n")
         
-        if settings.get('novax_interests'):
-            novax_personalization += f"User's Interests/Values: {settings['novax_interests']}\n"
+        if interests:
+            parts.append(f"User's Interests/Values: {interests}\n")
     
     # Add custom instructions if provided
-    if settings.get('novax_custom_instructions'):
-        novax_personalization += "\n\n====================================================\n"
-        novax_personalization += "📋 CUSTOM INSTRUCTIONS\n"
-        novax_personalization += "====================================================\n"
-        novax_personalization += f"{settings['novax_custom_instructions']}\n"
+    if custom_instructions:
+        parts.append(CUSTOM_INSTRUCTIONS_BANNER)
+        parts.append(f"{custom_instructions}\n")
     
     # Add behavior settings
-    behavior_rules = []
-    
-    if settings.get('novax_step_by_step', True):
-        behavior_rules.append("- Give step-by-step instructions when the user asks 'how to'.")
-    
-    if settings.get('novax_production_code', True):
-        behavior_rules.append("- Provide production-ready code when the user asks for code.")
-    
-    if settings.get('novax_security_warnings', True):
-        behavior_rules.append("- Add warnings for security, API keys, backend issues, or database risks when needed.")
-    
-    if settings.get('novax_prompt_improvement', True):
-        behavior_rules.append("- Improve user prompts automatically if they are unclear.")
-    
-    if settings.get('novax_dual_answers', True):
-        behavior_rules.append("- Provide both basic and advanced versions of answers.")
-    
-    if settings.get('novax_project_suggestions', True):
-        behavior_rules.append("- Suggest improvements the user can add to their app or project.")
+    behavior_rules = [rule for (_, rule), enabled in zip(BEHAVIOR_RULES, behavior_flags) if enabled]
     
     if behavior_rules:
-        novax_personalization += "\n\n====================================================\n"
-        novax_personalization += "⚙️ BEHAVIOR RULES\n"
-        novax_personalization += "====================================================\n"
-        novax_personalization += "You must always:\n"
-        novax_personalization += "\n".join(behavior_rules) + "\n"
+        parts.append(BEHAVIOR_RULES_BANNER)
+        parts.append("You must always:\n")
+        parts.append("\n".join(behavior_rules) + "\n")
     
     # Add memory and context settings
-    memory_rules = []
-    
-    if settings.get('novax_memory_enabled', True):
-        memory_rules.append("- Always remember my ongoing projects unless I disable it.")
-        memory_rules.append("- Remember that I build AI apps, cloud platforms, and experimental features.")
-    
-    if settings.get('novax_chat_history_context', True):
-        memory_rules.append("- Use recent chat history to keep context in long conversations.")
-        memory_rules.append("- If context is missing, ask clarifying questions instead of assuming.")
-    
-    if settings.get('novax_realtime_search', True):
-        memory_rules.append("- When web search is enabled, verify facts through real data.")
-        memory_rules.append("- If web search is disabled, say 'Web search is off—enable it for real-time results.'")
+    memory_rules = [rule for (_, rules), enabled in zip(MEMORY_RULES, memory_flags) if enabled for rule in rules]
     
     if memory_rules:
-        novax_personalization += "\n\n====================================================\n"
-        novax_personalization += "🧠 MEMORY & CONTEXT SETTINGS\n"
-        novax_personalization += "====================================================\n"
-        novax_personalization += "\n".join(memory_rules) + "\n"
+        parts.append(MEMORY_RULES_BANNER)
+        parts.append("\n".join(memory_rules) + "\n")
     
-    personalization = f"""
-{personality_instruction}
+    parts.append("\n")
+    return "".join(parts)
 
-Personalization Settings:
-- Tone Level: {tone}/100 (0=Very Formal, 100=Very Casual)
-- Creativity: {creativity}/100 (0=Conservative, 100=Highly Creative)
-- Detail Level: {detail_level}/100 (0=Brief, 100=Comprehensive)
-- Response Length: {response_length}
+# Stable prompt prefix (system prompt + personalization + user memory) per user,
+# so every turn starts with the same text and only the context/message varies
+PROMPT_PREFIX_CACHE_SIZE = 10000
+PROMPT_PREFIX_TTL = 300  # Bounds staleness when another worker updates memory
+prompt_prefix_cache: Dict[str, tuple] = {}
 
-Apply these settings to your response style.
-{novax_personalization}
-"""
+async def get_prompt_prefix(user_id: str, user_settings: dict) -> str:
+    """System prompt, personalization and user memory, rebuilt only when they change"""
+    version = database.get_user_version(user_id)
+    personalized_prompt = apply_personalization(NOVAX_SYSTEM_PROMPT, user_settings)
+    
+    cached = prompt_prefix_cache.get(user_id)
+    if cached and cached[0] == version and cached[1] == personalized_prompt and cached[3] > time.time():
+        return cached[2]
     
-    return base_prompt + personalization
+    # Get user memory for persistent context
+    user_memory_context = await database.get_user_context_for_ai(user_id)
+    prefix = personalized_prompt + user_memory_context if user_memory_context else personalized_prompt
+    
+    if user_id not in prompt_prefix_cache and len(prompt_prefix_cache) >= PROMPT_PREFIX_CACHE_SIZE:
+        prompt_prefix_cache.pop(next(iter(prompt_prefix_cache)))
+    prompt_prefix_cache[user_id] = (version, personalized_prompt, prefix, time.time() + PROMPT_PREFIX_TTL)
+    return prefix
 
 # Suggestion Generator
+# NovaX intro lines per response format
+NOVAX_INTROS = MappingProxyType({
+    'greeting': (
+        "⚡ Hello! Great to meet you!",
+        "🚀 Hey there! How can I help?",
+        "💫 Nice to see you!"
+    ),
+    'factual': (
+        "🔍 Found the answer for you:",
+        "📊 Here's what I found:",
+        "💡 Quick answer:"
+    ),
+    'structured_moderate': (
+        "🚀 Let's break this down step-by-step:",
+        "⚡ Here's the complete solution:",
+        "🧠 Let me explain this clearly:"
+    ),
+    'structured_comprehensive': (
+        "🧠 Analyzing your request…",
+        "🔍 Identifying the best solution…",
+        "🚀 Let's solve this comprehensively:"
+    )
+})
+# Each agent gets a fixed intro per format, for variety that is stable across processes
+INTRO_BY_FORMAT_AGENT = MappingProxyType({
+    (format_type, agent): intros[i % len(intros)]
+    for format_type, intros in NOVAX_INTROS.items()
+    for i, agent in enumerate(AGENT_TYPES)
+})
+
 def generate_novax_intro(complexity_analysis: dict, agent_type: str) -> str:
     """Generate NovaX-style intro line with emoji based on query type"""
-    intros = {
-        'greeting': [
-            "⚡ Hello! Great to meet you!",
-            "🚀 Hey there! How can I help?",
-            "💫 Nice to see you!"
-        ],
-        'factual': [
-            "🔍 Found the answer for you:",
-            "📊 Here's what I found:",
-            "💡 Quick answer:"
-        ],
-        'structured_moderate': [
-            "🚀 Let's break this down step-by-step:",
-            "⚡ Here's the complete solution:",
-            "🧠 Let me explain this clearly:"
-        ],
-        'structured_comprehensive': [
-            "🧠 Analyzing your request…",
-            "🔍 Identifying the best solution…",
-            "🚀 Let's solve this comprehensively:"
-        ]
-    }
-    
     format_type = complexity_analysis.get('format', 'simple_structured')
-    intro_list = intros.get(format_type, intros['factual'])
-    
-    # Select based on agent type for variety
-    agent_index = hash(agent_type) % len(intro_list)
-    return intro_list[agent_index]
+    intro = INTRO_BY_FORMAT_AGENT.get((format_type, agent_type))
+    if intro is None:
+        intro = NOVAX_INTROS.get(format_type, NOVAX_INTROS['factual'])[0]
+    return intro
+
+# Emojis that mark a response as already having a NovaX intro (all single code points)
+INTRO_EMOJIS = frozenset('⚡🚀🧠🔍💫📊')
 
 def format_novax_response(content: str, complexity_analysis: dict, agent_type: str) -> str:
     """Format response according to NovaX style guidelines"""
-    format_type = complexity_analysis.get('format', 'simple_structured')
-    
     # Add NovaX intro if not already present
-    if not content.startswith(('⚡', '🚀', '🧠', '🔍', '💫', '📊')):
+    if content[:1] not in INTRO_EMOJIS:
         intro = generate_novax_intro(complexity_analysis, agent_type)
         return f"{intro}\n\n{content}"
     
     return content
 
+# Follow-up suggestions per agent
+SUGGESTIONS = MappingProxyType({
+    'NovaX Explorer': (
+        "Need more recent updates?",
+        "Want different time zones?",
+        "Get live data on this?"
+    ),
+    'NovaX Developer': (
+        "Need help improving this further?",
+        "Want the frontend version too?",
+        "Should I explain the architecture?"
+    ),
+    'NovaX Writer': (
+        "Need this in a different tone?",
+        "Want me to expand this?",
+        "Should I create variations?"
+    ),
+    'NovaX Analyst': (
+        "Want deeper analysis?",
+        "Need visual charts?",
+        "Should I show calculations?"
+    ),
+    'NovaX Creator': (
+        "Want more creative ideas?",
+        "Need design variations?",
+        "Should I add UI concepts?"
+    ),
+    'NovaX Tutor': (
+        "Need more examples?",
+        "Want practice exercises?",
+        "Should I explain differently?"
+    )
+})
+DEFAULT_SUGGESTIONS = (
+    "Need help improving this further?",
+    "Want a different approach?",
+    "Any follow-up questions?"
+)
+
 def generate_suggestions(message: str, agent_type: str) -> list:
     """Generate contextual NovaX-style suggestions"""
-    suggestions = []
-    
-    if agent_type == 'NovaX Explorer':
-        suggestions = [
-            "Need more recent updates?",
-            "Want different time zones?",
-            "Get live data on this?"
-        ]
-    elif agent_type == 'NovaX Developer':
-        suggestions = [
-            "Need help improving this further?",
-            "Want the frontend version too?",
-            "Should I explain the architecture?"
-        ]
-    elif agent_type == 'NovaX Writer':
-        suggestions = [
-            "Need this in a different tone?",
-            "Want me to expand this?",
-            "Should I create variations?"
-        ]
-    elif agent_type == 'NovaX Analyst':
-        suggestions = [
-            "Want deeper analysis?",
-            "Need visual charts?",
-            "Should I show calculations?"
-        ]
-    elif agent_type == 'NovaX Creator':
-        suggestions = [
-            "Want more creative ideas?",
-            "Need design variations?",
-            "Should I add UI concepts?"
-        ]
-    elif agent_type == 'NovaX Tutor':
-        suggestions = [
-            "Need more examples?",
-            "Want practice exercises?",
-            "Should I explain differently?"
-        ]
-    else:
-        suggestions = [
-            "Need help improving this further?",
-            "Want a different approach?",
-            "Any follow-up questions?"
-        ]
-    
-    return suggestions[:2]  # Return max 2 suggestions
-
-
+    return list(SUGGESTIONS.get(agent_type, DEFAULT_SUGGESTIONS)[:2])  # Return max 2 suggestions
+
+
+
+# Static /, /agents and /health payloads, serialized once
+ROOT_INFO_JSON = orjson.dumps({
+    "service": "NovaX AI Platform",
+    "version": "2.2.0",
+    "status": "online",
+    "company": "NovaX Technologies",
+    "ceo": "Rishav Kumar Jha",
+    "message": "Welcome to NovaX AI - Next-generation AI with structured reasoning",
+    "endpoints": {
+        "health": "/health",
+        "chat": "/chat",
+        "streaming_chat": "/chat/stream",
+        "agents": "/agents",
+        "realtime": "/api/realtime",
+        "search": "/api/search",
+        "docs": "/docs"
+    },
+    "features": [
+        "Advanced Structured Reasoning",
+        "Real-time Web Search",
+        "Multi-timezone Support",
+        "Image Generation",
+        "Parallel API Processing"
+    ]
+})
 
 @app.get("/")
 @app.head("/")
 async def root():
     """Root endpoint - NovaX AI Platform welcome"""
+    return Response(ROOT_INFO_JSON, media_type="application/json")
+
+@app.get("/metrics")
+async def cache_metrics():
+    """Cache hit/miss counters"""
     return {
-        "service": "NovaX AI Platform",
-        "version": "2.2.0",
-        "status": "online",
-        "company": "NovaX Technologies",
-        "ceo": "Rishav Kumar Jha",
-        "message": "Welcome to NovaX AI - Next-generation AI with structured reasoning",
-        "endpoints": {
-            "health": "/health",
-            "chat": "/chat",
-            "streaming_chat": "/chat/stream",
-            "agents": "/agents",
-            "realtime": "/api/realtime",
-            "search": "/api/search",
-            "docs": "/docs"
-        },
-        "features": [
-            "Advanced Structured Reasoning",
-            "Real-time Web Search",
-            "Multi-timezone Support",
-            "Image Generation",
-            "Parallel API Processing"
-        ]
+        "response_cache": response_cache.get_stats(),
+        "search_cache": search_cache.get_stats(),
+        "drive_cache": drive_cache.get_stats(),
+        "tts_cache": tts_cache.get_stats()
     }
 
+HEALTH_FEATURES = (
+    "Parallel API Processing",
+    "High-Performance Scaling",
+    "Advanced Structured Reasoning",
+    "Deep Multi-Domain Analysis",
+    "Real-time Web Search",
+    "Current Date/Time Information",
+    "Multi-timezone Support",
+    "Live Information Updates",
+    "Expert-Level Decision Support",
+    "6-Part Response Structure"
+)
+HEALTH_INTELLIGENCE_MODES = (
+    "NovaX Developer",
+    "NovaX Writer", 
+    "NovaX Analyst",
+    "NovaX Explorer",
+    "NovaX Creator",
+    "NovaX Tutor",
+    "NovaX Assistant"
+)
+
 @app.get("/health")
 async def health_check():
     datetime_info = get_current_datetime_info()
@@ -983,27 +1485,8 @@ async def health_check():
         "ceo": "Rishav Kumar Jha",
         "current_time": datetime_info['current_utc'],
         "api_pool": pool_info,
-        "features": [
-            "Parallel API Processing",
-            "High-Performance Scaling",
-            "Advanced Structured Reasoning",
-            "Deep Multi-Domain Analysis",
-            "Real-time Web Search",
-            "Current Date/Time Information",
-            "Multi-timezone Support",
-            "Live Information Updates",
-            "Expert-Level Decision Support",
-            "6-Part Response Structure"
-        ],
-        "intelligence_modes": [
-            "NovaX Developer",
-            "NovaX Writer", 
-            "NovaX Analyst",
-            "NovaX Explorer",
-            "NovaX Creator",
-            "NovaX Tutor",
-            "NovaX Assistant"
-        ]
+        "features": HEALTH_FEATURES,
+        "intelligence_modes": HEALTH_INTELLIGENCE_MODES
     }
 
 # New API Endpoints
@@ -1011,14 +1494,7 @@ async def health_check():
 async def create_new_chat(request: dict):
     try:
         token = request.get("token")
-        user_id = "demo_user"  # Default fallback
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed in create_new_chat: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         chat_id = await database.create_chat_session(user_id)
         return {"chat_id": chat_id}
@@ -1028,29 +1504,22 @@ async def create_new_chat(request: dict):
 @app.get("/api/history/{user_token}")
 async def get_chat_history(user_token: str):
     try:
-        user_id = "demo_user"  # Default fallback
-        if firebase_initialized and user_token:
-            try:
-                decoded_token = auth.verify_id_token(user_token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed in history: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(user_token)
         
         chats = await database.get_user_chats(user_id)
         return {"chats": chats}
     except Exception as e:
-        print(f"History error: {e}")
+        logger.error("History error: %s", e)
         return {"chats": []}
 
 @app.get("/api/chat/{chat_id}/messages")
 async def get_chat_messages(chat_id: str):
     try:
         messages = await database.get_chat_messages(chat_id)
-        print(f"Retrieved {len(messages)} messages for chat {chat_id}")
+        logger.debug("Retrieved %s messages for chat %s", len(messages), chat_id)
         return {"messages": messages}
     except Exception as e:
-        print(f"Error getting messages for chat {chat_id}: {e}")
+        logger.error("Error getting messages for chat %s: %s", chat_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/chat/{chat_id}")
@@ -1076,14 +1545,7 @@ async def update_settings(request: dict):
         token = request.get("token")
         settings = request.get("settings", {})
         
-        user_id = "demo_user"  # Default fallback
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed in update_settings: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         await database.update_user_settings(user_id, settings)
         return {"success": True}
@@ -1093,14 +1555,7 @@ async def update_settings(request: dict):
 @app.get("/api/settings/{user_token}")
 async def get_settings(user_token: str):
     try:
-        user_id = "demo_user"  # Default fallback
-        if firebase_initialized and user_token:
-            try:
-                decoded_token = auth.verify_id_token(user_token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed in settings: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(user_token)
         
         settings = await database.get_user_settings(user_id)
         return settings
@@ -1110,14 +1565,7 @@ async def get_settings(user_token: str):
 @app.get("/api/memory/{user_token}")
 async def get_user_memory(user_token: str):
     try:
-        user_id = "demo_user"  # Default fallback
-        if firebase_initialized and user_token:
-            try:
-                decoded_token = auth.verify_id_token(user_token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed in get_user_memory: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(user_token)
         
         memory = await database.get_user_memory(user_id)
         return memory
@@ -1130,14 +1578,7 @@ async def update_user_memory(request: dict):
         token = request.get("token")
         memory_data = request.get("memory", {})
         
-        user_id = "demo_user"  # Default fallback
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed in update_user_memory: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         await database.save_user_memory(user_id, memory_data)
         return {"success": True}
@@ -1148,16 +1589,9 @@ async def update_user_memory(request: dict):
 @app.post("/api/share/create")
 async def create_share_link(request: ShareRequest):
     try:
-        user_id = "demo_user"
-        if firebase_initialized and request.token:
-            try:
-                decoded_token = auth.verify_id_token(request.token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(request.token)
         
-        print(f"Creating share for chat {request.chat_id} by user {user_id}")
+        logger.debug("Creating share for chat %s by user %s", request.chat_id, user_id)
         
         # Verify chat exists and has messages
         messages = await database.get_chat_messages(request.chat_id)
@@ -1172,7 +1606,7 @@ async def create_share_link(request: ShareRequest):
             expires_in_days=request.expires_in_days
         )
         
-        print(f"Created share with ID: {share_id}")
+        logger.debug("Created share with ID: %s", share_id)
         
         return {
             "success": True,
@@ -1183,22 +1617,22 @@ async def create_share_link(request: ShareRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error creating share: {e}")
+        logger.error("Error creating share: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/shared/{share_id}")
 async def get_shared_chat_data(share_id: str):
     try:
-        print(f"Getting shared chat: {share_id}")
+        logger.debug("Getting shared chat: %s", share_id)
         share_data = await database.get_shared_chat(share_id)
         if not share_data:
-            print(f"Share data not found for: {share_id}")
+            logger.warning("Share data not found for: %s", share_id)
             raise HTTPException(status_code=404, detail="Shared chat not found or expired")
         
-        print(f"Found share data, getting messages for chat: {share_data['chat_id']}")
+        logger.debug("Found share data, getting messages for chat: %s", share_data['chat_id'])
         # Get chat messages
         messages = await database.get_chat_messages(share_data["chat_id"])
-        print(f"Found {len(messages)} messages")
+        logger.debug("Found %s messages", len(messages))
         
         # Get chat session info
         chat_session = None
@@ -1207,7 +1641,7 @@ async def get_shared_chat_data(share_id: str):
             doc = db.collection("chat_sessions").document(share_data["chat_id"]).get()
             if doc.exists:
                 chat_session = doc.to_dict()
-                print(f"Found chat session: {chat_session.get('title', 'No title')}")
+                logger.debug("Found chat session: %s", chat_session.get('title', 'No title'))
         
         return {
             "success": True,
@@ -1218,20 +1652,13 @@ async def get_shared_chat_data(share_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_shared_chat_data: {e}")
+        logger.error("Error in get_shared_chat_data: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/share/list/{user_token}")
 async def get_user_shares(user_token: str):
     try:
-        user_id = "demo_user"
-        if firebase_initialized and user_token:
-            try:
-                decoded_token = auth.verify_id_token(user_token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(user_token)
         
         shares = await database.get_user_shared_chats(user_id)
         return {"shares": shares}
@@ -1249,11 +1676,11 @@ async def get_private_shared_chats(authorization: str = Header(None)):
             try:
                 # Extract token from "Bearer <token>" format
                 token = authorization.replace("Bearer ", "") if authorization.startswith("Bearer ") else authorization
-                decoded_token = auth.verify_id_token(token)
+                decoded_token = await verify_token(token)
                 user_id = decoded_token['uid']
                 user_email = decoded_token.get('email', f"user-{user_id[:8]}@novax.ai")
             except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
+                logger.warning("Token validation failed: %s", token_error)
                 # Continue with demo user
         
         # Get private shares where this user is the recipient
@@ -1267,14 +1694,7 @@ async def get_private_shared_chats(authorization: str = Header(None)):
 async def revoke_share_link(share_id: str, request: dict):
     try:
         token = request.get("token")
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         success = await database.revoke_shared_chat(share_id, user_id)
         if success:
@@ -1286,54 +1706,57 @@ async def revoke_share_link(share_id: str, request: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Static /agents payload, serialized once
+AGENTS_INFO_JSON = orjson.dumps({
+    "agents": [
+        {
+            "name": "NovaX Assistant", 
+            "description": "General help with structured reasoning and expert-level responses",
+            "capabilities": ["Deep reasoning", "Multi-domain analysis", "Strategic insights"]
+        },
+        {
+            "name": "NovaX Explorer", 
+            "description": "Real-time web search with intelligent analysis and current information",
+            "capabilities": ["Live data access", "Multi-timezone support", "Current events", "Smart search optimization"]
+        },
+        {
+            "name": "NovaX Developer", 
+            "description": "Advanced coding solutions with architectural insights and best practices",
+            "capabilities": ["Clean code generation", "Architecture design", "Performance optimization", "Security analysis"]
+        },
+        {
+            "name": "NovaX Writer", 
+            "description": "Professional content creation with strategic communication insights",
+            "capabilities": ["SEO optimization", "Tone adaptation", "Multi-format content", "Brand consistency"]
+        },
+        {
+            "name": "NovaX Analyst", 
+            "description": "Deep data analysis with strategic recommendations and logical reasoning",
+            "capabilities": ["Pattern recognition", "Predictive insights", "Risk assessment", "Decision frameworks"]
+        },
+        {
+            "name": "NovaX Creator", 
+            "description": "Innovative design concepts with user experience optimization",
+            "capabilities": ["Creative ideation", "UX/UI insights", "Design systems", "Innovation strategies"]
+        },
+        {
+            "name": "NovaX Tutor", 
+            "description": "Educational explanations with adaptive learning approaches",
+            "capabilities": ["Concept breakdown", "Learning pathways", "Skill assessment", "Knowledge retention"]
+        }
+    ],
+    "system_features": {
+        "response_structure": "6-part structured format",
+        "reasoning_depth": "Expert-level analysis",
+        "confidence_scoring": "Transparent uncertainty handling",
+        "personalization": "Adaptive to user expertise level"
+    }
+})
+
 @app.get("/agents")
 async def get_available_agents():
     """Return available NovaX AI agents with enhanced structured reasoning"""
-    return {
-        "agents": [
-            {
-                "name": "NovaX Assistant", 
-                "description": "General help with structured reasoning and expert-level responses",
-                "capabilities": ["Deep reasoning", "Multi-domain analysis", "Strategic insights"]
-            },
-            {
-                "name": "NovaX Explorer", 
-                "description": "Real-time web search with intelligent analysis and current information",
-                "capabilities": ["Live data access", "Multi-timezone support", "Current events", "Smart search optimization"]
-            },
-            {
-                "name": "NovaX Developer", 
-                "description": "Advanced coding solutions with architectural insights and best practices",
-                "capabilities": ["Clean code generation", "Architecture design", "Performance optimization", "Security analysis"]
-            },
-            {
-                "name": "NovaX Writer", 
-                "description": "Professional content creation with strategic communication insights",
-                "capabilities": ["SEO optimization", "Tone adaptation", "Multi-format content", "Brand consistency"]
-            },
-            {
-                "name": "NovaX Analyst", 
-                "description": "Deep data analysis with strategic recommendations and logical reasoning",
-                "capabilities": ["Pattern recognition", "Predictive insights", "Risk assessment", "Decision frameworks"]
-            },
-            {
-                "name": "NovaX Creator", 
-                "description": "Innovative design concepts with user experience optimization",
-                "capabilities": ["Creative ideation", "UX/UI insights", "Design systems", "Innovation strategies"]
-            },
-            {
-                "name": "NovaX Tutor", 
-                "description": "Educational explanations with adaptive learning approaches",
-                "capabilities": ["Concept breakdown", "Learning pathways", "Skill assessment", "Knowledge retention"]
-            }
-        ],
-        "system_features": {
-            "response_structure": "6-part structured format",
-            "reasoning_depth": "Expert-level analysis",
-            "confidence_scoring": "Transparent uncertainty handling",
-            "personalization": "Adaptive to user expertise level"
-        }
-    }
+    return Response(AGENTS_INFO_JSON, media_type="application/json")
 
 @app.post("/api/image/generate")
 async def generate_image_direct(request: dict):
@@ -1428,99 +1851,132 @@ async def search_web(request: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/image/generate")
-async def generate_image_direct(request: dict):
-    """Direct image generation endpoint for plus icon"""
-    try:
-        message = request.get("message", "")
-        token = request.get("token")
-        
-        if not message:
-            raise HTTPException(status_code=400, detail="Message is required")
-        
-        # Enhance prompt using NovaX Nano
-        enhanced_prompt = await enhance_image_prompt(message)
-        generated_image = await image_generator.generate_image(enhanced_prompt)
-        
-        if generated_image:
-            return {
-                "success": True,
-                "enhanced_prompt": enhanced_prompt,
-                "generated_image": generated_image,
-                "message": f"🎨 **Image Generated Successfully!**\n\n**Enhanced Prompt:** {enhanced_prompt}\n\n**Generated Description:**\n{generated_image}\n\nWant a different style or variation?"
-            }
+def decode_image(file_content: str):
+    """Decode a base64 upload into a fully loaded PIL image (blocking)"""
+    from PIL import Image
+    img = Image.open(io.BytesIO(base64.b64decode(file_content)))
+    img.load()
+    return img
+
+def image_uploads(files: Optional[List[str]]) -> List[str]:
+    """Uploaded files large enough to be base64 images rather than text"""
+    return [f for f in (files or []) if isinstance(f, str) and len(f) > 10000]
+
+async def decode_images(uploads: List[str]) -> list:
+    """Decode base64 image uploads on worker threads, skipping any that fail"""
+    decoded = await asyncio.gather(*(run_blocking(decode_image, f) for f in uploads), return_exceptions=True)
+    images = []
+    for img in decoded:
+        if isinstance(img, Exception):
+            logger.error("Image processing error: %s", img)
         else:
-            return {
-                "success": False,
-                "message": "🎨 Image generation failed. Please try again."
-            }
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            images.append(img)
+    return images
+
+async def with_end_marker(response):
+    """Iterate an async model stream without blocking the loop, then yield a final None"""
+    async for chunk in response:
+        yield chunk
+    yield None
+
+def sse_event(payload: dict) -> bytes:
+    """Encode one SSE data frame with orjson, as bytes ready for the socket"""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+def sse_frames(*payloads: dict) -> bytes:
+    """Encode consecutive SSE frames into one buffer so they go out in a single write"""
+    return b"".join([sse_event(payload) for payload in payloads])
+
+# Everything after the metadata frame of a canned reply, encoded once
+CANNED_REPLY_FRAMES = MappingProxyType({
+    reply: sse_frames(
+        {'type': 'response_start'},
+        {'type': 'response_chunk', 'content': reply},
+        {'type': 'response_end', 'suggestions': generate_suggestions(reply, 'NovaX Assistant')},
+    )
+    for reply in set(CANNED_REPLIES.values())
+})
 
 @app.post("/chat/stream")
 async def chat_stream(request: ChatRequest):
     """Streaming chat endpoint that sends responses word by word"""
     async def generate_stream():
+        prefetch_tasks = []  # Cancelled on exit if an error or disconnect leaves them running
         try:
             # Verify Firebase token only if Firebase is initialized
-            user_id = "demo_user"  # Default fallback
-            if firebase_initialized and request.token:
-                try:
-                    decoded_token = auth.verify_id_token(request.token)
-                    user_id = decoded_token['uid']
-                except Exception as token_error:
-                    print(f"Token validation failed: {token_error}")
-                    # Continue with demo_user instead of failing
-                    user_id = "demo_user"
+            user_id = await resolve_user_id(request.token)
             
             # Get or create chat session
             chat_id = request.chat_id
             if not chat_id:
                 chat_id = await database.create_chat_session(user_id)
             
-            # Get chat history for context analysis
-            chat_history = await database.get_chat_messages(chat_id)
+            # Normalize the message once for every classifier below
+            message = normalize_message(request.message)
+            
+            # Bare greetings get a canned reply before any history/settings work
+            canned_reply = get_canned_reply(message)
+            if canned_reply and not request.files:
+                yield sse_event({'type': 'metadata', 'agent_type': 'NovaX Assistant', 'chat_id': chat_id}) + CANNED_REPLY_FRAMES[canned_reply]
+                
+                spawn_background(database.finalize_turn(user_id, chat_id, request.message, canned_reply, 'NovaX Assistant'))
+                return
+            
+            # Recent chat history (only the last 3 turns are used) and user settings
+            # are independent reads, fetch them together
+            chat_history, user_settings = await asyncio.gather(
+                database.get_recent_chat_messages(chat_id, limit=3),
+                database.get_user_settings(user_id)
+            )
             
             # Analyze topic relevance
-            topic_analysis = analyze_topic_relevance(request.message, chat_history)
+            topic_analysis = analyze_topic_relevance(message, chat_history)
             
-            # Get user settings
-            user_settings = await database.get_user_settings(user_id)
+            # Apply per-request settings overrides
             if request.settings:
                 user_settings.update(request.settings.dict(exclude_unset=True))
             
-            # Analyze query complexity for automatic thinking depth
-            complexity_analysis = analyze_query_complexity(request.message)
-            
-            # Detect appropriate NovaX AI agent
-            agent_type = detect_user_intent(request.message)
+            # Classify the message once: complexity (automatic thinking depth),
+            # NovaX AI agent, and time/date, image and CEO signals
+            classification = classify_message(message)
+            complexity_analysis = classification.complexity._asdict()
+            agent_type = classification.agent_type
             
             # Send initial metadata
-            yield f"data: {json.dumps({'type': 'metadata', 'agent_type': agent_type, 'chat_id': chat_id})}\n\n"
+            yield sse_event({'type': 'metadata', 'agent_type': agent_type, 'chat_id': chat_id})
             
             # Check if this is a simple greeting
             is_greeting = complexity_analysis['complexity'] == 'simple'
             
             # DIRECT DATE/TIME RESPONSE - bypass AI for accuracy
-            if is_time_date_query(request.message):
-                print(f"DEBUG: Streaming direct date/time response triggered for: {request.message}")
+            if classification.is_time_query:
+                logger.debug("Streaming direct date/time response triggered for: %s", request.message)
                 datetime_info = get_current_datetime_info()
                 ist_time = datetime_info['timezones']['IST']
                 direct_response = f"⚡ Here's today's date and time:\n\n📅 Current Date Today's date is {datetime_info['current_date']}.\n🕐 Indian Time {ist_time}\n🌍 UTC Time {datetime_info['current_time_utc']}\n\nNeed any other information about this date?"
                 
-                print(f"DEBUG: Streaming direct response: {direct_response[:100]}...")
+                logger.debug("Streaming direct response: %s...", direct_response[:100])
                 
                 # Send direct response
-                yield f"data: {json.dumps({'type': 'response_start'})}\n\n"
-                yield f"data: {json.dumps({'type': 'response_chunk', 'content': direct_response})}\n\n"
-                yield f"data: {json.dumps({'type': 'response_end', 'suggestions': ['Check different time zones?', 'Need the current time too?']})}\n\n"
+                yield sse_frames(
+                    {'type': 'response_start'},
+                    {'type': 'response_chunk', 'content': direct_response},
+                    {'type': 'response_end', 'suggestions': ['Check different time zones?', 'Need the current time too?']},
+                )
                 
-                # Save and return
-                await database.save_message(user_id, chat_id, request.message, direct_response, 'NovaX Assistant')
-                await database.update_chat_title_if_new(chat_id, request.message)
+                # Save in the background and return
+                spawn_background(database.finalize_turn(user_id, chat_id, request.message, direct_response, 'NovaX Assistant'))
                 return
             
+            # Start the prompt prefix, Explorer web search and cross-session history
+            # reads now so they overlap with image handling and prompt assembly
+            prefix_task = asyncio.create_task(get_prompt_prefix(user_id, user_settings))
+            search_task = None
+            if agent_type == 'NovaX Explorer' and not is_greeting:
+                search_task = asyncio.create_task(novax_search.search(request.message, 5))
+            memory_task = asyncio.create_task(database.get_all_user_messages(user_id))
+            prefetch_tasks.extend(task for task in (prefix_task, search_task, memory_task) if task)
+            
             # Handle image generation, real-time queries and time/date requests
             generated_image = None
             search_context = ""
@@ -1528,71 +1984,59 @@ async def chat_stream(request: ChatRequest):
             citations = []
             
             # Check for image generation request
-            if is_image_generation_query(request.message):
-                print(f"Image generation requested for: {request.message}")
+            if classification.is_image_query:
+                logger.debug("Image generation requested for: %s", request.message)
                 # Enhance prompt using NovaX Nano
                 enhanced_prompt = await enhance_image_prompt(request.message)
-                print(f"Enhanced prompt: {enhanced_prompt}")
+                logger.debug("Enhanced prompt: %s", enhanced_prompt)
                 generated_image = await image_generator.generate_image(enhanced_prompt)
                 if generated_image:
-                    print(f"Image description generated successfully")
+                    logger.debug("Image description generated successfully")
                     
                     # Send image description as text response
                     image_success_msg = f'🎨 **Image Generated Successfully!**\n\n**Enhanced Prompt:** {enhanced_prompt}\n\n**Generated Description:**\n{generated_image}\n\nWant a different style or variation?'
-                    yield f"data: {json.dumps({'type': 'response_chunk', 'content': image_success_msg})}\n\n"
-                    yield f"data: {json.dumps({'type': 'response_end', 'suggestions': ['Generate another image', 'Different style', 'Change the scene']})}\n\n"
+                    yield sse_frames(
+                        {'type': 'response_chunk', 'content': image_success_msg},
+                        {'type': 'response_end', 'suggestions': ['Generate another image', 'Different style', 'Change the scene']},
+                    )
                     
-                    # Save message to database
-                    await database.save_message(user_id, chat_id, request.message, image_success_msg, agent_type)
-                    await database.update_chat_title_if_new(chat_id, request.message)
+                    # Save message to database in the background
+                    spawn_background(database.finalize_turn(user_id, chat_id, request.message, image_success_msg, agent_type))
                     
-                    print(f"Image description sent successfully")
+                    logger.debug("Image description sent successfully")
                     return
                 else:
-                    print("Image generation failed")
+                    logger.error("Image generation failed")
                     image_error_msg = '🎨 **Image Generation Note:** The image service is currently unavailable. I\'ll provide you with a detailed description instead.\n\n'
-                    yield f"data: {json.dumps({'type': 'response_chunk', 'content': image_error_msg})}\n\n"
+                    yield sse_event({'type': 'response_chunk', 'content': image_error_msg})
             
             # Always provide datetime context for time/date queries or Explorer agent
-            if is_time_date_query(request.message) or (agent_type == 'NovaX Explorer' and not is_greeting):
+            if classification.is_time_query or (agent_type == 'NovaX Explorer' and not is_greeting):
                 # Get current date/time information
-                datetime_info = get_current_datetime_info()
-                datetime_context = f"\n\nCurrent Real-time Information:\n"
-                datetime_context += f"📅 Date: {datetime_info['current_date']}\n"
-                datetime_context += f"🕐 UTC Time: {datetime_info['current_time_utc']}\n"
-                datetime_context += f"🌍 Timezones:\n"
-                for tz, time_str in datetime_info['timezones'].items():
-                    datetime_context += f"   {tz}: {time_str}\n"
+                datetime_context = build_datetime_block(get_current_datetime_info())
             
             # Perform web search for Explorer agent (not for direct time/date queries)
-            if agent_type == 'NovaX Explorer' and not is_greeting and not is_time_date_query(request.message):
+            if agent_type == 'NovaX Explorer' and not is_greeting and not classification.is_time_query:
                 # Send search status
-                yield f"data: {json.dumps({'type': 'search_start', 'query': request.message})}\n\n"
+                yield sse_event({'type': 'search_start', 'query': request.message})
                 
                 # Perform web search for additional context
-                search_results = await novax_search.search(request.message, 5)
+                search_results = await search_task
                 if search_results["results"]:
                     search_context = novax_search.format_search_context(search_results, request.message)
                     citations = novax_search.generate_citations(search_results)
                     
                     # Send search results
-                    yield f"data: {json.dumps({'type': 'search_complete', 'results_count': len(search_results['results'])})}\n\n"
+                    yield sse_event({'type': 'search_complete', 'results_count': len(search_results['results'])})
                 else:
-                    yield f"data: {json.dumps({'type': 'search_complete', 'results_count': 0})}\n\n"
-            
-            # Get user memory for persistent context
-            user_memory_context = await database.get_user_context_for_ai(user_id)
+                    yield sse_event({'type': 'search_complete', 'results_count': 0})
             
-            # Apply personalization to prompt
-            personalized_prompt = apply_personalization(NOVAX_SYSTEM_PROMPT, user_settings)
-            
-            # Add user memory to personalized prompt
-            if user_memory_context:
-                personalized_prompt += user_memory_context
+            # Personalized system prompt with user memory, cached per user
+            personalized_prompt = await prefix_task
             
             # Add CEO/founder context if relevant
             ceo_context = ""
-            if is_ceo_founder_query(request.message):
+            if classification.is_ceo_query:
                 ceo_context = f"\n\nCEO/FOUNDER INFORMATION:\n"
                 ceo_context += f"🏢 CEO & Founder: Rishav Kumar Jha\n"
                 ceo_context += f"🚀 Company: NovaX Technologies\n"
@@ -1610,19 +2054,10 @@ async def chat_stream(request: ChatRequest):
                 context_parts.append(f"CEO Context:{ceo_context}")
             
             # Add file context if files are provided
-            file_context = ""
-            if hasattr(request, 'files') and request.files:
-                file_context = "\n\nUploaded Files Context:\n"
-                for i, file_content in enumerate(request.files):
-                    file_context += f"File {i+1}: {file_content[:2000]}...\n\n"
-                context_parts.append(f"File Context:{file_context}")
-            
-            # Add file context if files are provided
-            file_context = ""
-            if hasattr(request, 'files') and request.files:
-                file_context = "\n\nUploaded Files Context:\n"
-                for i, file_content in enumerate(request.files):
-                    file_context += f"File {i+1}: {file_content[:2000]}...\n\n"
+            if request.files:
+                file_context = "\n\nUploaded Files Context:\n" + "".join(
+                    f"File {i+1}: {file_content[:2000]}...\n\n" for i, file_content in enumerate(request.files)
+                )
                 context_parts.append(f"File Context:{file_context}")
             
             # Add current chat context
@@ -1637,7 +2072,7 @@ async def chat_stream(request: ChatRequest):
             
             # Always add cross-session memory (like ChatGPT)
             try:
-                all_user_chats = await database.get_all_user_messages(user_id)
+                all_user_chats = await memory_task
                 if all_user_chats:
                     # Get messages from other chats (exclude current chat)
                     other_chats = [msg for msg in all_user_chats if msg.get('chat_id') != chat_id]
@@ -1649,7 +2084,7 @@ async def chat_stream(request: ChatRequest):
                             memory_context += f"Assistant: {msg.get('response', '')[:80]}\n\n"
                         context_parts.append(f"Cross-Session Memory:{memory_context}")
             except Exception as memory_error:
-                print(f"Cross-session memory error: {memory_error}")
+                logger.error("Cross-session memory error: %s", memory_error)
             
             context_str = "\n\n".join(context_parts) if context_parts else ""
             
@@ -1661,251 +2096,143 @@ async def chat_stream(request: ChatRequest):
                 context_instruction = "\n\nIMPORTANT: User wants to continue from previous conversation. Reference the recent chat context and continue the discussion.\n"
             
             # Force datetime context for time/date queries - ALWAYS provide real datetime
-            if is_time_date_query(request.message):
-                datetime_info = get_current_datetime_info()
-                datetime_context = f"\n\n=== MANDATORY REAL-TIME INFORMATION ===\n"
-                datetime_context += f"📅 TODAY'S ACTUAL DATE: {datetime_info['current_date']}\n"
-                datetime_context += f"🕐 CURRENT ACTUAL UTC TIME: {datetime_info['current_time_utc']}\n"
-                datetime_context += f"📆 CURRENT ACTUAL YEAR: {datetime_info['year']}\n"
-                datetime_context += f"📅 DAY OF WEEK: {datetime_info['day_of_week']}\n"
-                datetime_context += f"📅 MONTH: {datetime_info['month']}\n"
-                datetime_context += f"\n🚨 CRITICAL INSTRUCTION: You MUST use ONLY the above real date/time information. Do NOT generate any other dates. The user is asking for the ACTUAL current date/time, so respond with the EXACT information provided above.\n"
-                datetime_context += f"=== END MANDATORY INFORMATION ===\n"
+            if classification.is_time_query:
+                datetime_context = build_datetime_block(get_current_datetime_info(), mandatory=True)
                 context_str = f"Real-time Context:{datetime_context}\n\n{context_str}" if context_str else f"Real-time Context:{datetime_context}"
-            
-            if complexity_analysis['complexity'] == 'simple':
-                # Simple responses with NovaX style
-                if is_time_date_query(request.message):
-                    datetime_info = get_current_datetime_info()
-                    full_prompt = f"""{personalized_prompt}
-
-{context_str}{context_instruction}
-
-IMPORTANT: User is asking for current date/time. You MUST respond with this EXACT information:
-TODAY'S DATE: {datetime_info['current_date']}
-CURRENT TIME: {datetime_info['current_time_utc']}
-YEAR: {datetime_info['year']}
-
-Do NOT generate any other dates. Use ONLY the above real information.
-
-For simple queries, respond in NovaX style:
-- Start with a friendly emoji intro (⚡, 🚀, or 💫)
-- Give the EXACT date/time from above
-- Keep it warm and professional
-
-User: {request.message}
-
-NovaX AI:"""
+            
+            if complexity_analysis['complexity'] == 'simple':
+                # Simple responses with NovaX style
+                if classification.is_time_query:
+                    instructions = TIME_QUERY_INSTRUCTIONS.format_map(get_current_datetime_info())
                 else:
-                    full_prompt = f"""{personalized_prompt}
-
-{context_str}{context_instruction}
-
-For simple queries, respond in NovaX style:
-- Start with a friendly emoji intro (⚡, 🚀, or 💫)
-- Give a direct, clear answer (1-2 sentences)
-- Keep it warm and professional
-
-User: {request.message}
-
-NovaX AI:"""
+                    instructions = SIMPLE_INSTRUCTIONS
             elif complexity_analysis['needs_thinking']:
                 # Show thinking process for complex queries
-                thinking_instruction = ""
                 if complexity_analysis['reasoning_depth'] == 'deep':
-                    thinking_instruction = """Use the full NovaX structured format with perfect formatting:
-1. Start with a NovaX intro line with emoji (🧠 Analyzing... or 🚀 Let's solve...)
-2. Use structured sections with emojis (🧠 Explanation, 📌 Steps, 🔧 Code, etc.)
-3. Keep paragraphs short (2-3 lines max)
-4. Use **bold** for key points, *italics* for emphasis
-5. Use ✅ for allowed/good things, ❌ for not allowed/bad things
-6. Use numbered emojis (1️⃣ 2️⃣) for step sequences
-7. Use bullet points with emojis for lists
-8. End with a helpful offer"""
+                    instructions = DEEP_THINKING_INSTRUCTIONS
                 else:
-                    thinking_instruction = """Use NovaX structured format:
-1. Start with an emoji intro line (⚡ or 🚀)
-2. Organize with clear sections and emojis
-3. Use ✅ for good/allowed, ❌ for bad/not allowed
-4. Keep paragraphs short (2-3 lines max)
-5. Use **bold** for key points
-6. Keep it readable and well-formatted
-7. End with a helpful suggestion"""
-                
-                # Send thinking phase
-                thinking_steps = [
-                    "🧠 Analyzing your request…",
-                    "🔍 Identifying the best solution…", 
-                    "📊 Evaluating different approaches…",
-                    "⚙️ Considering best practices…",
-                    "🚀 Formulating comprehensive response…"
-                ]
-                
-                yield f"data: {json.dumps({'type': 'thinking_start'})}\n\n"
-                
-                for i, step in enumerate(thinking_steps):
-                    yield f"data: {json.dumps({'type': 'thinking_step', 'step': step, 'index': i})}\n\n"
-                    await asyncio.sleep(0.3)  # Small delay for better UX
+                    instructions = THINKING_INSTRUCTIONS
                 
-                yield f"data: {json.dumps({'type': 'thinking_end'})}\n\n"
-                
-                full_prompt = f"""{personalized_prompt}
-
-{context_str}{context_instruction}
-
-{thinking_instruction}
-
-User: {request.message}
-
-NovaX AI:"""
+                # Emit the whole thinking phase in one flush; pacing is left to the client
+                yield sse_frames(
+                    {'type': 'thinking_start'},
+                    *({'type': 'thinking_step', 'step': step, 'index': i}
+                      for i, step in enumerate(THINKING_STEPS)),
+                    {'type': 'thinking_end'},
+                )
             else:
                 # Standard NovaX response for medium complexity
-                full_prompt = f"""{personalized_prompt}
-
-{context_str}{context_instruction}
-
-Use NovaX structured format:
-- Start with emoji intro line (⚡ or 🚀)
-- Organize with clear sections and emojis
-- Keep it readable and well-formatted
-- End with helpful suggestion
-
-User: {request.message}
-
-NovaX AI:"""
+                instructions = STREAM_STANDARD_INSTRUCTIONS
+            
+            full_prompt = assemble_prompt(personalized_prompt, context_str, context_instruction, instructions, request.message)
             
             # Handle image files with vision model for streaming
-            has_images = any(isinstance(f, str) and len(f) > 10000 for f in (request.files or []))
+            images_b64 = image_uploads(request.files)
+            has_images = bool(images_b64)
             
             # Add response length control to prompt
             length_control = "\n\nCRITICAL: Keep your response concise and focused. Avoid extremely long responses that may cause processing issues. Maximum 800 words."
             full_prompt += length_control
             
-            if has_images:
+            # Hold an admission slot until the whole stream has been sent
+            async with request_admission:
+                # Images and text both stream through the key pool when it is configured
+                contents = [full_prompt, *await decode_images(images_b64)] if has_images else full_prompt
                 try:
-                    vision_model = genai.GenerativeModel('gemini-2.5-flash')
-                    content_parts = [full_prompt]
-                    
-                    for file_content in (request.files or []):
-                        if isinstance(file_content, str) and len(file_content) > 10000:
-                            import base64
-                            try:
-                                image_data = base64.b64decode(file_content)
-                                from PIL import Image
-                                import io
-                                img = Image.open(io.BytesIO(image_data))
-                                content_parts.append(img)
-                            except Exception as img_error:
-                                print(f"Image processing error: {img_error}")
-                                continue
-                    
-                    response = vision_model.generate_content(content_parts, stream=True)
-                except Exception as vision_error:
-                    print(f"Vision model error: {vision_error}")
-                    response = model.generate_content(full_prompt + "\n\nNote: Image analysis unavailable, but I can help with your request.", stream=True)
-            else:
-                # Fast parallel streaming with semaphore control
-                async with request_semaphore:
                     if use_pool:
-                        try:
-                            pool = get_gemini_pool()
-                            response = await pool.generate_content_stream_with_retry(full_prompt)
-                        except Exception as pool_error:
-                            print(f"Pool error, falling back: {pool_error}")
-                            response = await asyncio.get_event_loop().run_in_executor(
-                                executor, lambda: genai.GenerativeModel('gemini-2.5-flash').generate_content(full_prompt, stream=True)
-                            )
+                        response = await get_gemini_pool().generate_content_stream_with_retry(contents)
                     else:
-                        response = await asyncio.get_event_loop().run_in_executor(
-                            executor, lambda: genai.GenerativeModel('gemini-2.5-flash').generate_content(full_prompt, stream=True)
-                        )
-            
-            yield f"data: {json.dumps({'type': 'response_start'})}\n\n"
-            
-            full_response = ""
-            response_length = 0
-            max_response_length = 50000  # Reduced to 50k characters for better performance
-            chunk_count = 0
-            max_chunks = 1000  # Reduced chunk limit
-            word_count = 0
-            max_words = 8000  # Maximum words to prevent extremely long responses
-            
-            try:
-                for chunk in response:
-                    if chunk.text:
-                        chunk_count += 1
-                        
-                        # Filter response to ensure brand safety (HTML entities handled in filter)
-                        try:
-                            filtered_chunk = filter_brand_unsafe_content(chunk.text)
-                            
-                            # Check length limits before processing
-                            if (response_length + len(filtered_chunk) > max_response_length or 
-                                chunk_count > max_chunks or 
-                                word_count > max_words):
-                                truncation_msg = "\n\n[Response optimized for length. Ask for specific details if needed!]"
-                                yield f"data: {json.dumps({'type': 'response_chunk', 'content': truncation_msg})}\n\n"
-                                break
-                            
-                            full_response += filtered_chunk
-                            response_length += len(filtered_chunk)
-                            
-                            # Send words individually for ChatGPT-like streaming
-                            words = filtered_chunk.split(' ')
-                            for word in words:
-                                if word.strip():
-                                    word_count += 1
-                                    if word_count > max_words:
-                                        break
-                                    try:
-                                        yield f"data: {json.dumps({'type': 'response_chunk', 'content': word + ' '})}\n\n"
-                                        await asyncio.sleep(0.03)  # Reduced delay for faster streaming
-                                    except Exception as chunk_error:
-                                        print(f"Word streaming error (skipping): {chunk_error}")
-                                        continue
-                                    
-                        except Exception as filter_error:
-                            print(f"Filtering error (skipping chunk): {filter_error}")
-                            continue
+                        response = await model.generate_content_async(contents, stream=True)
+                except Exception as model_error:
+                    if has_images:
+                        logger.error("Vision model error: %s", model_error)
+                        response = await model.generate_content_async(full_prompt + "\n\nNote: Image analysis unavailable, but I can help with your request.", stream=True)
+                    elif use_pool:
+                        logger.warning("Pool error, falling back: %s", model_error)
+                        response = await model.generate_content_async(full_prompt, stream=True)
+                    else:
+                        raise
+                
+                yield sse_event({'type': 'response_start'})
+                
+                response_parts = []  # Joined once after the stream ends
+                response_length = 0
+                max_response_length = 50000  # Reduced to 50k characters for better performance
+                chunk_count = 0
+                max_chunks = 1000  # Reduced chunk limit
+                word_count = 0
+                max_words = 8000  # Maximum words to prevent extremely long responses
+                brand_stream = BrandSafeStream()
+                
+                try:
+                    async for chunk in with_end_marker(response):
+                        # A trailing None flushes the text held back by the filter
+                        text = chunk.text if chunk is not None else None
+                        if text or chunk is None:
+                            chunk_count += 1
                             
-            except Exception as response_error:
-                print(f"Response iteration error: {response_error}")
-                # Provide a cleaner error message
-                error_msg = "\n\n[Response processing completed. Feel free to ask follow-up questions!]"
-                yield f"data: {json.dumps({'type': 'response_chunk', 'content': error_msg})}\n\n"
+                            # Filter response to ensure brand safety (HTML entities handled in filter)
+                            try:
+                                filtered_chunk = brand_stream.feed(text) if text else brand_stream.flush()
+                                if not filtered_chunk:
+                                    continue
+                                
+                                # Check length limits before processing
+                                if (response_length + len(filtered_chunk) > max_response_length or 
+                                    chunk_count > max_chunks or 
+                                    word_count > max_words):
+                                    truncation_msg = "\n\n[Response optimized for length. Ask for specific details if needed!]"
+                                    yield sse_event({'type': 'response_chunk', 'content': truncation_msg})
+                                    break
+                                
+                                # NovaX intro goes on the first chunk, so the client and the
+                                # saved message get the same text
+                                if not response_parts:
+                                    filtered_chunk = format_novax_response(filtered_chunk, complexity_analysis, agent_type)
+                                
+                                response_parts.append(filtered_chunk)
+                                response_length += len(filtered_chunk)
+                                word_count += len(filtered_chunk.split())
+                                
+                                # Forward each upstream chunk as it arrives
+                                yield sse_event({'type': 'response_chunk', 'content': filtered_chunk})
+                                        
+                            except Exception as filter_error:
+                                logger.warning("Filtering error (skipping chunk): %s", filter_error)
+                                continue
+                                
+                except Exception as response_error:
+                    logger.error("Response iteration error: %s", response_error)
+                    # Provide a cleaner error message
+                    error_msg = "\n\n[Response processing completed. Feel free to ask follow-up questions!]"
+                    yield sse_event({'type': 'response_chunk', 'content': error_msg})
             
-            # Apply NovaX formatting to the complete response
-            full_response = format_novax_response(full_response, complexity_analysis, agent_type)
+            # Already formatted as it streamed
+            full_response = "".join(response_parts)
             
             # Add citations if search was performed
             if citations:
                 citation_text = "\n\n**Sources:**\n" + "\n".join(citations)
                 full_response += citation_text
-                yield f"data: {json.dumps({'type': 'response_chunk', 'content': citation_text})}\n\n"
+                yield sse_event({'type': 'response_chunk', 'content': citation_text})
             
             # Generate helpful suggestions
             suggestions = generate_suggestions(request.message, agent_type)
             if agent_type == 'NovaX Explorer':
                 suggestions.extend(["Search for more details?", "Get latest updates?"])
             
-            # Save message to database
-            await database.save_message(user_id, chat_id, request.message, full_response, agent_type)
-            
-            # Update user memory from conversation
-            await database.update_user_memory_from_conversation(user_id, request.message, full_response)
-            
-            # Update chat title if it's still "New Chat"
-            await database.update_chat_title_if_new(chat_id, request.message)
-            
             # Send final metadata
-            yield f"data: {json.dumps({'type': 'response_end', 'suggestions': suggestions})}\n\n"
+            yield sse_event({'type': 'response_end', 'suggestions': suggestions})
+            
+            # Save the message, update user memory and the chat title off the stream
+            spawn_background(database.finalize_turn(user_id, chat_id, request.message, full_response, agent_type, update_memory=True))
             
         except Exception as e:
             error_str = str(e).lower()
             
             # For rate limiting errors, try to handle silently by switching keys
             if "rate" in error_str or "quota" in error_str:
-                print(f"Rate limiting detected, attempting automatic recovery: {str(e)}")
+                logger.warning("Rate limiting detected, attempting automatic recovery: %s", e)
                 # Don't send error to frontend for rate limiting - let pool handle it
                 try:
                     # Try one more time with a different approach
@@ -1915,12 +2242,14 @@ NovaX AI:"""
                         await asyncio.sleep(1)  # Brief pause
                         response_text = await pool.generate_content_with_retry(full_prompt, max_retries=1)
                         if response_text:
-                            yield f"data: {json.dumps({'type': 'response_start'})}\n\n"
-                            yield f"data: {json.dumps({'type': 'response_chunk', 'content': response_text})}\n\n"
-                            yield f"data: {json.dumps({'type': 'response_end', 'suggestions': suggestions})}\n\n"
+                            yield sse_frames(
+                                {'type': 'response_start'},
+                                {'type': 'response_chunk', 'content': response_text},
+                                {'type': 'response_end', 'suggestions': suggestions},
+                            )
                             return
                 except Exception as retry_error:
-                    print(f"Retry after rate limit also failed: {retry_error}")
+                    logger.error("Retry after rate limit also failed: %s", retry_error)
                 
                 # If all retries fail, show a user-friendly message
                 error_message = "I'm experiencing high demand right now. Please try again in a moment."
@@ -1939,16 +2268,19 @@ NovaX AI:"""
                 else:
                     error_message = "I encountered an issue processing your request. Please try again."
             
-            print(f"Stream error: {str(e)}")
-            yield f"data: {json.dumps({'type': 'error', 'message': error_message})}\n\n"
+            logger.error("Stream error: %s", e)
+            yield sse_event({'type': 'error', 'message': error_message})
+        finally:
+            for task in prefetch_tasks:
+                if not task.done():
+                    task.cancel()
     
     return StreamingResponse(
         generate_stream(),
-        media_type="text/plain",
+        media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Content-Type": "text/event-stream"
+            "Connection": "keep-alive"
         }
     )
 
@@ -1986,14 +2318,7 @@ async def upload_files(files: List[UploadFile] = File(...), token: str = Form(..
     """Handle file uploads and return file analysis"""
     try:
         # Verify token
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         uploaded_files = []
         for file in files:
@@ -2015,7 +2340,6 @@ async def upload_files(files: List[UploadFile] = File(...), token: str = Form(..
                 except:
                     file_info["content"] = "[Binary file - content not readable]"
             elif file.content_type.startswith('image/'):
-                import base64
                 file_info["content"] = base64.b64encode(content).decode('utf-8')
                 file_info["mime_type"] = file.content_type
             elif file.filename.endswith('.zip'):
@@ -2045,14 +2369,7 @@ async def upload_files(files: List[UploadFile] = File(...), token: str = Form(..
 async def get_user_analytics(range: str = "7d", token: str = None):
     """Get user analytics data"""
     try:
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         analytics_service = get_analytics_service()
         analytics = await analytics_service.get_user_analytics(user_id, range)
@@ -2066,14 +2383,7 @@ async def get_user_analytics(range: str = "7d", token: str = None):
 async def export_analytics(range: str = "30d", token: str = None):
     """Export analytics data as CSV"""
     try:
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         analytics_service = get_analytics_service()
         csv_data = await analytics_service.export_analytics_csv(user_id, range)
@@ -2124,6 +2434,31 @@ async def text_to_speech(request: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/voice/text-to-speech/stream")
+async def text_to_speech_stream(request: dict):
+    """Stream speech as raw MP3 while it is synthesized, without base64 or JSON"""
+    text = request.get('text', '')
+    if not text:
+        raise HTTPException(status_code=400, detail="Text is required")
+    
+    chunks = get_voice_service().text_to_speech_stream(text, request.get('language', 'en'), request.get('voice_speed', 1.0))
+    try:
+        # Synthesis errors surface before any audio is sent
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = b""
+    except ValueError as e:  # Unsupported language
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def audio():
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+    
+    return StreamingResponse(audio(), media_type="audio/mpeg")
+
 @app.post("/api/voice/live-recognition")
 async def live_speech_recognition(request: dict):
     """Perform live speech recognition"""
@@ -2163,13 +2498,7 @@ async def create_workspace(request: dict):
         name = request.get("name")
         description = request.get("description", "")
         
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception:
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         workspace_id = await database.create_workspace(user_id, name, description)
         return {"success": True, "workspace_id": workspace_id}
@@ -2179,13 +2508,7 @@ async def create_workspace(request: dict):
 @app.get("/api/workspaces/{user_token}")
 async def get_workspaces(user_token: str):
     try:
-        user_id = "demo_user"
-        if firebase_initialized and user_token:
-            try:
-                decoded_token = auth.verify_id_token(user_token)
-                user_id = decoded_token['uid']
-            except Exception:
-                user_id = "demo_user"
+        user_id = await resolve_user_id(user_token)
         
         workspaces = await database.get_user_workspaces(user_id)
         return {"workspaces": workspaces}
@@ -2198,13 +2521,7 @@ async def export_chat(chat_id: str, request: dict):
         token = request.get("token")
         format_type = request.get("format", "markdown")
         
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception:
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         if format_type == "pdf":
             content = await database.export_chat_pdf(chat_id, user_id)
@@ -2226,56 +2543,85 @@ async def export_chat(chat_id: str, request: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class TextResponse(NamedTuple):
+    """Stands in for a model response when only the text is at hand (cache or key pool)"""
+    text: str
+
+async def cached_explorer_search(query: str) -> Dict:
+    """Search context and citations for an Explorer query, served from the search cache when possible"""
+    cached_search = await get_cached_search(query)
+    if cached_search:
+        return cached_search
+    
+    search_results = await novax_search.search(query, 5)
+    if not search_results["results"]:
+        return {'context': '', 'citations': []}
+    
+    result = {
+        'context': novax_search.format_search_context(search_results, query),
+        'citations': novax_search.generate_citations(search_results)
+    }
+    await cache_search_results(query, result)
+    return result
+
 async def chat(request: ChatRequest):
     try:
         # Verify Firebase token only if Firebase is initialized
-        user_id = "demo_user"  # Default fallback
-        if firebase_initialized and request.token:
-            try:
-                decoded_token = auth.verify_id_token(request.token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
-                # Continue with demo_user instead of failing
-                user_id = "demo_user"
+        user_id = await resolve_user_id(request.token)
         
         # Get or create chat session
         chat_id = request.chat_id
         if not chat_id:
             chat_id = await database.create_chat_session(user_id)
         
-        # Get chat history for context analysis
-        chat_history = await database.get_chat_messages(chat_id)
+        # Normalize the message once for every classifier below
+        message = normalize_message(request.message)
+        
+        # Bare greetings get a canned reply before any history/settings work
+        canned_reply = get_canned_reply(message)
+        if canned_reply and not request.files:
+            spawn_background(database.finalize_turn(user_id, chat_id, request.message, canned_reply, 'NovaX Assistant'))
+            
+            return ChatResponse(
+                response=canned_reply,
+                agent_type='NovaX Assistant',
+                suggestions=generate_suggestions(request.message, 'NovaX Assistant'),
+                chat_id=chat_id
+            )
+        
+        # Recent chat history and user settings are independent reads, fetch them together
+        chat_history, user_settings = await asyncio.gather(
+            database.get_recent_chat_messages(chat_id, limit=3),
+            database.get_user_settings(user_id)
+        )
         
         # Analyze topic relevance
-        topic_analysis = analyze_topic_relevance(request.message, chat_history)
+        topic_analysis = analyze_topic_relevance(message, chat_history)
         
-        # Get user settings
-        user_settings = await database.get_user_settings(user_id)
+        # Apply per-request settings overrides
         if request.settings:
             user_settings.update(request.settings.dict(exclude_unset=True))
         
-        # Analyze query complexity for automatic thinking depth
-        complexity_analysis = analyze_query_complexity(request.message)
-        
-        # Detect appropriate NovaX AI agent
-        agent_type = detect_user_intent(request.message)
+        # Classify the message once: complexity (automatic thinking depth),
+        # NovaX AI agent, and time/date, image and CEO signals
+        classification = classify_message(message)
+        complexity_analysis = classification.complexity._asdict()
+        agent_type = classification.agent_type
         
         # Check if this is a simple greeting
         is_greeting = complexity_analysis['complexity'] == 'simple'
         
         # DIRECT DATE/TIME RESPONSE - bypass AI for accuracy
-        if is_time_date_query(request.message):
-            print(f"DEBUG: Direct date/time response triggered for: {request.message}")
+        if classification.is_time_query:
+            logger.debug("Direct date/time response triggered for: %s", request.message)
             datetime_info = get_current_datetime_info()
             ist_time = datetime_info['timezones']['IST']
             direct_response = f"⚡ Here's today's date and time:\n\n📅 Current Date Today's date is {datetime_info['current_date']}.\n🕐 Indian Time {ist_time}\n🌍 UTC Time {datetime_info['current_time_utc']}\n\nNeed any other information about this date?"
             
-            print(f"DEBUG: Returning direct response: {direct_response[:100]}...")
+            logger.debug("Returning direct response: %s...", direct_response[:100])
             
-            # Save and return immediately
-            await database.save_message(user_id, chat_id, request.message, direct_response, 'NovaX Assistant')
-            await database.update_chat_title_if_new(chat_id, request.message)
+            # Save in the background and return immediately
+            spawn_background(database.finalize_turn(user_id, chat_id, request.message, direct_response, 'NovaX Assistant'))
             
             return ChatResponse(
                 response=direct_response,
@@ -2284,6 +2630,14 @@ async def chat(request: ChatRequest):
                 chat_id=chat_id
             )
         
+        # Start the prompt prefix, Explorer web search and cross-session history
+        # reads now so they overlap with image handling
+        prefix_task = asyncio.create_task(get_prompt_prefix(user_id, user_settings))
+        search_task = None
+        if agent_type == 'NovaX Explorer' and not is_greeting:
+            search_task = asyncio.create_task(cached_explorer_search(request.message))
+        memory_task = asyncio.create_task(database.get_all_user_messages(user_id))
+        
         # Handle image generation, real-time queries and time/date requests
         generated_image = None
         search_context = ""
@@ -2291,54 +2645,28 @@ async def chat(request: ChatRequest):
         citations = []
         
         # Check for image generation request
-        if is_image_generation_query(request.message):
+        if classification.is_image_query:
             # Enhance prompt using NovaX Nano
             enhanced_prompt = await enhance_image_prompt(request.message)
             generated_image = await image_generator.generate_image(enhanced_prompt)
         
         # Always provide datetime context for time/date queries or Explorer agent
-        if is_time_date_query(request.message) or (agent_type == 'NovaX Explorer' and not is_greeting):
+        if classification.is_time_query or (agent_type == 'NovaX Explorer' and not is_greeting):
             # Get current date/time information
-            datetime_info = get_current_datetime_info()
-            datetime_context = f"\n\nCurrent Real-time Information:\n"
-            datetime_context += f"📅 Date: {datetime_info['current_date']}\n"
-            datetime_context += f"🕐 UTC Time: {datetime_info['current_time_utc']}\n"
-            datetime_context += f"🌍 Timezones:\n"
-            for tz, time_str in datetime_info['timezones'].items():
-                datetime_context += f"   {tz}: {time_str}\n"
+            datetime_context = build_datetime_block(get_current_datetime_info())
         
         # Perform web search for Explorer agent (not for direct time/date queries)
-        if agent_type == 'NovaX Explorer' and not is_greeting and not is_time_date_query(request.message):
-            # Check cache first
-            cached_search = await get_cached_search(request.message)
-            if cached_search:
-                search_context = cached_search.get('context', '')
-                citations = cached_search.get('citations', [])
-            else:
-                # Perform web search for additional context
-                search_results = await novax_search.search(request.message, 5)
-                if search_results["results"]:
-                    search_context = novax_search.format_search_context(search_results, request.message)
-                    citations = novax_search.generate_citations(search_results)
-                    # Cache results
-                    await cache_search_results(request.message, {
-                        'context': search_context,
-                        'citations': citations
-                    })
-        
-        # Get user memory for persistent context
-        user_memory_context = await database.get_user_context_for_ai(user_id)
-        
-        # Apply personalization to prompt
-        personalized_prompt = apply_personalization(NOVAX_SYSTEM_PROMPT, user_settings)
+        if agent_type == 'NovaX Explorer' and not is_greeting and not classification.is_time_query:
+            explorer_search = await search_task
+            search_context = explorer_search.get('context', '')
+            citations = explorer_search.get('citations', [])
         
-        # Add user memory to personalized prompt
-        if user_memory_context:
-            personalized_prompt += user_memory_context
+        # Personalized system prompt with user memory, cached per user
+        personalized_prompt = await prefix_task
         
         # Add CEO/founder context if relevant
         ceo_context = ""
-        if is_ceo_founder_query(request.message):
+        if classification.is_ceo_query:
             ceo_context = f"\n\nCEO/FOUNDER INFORMATION:\n"
             ceo_context += f"🏢 CEO & Founder: Rishav Kumar Jha\n"
             ceo_context += f"🚀 Company: NovaX Technologies\n"
@@ -2367,7 +2695,7 @@ async def chat(request: ChatRequest):
         
         # Always add cross-session memory (like ChatGPT)
         try:
-            all_user_chats = await database.get_all_user_messages(user_id)
+            all_user_chats = await memory_task
             if all_user_chats:
                 # Get messages from other chats (exclude current chat)
                 other_chats = [msg for msg in all_user_chats if msg.get('chat_id') != chat_id]
@@ -2379,7 +2707,7 @@ async def chat(request: ChatRequest):
                         memory_context += f"Assistant: {msg.get('response', '')[:80]}\n\n"
                     context_parts.append(f"Cross-Session Memory:{memory_context}")
         except Exception as memory_error:
-            print(f"Cross-session memory error: {memory_error}")
+            logger.error("Cross-session memory error: %s", memory_error)
         
         context_str = "\n\n".join(context_parts) if context_parts else ""
         
@@ -2391,189 +2719,72 @@ async def chat(request: ChatRequest):
             context_instruction = "\n\nIMPORTANT: User wants to continue from previous conversation. Reference the recent chat context and continue the discussion.\n"
         
         # Force datetime context for time/date queries - ALWAYS provide real datetime
-        if is_time_date_query(request.message):
-            datetime_info = get_current_datetime_info()
-            datetime_context = f"\n\n=== MANDATORY REAL-TIME INFORMATION ===\n"
-            datetime_context += f"📅 TODAY'S ACTUAL DATE: {datetime_info['current_date']}\n"
-            datetime_context += f"🕐 CURRENT ACTUAL UTC TIME: {datetime_info['current_time_utc']}\n"
-            datetime_context += f"📆 CURRENT ACTUAL YEAR: {datetime_info['year']}\n"
-            datetime_context += f"📅 DAY OF WEEK: {datetime_info['day_of_week']}\n"
-            datetime_context += f"📅 MONTH: {datetime_info['month']}\n"
-            datetime_context += f"\n🚨 CRITICAL INSTRUCTION: You MUST use ONLY the above real date/time information. Do NOT generate any other dates. The user is asking for the ACTUAL current date/time, so respond with the EXACT information provided above.\n"
-            datetime_context += f"=== END MANDATORY INFORMATION ===\n"
+        if classification.is_time_query:
+            datetime_context = build_datetime_block(get_current_datetime_info(), mandatory=True)
             context_str = f"Real-time Context:{datetime_context}\n\n{context_str}" if context_str else f"Real-time Context:{datetime_context}"
         
-        if complexity_analysis['complexity'] == 'simple':
-            # Simple responses with NovaX style
-            if is_time_date_query(request.message):
-                datetime_info = get_current_datetime_info()
-                full_prompt = f"""{personalized_prompt}
-
-{context_str}{context_instruction}
-
-IMPORTANT: User is asking for current date/time. You MUST respond with this EXACT information:
-TODAY'S DATE: {datetime_info['current_date']}
-CURRENT TIME: {datetime_info['current_time_utc']}
-YEAR: {datetime_info['year']}
-
-Do NOT generate any other dates. Use ONLY the above real information.
-
-For simple queries, respond in NovaX style:
-- Start with a friendly emoji intro (⚡, 🚀, or 💫)
-- Give the EXACT date/time from above
-- Keep it warm and professional
-
-User: {request.message}
-
-NovaX AI:"""
-            else:
-                full_prompt = f"""{personalized_prompt}
-
-{context_str}{context_instruction}
-
-For simple queries, respond in NovaX style:
-- Start with a friendly emoji intro (⚡, 🚀, or 💫)
-- Give a direct, clear answer (1-2 sentences)
-- Keep it warm and professional
-
-User: {request.message}
-
-NovaX AI:"""
-        elif complexity_analysis['complexity'] == 'high':
-            # Full NovaX structured format
-            full_prompt = f"""{personalized_prompt}
-
-{context_str}{context_instruction}
-
-Use the full NovaX structured format:
-1. Start with emoji intro line (⚡ or 🚀)
-2. Use structured sections with emojis:
-   - 🧠 Explanation
-   - 📌 Steps (if applicable)
-   - 🔧 Code (if applicable)
-   - 📊 Examples
-   - ⚠️ Notes
-   - 🎯 Summary
-3. Keep paragraphs short (2-3 lines max)
-4. Use **bold** for key points, *italics* for emphasis
-5. Use ✅ for allowed/good things, ❌ for not allowed/bad things
-6. Use numbered emojis (1️⃣ 2️⃣ 3️⃣) for sequences
-7. Use bullet points with emojis for features
-8. End with helpful offer
-
-User: {request.message}
-
-NovaX AI:"""
-        elif complexity_analysis['complexity'] == 'medium':
-            # Medium NovaX format
-            full_prompt = f"""{personalized_prompt}
-
-{context_str}{context_instruction}
-
-Use NovaX structured format:
-1. Start with emoji intro line (⚡ or 🚀)
-2. Organize with clear sections and emojis
-3. Use ✅ for good/allowed, ❌ for bad/not allowed
-4. Keep paragraphs short (2-3 lines max)
-5. Use **bold** for key points
-6. Provide clear explanation with brief reasoning
-7. End with helpful suggestion
-
-User: {request.message}
-
-NovaX AI:"""
+        if complexity_analysis['complexity'] == 'simple' and classification.is_time_query:
+            # Simple date/time answer pinned to the real date
+            instructions = TIME_QUERY_INSTRUCTIONS.format_map(get_current_datetime_info())
         else:
-            # Basic NovaX format
-            full_prompt = f"""{personalized_prompt}
-
-{context_str}{context_instruction}
-
-Respond in clean NovaX style:
-- Start with friendly emoji intro (⚡ or 🚀)
-- Give clear, helpful answer
-- Use proper formatting
-- Keep it professional but warm
-
-User: {request.message}
-
-NovaX AI:"""
+            # NovaX format matched to the complexity, basic style otherwise
+            instructions = CHAT_INSTRUCTIONS.get(complexity_analysis['complexity'], BASIC_INSTRUCTIONS)
+        
+        full_prompt = assemble_prompt(personalized_prompt, context_str, context_instruction, instructions, request.message)
         
         # Handle image files with vision model
-        has_images = any(isinstance(f, str) and len(f) > 10000 for f in (request.files or []))
+        images_b64 = image_uploads(request.files)
+        has_images = bool(images_b64)
         
         # Add response length control to prompt
         length_control = "\n\nCRITICAL: Keep your response concise and focused. Avoid extremely long responses that may cause processing issues. Maximum 800 words."
         full_prompt += length_control
         
         if has_images:
+            # Images go through the same admission control and key pool as text
+            content_parts = [full_prompt, *await decode_images(images_b64)]
             try:
-                vision_model = genai.GenerativeModel('gemini-2.5-flash')
-                content_parts = [full_prompt]
-                
-                for file_content in (request.files or []):
-                    if isinstance(file_content, str) and len(file_content) > 10000:
-                        import base64
-                        try:
-                            image_data = base64.b64decode(file_content)
-                            from PIL import Image
-                            import io
-                            img = Image.open(io.BytesIO(image_data))
-                            content_parts.append(img)
-                        except Exception as img_error:
-                            print(f"Image processing error: {img_error}")
-                            continue
-                
-                response = vision_model.generate_content(content_parts)
+                async with request_admission:
+                    if use_pool:
+                        response = TextResponse(await get_gemini_pool().generate_content_with_retry(content_parts))
+                    else:
+                        response = await model.generate_content_async(content_parts)
             except Exception as vision_error:
-                print(f"Vision model error: {vision_error}")
-                response = model.generate_content(full_prompt + "\n\nNote: Image analysis unavailable, but I can help with your request.")
+                logger.error("Vision model error: %s", vision_error)
+                response = await model.generate_content_async(full_prompt + "\n\nNote: Image analysis unavailable, but I can help with your request.")
         else:
-            # Check cache first for faster responses
-            cached_response = await get_cached_response(full_prompt)
+            # Check cache first for faster responses; the prompt is hashed once
+            # and the key reused for the lookup, request coalescing and the store
+            cache_key = response_cache_key(full_prompt)
+            cached_response = await response_cache.get(cache_key)
             if cached_response and not generated_image:
-                class MockResponse:
-                    def __init__(self, text):
-                        self.text = text
-                response = MockResponse(cached_response)
+                response = TextResponse(cached_response)
             else:
-                # Fast parallel processing with semaphore control
-                async with request_semaphore:
+                # Fast parallel processing with admission control
+                async with request_admission:
                     if use_pool:
                         try:
                             pool = get_gemini_pool()
-                            response_text = await pool.generate_content_with_retry(full_prompt)
-                            class MockResponse:
-                                def __init__(self, text):
-                                    self.text = text
-                            response = MockResponse(response_text)
-                        except Exception as pool_error:
-                            print(f"Pool error, falling back: {pool_error}")
-                            response = await asyncio.get_event_loop().run_in_executor(
-                                executor, lambda: genai.GenerativeModel('gemini-2.5-flash').generate_content(full_prompt)
+                            response_text = await gemini_flight.do(
+                                cache_key,
+                                lambda: pool.generate_content_with_retry(full_prompt)
                             )
+                            response = TextResponse(response_text)
+                        except Exception as pool_error:
+                            logger.warning("Pool error, falling back: %s", pool_error)
+                            response = await model.generate_content_async(full_prompt)
                     else:
-                        response = await asyncio.get_event_loop().run_in_executor(
-                            executor, lambda: genai.GenerativeModel('gemini-2.5-flash').generate_content(full_prompt)
-                        )
+                        response = await model.generate_content_async(full_prompt)
                 
                 # Cache the response for future use
                 if response.text and not generated_image:
-                    await cache_ai_response(full_prompt, response.text)
+                    await response_cache.set(cache_key, response.text)
         
         # Filter response to ensure brand safety (HTML entities handled in filter)
         filtered_response = filter_brand_unsafe_content(response.text)
         
         # Convert all URLs to clickable markdown links
-        import re
-        url_pattern = r'https?://[^\s]+'
-        urls = re.findall(url_pattern, filtered_response)
-        for url in urls:
-            if not f']({url})' in filtered_response:  # Avoid double conversion
-                # Extract domain for link text
-                domain = re.search(r'https?://([^/]+)', url)
-                if domain:
-                    link_text = domain.group(1).replace('www.', '')
-                    filtered_response = filtered_response.replace(url, f'[{link_text}]({url})')
+        filtered_response = linkify_urls(filtered_response)
         
         # Apply NovaX formatting if not already formatted
         filtered_response = format_novax_response(filtered_response, complexity_analysis, agent_type)
@@ -2593,15 +2804,9 @@ NovaX AI:"""
         if agent_type == 'NovaX Explorer':
             suggestions.extend(["Search for more details?", "Get latest updates?"])
         
-        # Save message to database
-        print(f"Saving message to chat {chat_id}: {request.message[:50]}...")
-        await database.save_message(user_id, chat_id, request.message, filtered_response, agent_type)
-        
-        # Update user memory from conversation
-        await database.update_user_memory_from_conversation(user_id, request.message, filtered_response)
-        
-        # Update chat title if it's still "New Chat"
-        await database.update_chat_title_if_new(chat_id, request.message)
+        # Save the message, update user memory and the chat title in the background
+        logger.debug("Saving message to chat %s: %s...", chat_id, request.message[:50])
+        spawn_background(database.finalize_turn(user_id, chat_id, request.message, filtered_response, agent_type, update_memory=True))
         
         return ChatResponse(
             response=filtered_response,
@@ -2611,25 +2816,15 @@ NovaX AI:"""
         )
     
     except Exception as e:
-        print(f"Chat error: {str(e)}")
+        logger.error("Chat error: %s", e)
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
-if __name__ == "__main__":
-    import uvicorn
-    start_cleanup_task()  # Start cache cleanup
-    uvicorn.run(app, host="0.0.0.0", port=8000)
 @app.delete("/api/workspace/{workspace_id}")
 async def delete_workspace(workspace_id: str, request: dict):
     try:
         token = request.get("token")
         
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception:
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         success = await database.delete_workspace(workspace_id, user_id)
         return {"success": success}
@@ -2643,13 +2838,7 @@ async def invite_to_workspace(request: dict):
         workspace_id = request.get("workspace_id")
         email = request.get("email")
         
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception:
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         success = await database.add_workspace_member(workspace_id, email)
         return {"success": success}
@@ -2670,16 +2859,10 @@ async def workspace_chat(workspace_id: str, request: dict):
         token = request.get("token")
         message = request.get("message")
         
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception:
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         # Generate AI response
-        response = model.generate_content(f"User in workspace: {message}")
+        response = await model.generate_content_async(f"User in workspace: {message}")
         
         # Save to workspace
         message_id = await database.save_workspace_message(workspace_id, user_id, message, response.text)
@@ -2707,13 +2890,7 @@ async def update_member_role(request: dict):
         user_email = request.get("user_email")
         role = request.get("role")
         
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception:
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         success = await database.update_member_role(workspace_id, user_email, role)
         return {"success": success}
@@ -2726,13 +2903,7 @@ async def create_public_share(request: dict):
         chat_id = request.get("chat_id")
         expires_in_days = request.get("expires_in_days", 7)
         
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception:
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         share_id = await database.create_public_share(chat_id, user_id, expires_in_days)
         return {"success": True, "share_id": share_id, "share_url": f"/public/{share_id}"}
@@ -2742,13 +2913,7 @@ async def create_public_share(request: dict):
 @app.get("/api/share/public/list/{user_token}")
 async def get_public_shares(user_token: str):
     try:
-        user_id = "demo_user"
-        if firebase_initialized and user_token:
-            try:
-                decoded_token = auth.verify_id_token(user_token)
-                user_id = decoded_token['uid']
-            except Exception:
-                user_id = "demo_user"
+        user_id = await resolve_user_id(user_token)
         
         shares = await database.get_public_shares(user_id)
         return {"shares": shares}
@@ -2798,11 +2963,11 @@ async def setup_2fa(request: dict):
         
         if firebase_initialized and token:
             try:
-                decoded_token = auth.verify_id_token(token)
+                decoded_token = await verify_token(token)
                 user_id = decoded_token['uid']
                 user_email = decoded_token.get('email', f"user-{user_id[:8]}@novax.ai")
             except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
+                logger.warning("Token validation failed: %s", token_error)
                 user_id = "demo_user"
         
         # Generate secret
@@ -2843,14 +3008,7 @@ async def verify_2fa(request: dict):
         token = request.get("token")
         code = request.get("code")
         
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         # Get user's 2FA status
         fa_status = await database.get_2fa_status(user_id)
@@ -2877,14 +3035,7 @@ async def enable_2fa(request: dict):
         token = request.get("token")
         code = request.get("code")
         
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         # Get user's 2FA status
         fa_status = await database.get_2fa_status(user_id)
@@ -2917,14 +3068,7 @@ async def disable_2fa(request: dict):
         token = request.get("token")
         code = request.get("code")
         
-        user_id = "demo_user"
-        if firebase_initialized and token:
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(token)
         
         # Get user's 2FA status
         fa_status = await database.get_2fa_status(user_id)
@@ -2954,14 +3098,7 @@ async def disable_2fa(request: dict):
 async def get_2fa_status(user_token: str):
     """Get 2FA status for user"""
     try:
-        user_id = "demo_user"
-        if firebase_initialized and user_token:
-            try:
-                decoded_token = auth.verify_id_token(user_token)
-                user_id = decoded_token['uid']
-            except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
-                user_id = "demo_user"
+        user_id = await resolve_user_id(user_token)
         
         fa_status = await database.get_2fa_status(user_id)
         
@@ -2982,10 +3119,10 @@ async def verify_login_2fa(request: dict):
         user_id = "demo_user"
         if firebase_initialized and token:
             try:
-                decoded_token = auth.verify_id_token(token)
+                decoded_token = await verify_token(token)
                 user_id = decoded_token['uid']
             except Exception as token_error:
-                print(f"Token validation failed: {token_error}")
+                logger.warning("Token validation failed: %s", token_error)
                 raise HTTPException(status_code=401, detail="Invalid token")
         
         # Get user's 2FA status
@@ -3054,7 +3191,7 @@ async def forgot_password(request: dict):
                 detail="No account found with this email address. Please sign up first."
             )
         except Exception as firebase_error:
-            print(f"Firebase password reset error: {firebase_error}")
+            logger.error("Firebase password reset error: %s", firebase_error)
             raise HTTPException(
                 status_code=500, 
                 detail="Failed to send password reset email. Please try again."
@@ -3063,6 +3200,11 @@ async def forgot_password(request: dict):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Forgot password error: {e}")
+        logger.error("Forgot password error: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
+if __name__ == "__main__":
+    import importlib.util
+    import uvicorn
+    # uvloop ships with uvicorn[standard]; plain asyncio where it is unavailable (Windows)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio")
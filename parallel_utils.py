@@ -4,54 +4,208 @@ Optimized for free hosting environments like Render
 """
 
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Callable, Any
+import functools
+import logging
+import os
+import warnings
+import anyio.to_thread
+from dataclasses import dataclass
+from typing import List, Callable, Any, Dict, Awaitable, Optional, Set
 import time
 
+class TokenBucket:
+    """Allows `capacity` operations per `period` seconds, refilled continuously"""
+    
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+    
+    def available(self) -> float:
+        """Refill for the time elapsed and return the tokens on hand"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+    
+    def try_take(self) -> bool:
+        """Take one token if there is one, without waiting"""
+        if self.available() >= 1:
+            self.tokens -= 1
+            return True
+        return False
+    
+    async def acquire(self) -> None:
+        """Wait until a token is available, then take it"""
+        while not self.try_take():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+@dataclass
+class BatchResult:
+    """Outcome of a parallel run: results in task order, failures in place as exceptions"""
+    results: List[Any]
+    
+    @property
+    def successes(self) -> List[Any]:
+        return [r for r in self.results if not isinstance(r, Exception)]
+    
+    @property
+    def errors(self) -> List[Exception]:
+        return [r for r in self.results if isinstance(r, Exception)]
+
 class FastParallelProcessor:
-    """Lightweight parallel processor for concurrent operations"""
+    """Lightweight parallel processor for concurrent I/O-bound coroutines"""
     
-    def __init__(self, max_workers: int = 4):
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
-        self.semaphore = asyncio.Semaphore(10)
+    def __init__(self, max_concurrency: int = 10, rate_limit: Optional[TokenBucket] = None):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.rate_limit = rate_limit
     
-    async def run_parallel(self, tasks: List[Callable], *args, **kwargs) -> List[Any]:
-        """Run multiple tasks in parallel with semaphore control"""
+    async def run_parallel(self, tasks: List[Callable[..., Awaitable[Any]]], *args, **kwargs) -> BatchResult:
+        """Await coroutine factories concurrently on the event loop with semaphore control
+        (and rate control when a token bucket is set); one failure never discards the others"""
         async def run_task(task):
             async with self.semaphore:
-                return await asyncio.get_event_loop().run_in_executor(
-                    self.executor, task, *args, **kwargs
-                )
+                if self.rate_limit is not None:
+                    await self.rate_limit.acquire()
+                return await task(*args, **kwargs)
         
-        return await asyncio.gather(*[run_task(task) for task in tasks])
-    
-    async def batch_process(self, items: List[Any], processor: Callable, batch_size: int = 5) -> List[Any]:
-        """Process items in parallel batches"""
-        results = []
-        for i in range(0, len(items), batch_size):
-            batch = items[i:i + batch_size]
-            batch_tasks = [lambda item=item: processor(item) for item in batch]
-            batch_results = await self.run_parallel(batch_tasks)
-            results.extend(batch_results)
-        return results
+        results = await asyncio.gather(*[run_task(task) for task in tasks], return_exceptions=True)
+        for r in results:
+            # Cancellation and interrupts are not task failures
+            if isinstance(r, BaseException) and not isinstance(r, Exception):
+                raise r
+        return BatchResult(results)
+    
+    async def batch_process(self, items: List[Any], processor: Callable[[Any], Awaitable[Any]], batch_size: int = 5) -> List[Any]:
+        """Process items with an async processor, in order; the semaphore bounds
+        concurrency, so a slow item never holds back the rest (batch_size is kept
+        for compatibility and no longer splits the work)"""
+        return (await self.run_parallel([lambda item=item: processor(item) for item in items])).results
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call on AnyIO's shared worker threads (the same pool FastAPI uses)"""
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs))
+
+def set_thread_limit(max_workers: int) -> None:
+    """Cap the shared AnyIO worker pool; must run inside the event loop"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = max_workers
+
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-flight
+background_tasks: Set[asyncio.Task] = set()
+
+def spawn_background(coro: Awaitable[Any]) -> asyncio.Task:
+    """Run a coroutine off the request path, logging instead of raising if it fails"""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+def _background_done(task: asyncio.Task) -> None:
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.getLogger("novax").error("Background task failed: %s", task.exception())
+
+async def drain_background_tasks(timeout: float = 10) -> None:
+    """Give pending background writes a chance to finish at shutdown"""
+    if background_tasks:
+        await asyncio.wait(set(background_tasks), timeout=timeout)
+
+class AdmissionController:
+    """Caps in-flight requests with a condition variable instead of a thread pool"""
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.condition = asyncio.Condition(asyncio.Lock())
+    
+    async def acquire(self) -> None:
+        """Wait until a slot is free, then take it"""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+    
+    async def release(self) -> None:
+        """Give a slot back and wake one waiter"""
+        # Free the slot before any await, so a cancelled release cannot leak it
+        self.active -= 1
+        await asyncio.shield(self._wake_one())
+    
+    async def _wake_one(self) -> None:
+        async with self.condition:
+            self.condition.notify(1)
+    
+    async def set_limit(self, limit: int) -> None:
+        """Resize the cap at runtime; a lower cap drains as in-flight requests finish"""
+        async with self.condition:
+            self.limit = limit
+            self.condition.notify_all()
+    
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing a key into one upstream call"""
+    
+    def __init__(self):
+        self.inflight: Dict[str, asyncio.Future] = {}
+    
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Run factory() once per key; concurrent callers await the same result"""
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.inflight[key] = future
+            spawn_background(self._run(key, future, factory))
+        return await asyncio.shield(future)
+    
+    async def _run(self, key: str, future: asyncio.Future, factory: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            future.set_result(await factory())
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved if every caller went away
+        finally:
+            # Cancellation or a BaseException must not leave waiters hanging
+            if not future.done():
+                future.cancel()
+            self.inflight.pop(key, None)
 
 # Global processor instance
 processor = FastParallelProcessor()
 
-async def parallel_ai_requests(prompts: List[str], model_func: Callable) -> List[str]:
-    """Process multiple AI requests in parallel"""
+async def parallel_ai_requests(prompts: List[str], model_func: Callable[[str], Awaitable[str]]) -> List[str]:
+    """Process multiple AI requests in parallel with an async model call"""
     tasks = [lambda prompt=p: model_func(prompt) for p in prompts]
-    return await processor.run_parallel(tasks)
+    return (await processor.run_parallel(tasks)).results
+
+async def concurrent_database_ops(operations: List[Callable[[], Awaitable[Any]]]) -> List[Any]:
+    """Execute async database operations concurrently"""
+    return (await processor.run_parallel(operations)).results
 
-async def concurrent_database_ops(operations: List[Callable]) -> List[Any]:
-    """Execute database operations concurrently"""
-    return await processor.run_parallel(operations)
+def env_int(name: str, default: int) -> int:
+    """Read a positive integer setting from the environment"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        parsed = int(value)
+    except ValueError:
+        parsed = 0
+    if parsed < 1:
+        warnings.warn(f"Ignoring invalid {name}={value!r}, using {default}")
+        return default
+    return parsed
 
-def optimize_for_render():
-    """Optimize settings for Render free tier"""
+def load_render_config() -> Dict[str, int]:
+    """Concurrency settings, overridable per deployment via environment"""
     return {
-        "max_workers": 2,  # Conservative for free tier
-        "semaphore_limit": 5,  # Prevent overwhelming
-        "batch_size": 3,  # Small batches
-        "timeout": 30  # Quick timeout
+        "max_workers": env_int("NOVAX_MAX_WORKERS", min(32, (os.cpu_count() or 1) + 4)),  # ThreadPoolExecutor's default
+        "semaphore_limit": env_int("NOVAX_SEM_LIMIT", 2000),
+        "batch_size": env_int("NOVAX_BATCH_SIZE", 25),
+        "timeout": env_int("NOVAX_TIMEOUT", 120)
     }
@@ -1,13 +1,44 @@
 import os
-from googleapiclient.discovery import build
-from typing import List, Dict
+import re
+import httpx
+from urllib.parse import urlparse
+from typing import List, Dict, Optional
 from datetime import datetime, timezone
 
+GOOGLE_SEARCH_URL = "https://www.googleapis.com/customsearch/v1"
+
+WORD_PATTERN = re.compile(r"\w+")
+RECENT_INDICATORS = frozenset(['today', 'latest', 'breaking', 'live', '2024'])
+
+# Query enhancement triggers
+NEWS_TRIGGERS = frozenset(['news', 'update', 'happening'])
+REALTIME_KEYWORDS = frozenset(['latest', 'current', 'today', 'now', 'recent', 'breaking', 'live'])
+PRICE_TRIGGERS = frozenset(['price', 'stock', 'rate', 'statistics'])
+
+def word_set(text: str) -> frozenset:
+    """Lower-cased words of a text, for O(1) membership tests"""
+    return frozenset(WORD_PATTERN.findall(text.lower()))
+
 class NovaXSearch:
     def __init__(self):
         self.google_api_key = os.getenv("GOOGLE_SEARCH_API_KEY")
         self.search_engine_id = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
-
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Shared HTTP client, so searches reuse pooled keep-alive connections"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=5.0,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+            )
+        return self._client
+    
+    async def close(self):
+        """Close the shared HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
         
     async def search(self, query: str, num_results: int = 5) -> Dict:
         """Search using Google Programmable Search Engine with real-time optimization"""
@@ -28,18 +59,16 @@ class NovaXSearch:
     
     def _enhance_query_for_realtime(self, query: str) -> str:
         """Enhance search query for better real-time results"""
-        realtime_keywords = ['latest', 'current', 'today', 'now', 'recent', 'breaking', 'live']
-        query_lower = query.lower()
+        words = word_set(query)
         
         # Add time-based modifiers for better real-time results
-        if any(keyword in query_lower for keyword in ['news', 'update', 'happening']):
-            if not any(rt_keyword in query_lower for rt_keyword in realtime_keywords):
-                query += " latest news"
+        if words & NEWS_TRIGGERS and not words & REALTIME_KEYWORDS:
+            query += " latest news"
         
         # Add current year for time-sensitive queries
-        current_year = datetime.now().year
-        if any(keyword in query_lower for keyword in ['price', 'stock', 'rate', 'statistics']):
-            if str(current_year) not in query:
+        if words & PRICE_TRIGGERS:
+            current_year = str(datetime.now().year)
+            if current_year not in query:
                 query += f" {current_year}"
         
         return query
@@ -47,17 +76,21 @@ class NovaXSearch:
     async def _google_search(self, query: str, num_results: int) -> Dict:
         """Google Programmable Search Engine implementation with real-time focus"""
         try:
-            service = build("customsearch", "v1", developerKey=self.google_api_key)
-            
             # Search parameters optimized for real-time results
             search_params = {
+                'key': self.google_api_key,
                 'q': query,
                 'cx': self.search_engine_id,
                 'num': num_results,
                 'sort': 'date'  # Sort by date for more recent results
             }
             
-            result = service.cse().list(**search_params).execute()
+            response = await self._get_client().get(GOOGLE_SEARCH_URL, params=search_params)
+            response.raise_for_status()
+            result = response.json()
+            
+            # Tokenize the query once for every result's relevance score
+            query_words = word_set(query)
             
             results = []
             for item in result.get('items', []):
@@ -70,7 +103,7 @@ class NovaXSearch:
                     "snippet": item.get('snippet', ''),
                     "source": self._extract_domain(item.get('link', '')),
                     "publish_date": publish_date,
-                    "relevance_score": self._calculate_relevance_score(item, query)
+                    "relevance_score": self._calculate_relevance_score(item, query_words)
                 })
             
             # Sort by relevance and recency
@@ -91,11 +124,20 @@ class NovaXSearch:
 
     def _extract_domain(self, url: str) -> str:
         """Extract domain from URL for citation"""
-        try:
-            from urllib.parse import urlparse
-            return urlparse(url).netloc.replace('www.', '')
-        except:
-            return url
+        start = url.find("://")
+        if start == -1:
+            try:
+                return urlparse(url).netloc.replace('www.', '')
+            except:
+                return url
+        # Common https://host/path shape: slice the host out without a full parse
+        start += 3
+        end = len(url)
+        for separator in "/?#":
+            i = url.find(separator, start, end)
+            if i != -1:
+                end = i
+        return url[start:end].replace('www.', '')
     
     def _extract_publish_date(self, item: dict) -> str:
         """Extract publish date from search result"""
@@ -116,29 +158,16 @@ class NovaXSearch:
         except:
             return datetime.now(timezone.utc).isoformat()
     
-    def _calculate_relevance_score(self, item: dict, query: str) -> float:
-        """Calculate relevance score for search result"""
+    def _calculate_relevance_score(self, item: dict, query_words: frozenset) -> float:
+        """Calculate relevance score for search result from whole-word overlaps"""
         try:
-            score = 0.0
-            query_words = query.lower().split()
-            
-            title = item.get('title', '').lower()
-            snippet = item.get('snippet', '').lower()
+            title_words = word_set(item.get('title', ''))
+            snippet_words = word_set(item.get('snippet', ''))
             
-            # Score based on query word matches
-            for word in query_words:
-                if word in title:
-                    score += 2.0
-                if word in snippet:
-                    score += 1.0
-            
-            # Bonus for recent content indicators
-            recent_indicators = ['today', 'latest', 'breaking', 'live', '2024']
-            for indicator in recent_indicators:
-                if indicator in title or indicator in snippet:
-                    score += 0.5
-            
-            return score
+            # Score based on query word matches, plus a bonus for recent content indicators
+            return (2.0 * len(query_words & title_words)
+                    + 1.0 * len(query_words & snippet_words)
+                    + 0.5 * len(RECENT_INDICATORS & (title_words | snippet_words)))
         except:
             return 0.0
     
@@ -148,24 +177,28 @@ class NovaXSearch:
             return f"No search results found for: {query}"
         
         search_time = search_results.get('search_time', datetime.now(timezone.utc).isoformat())
-        context = f"🔍 Real-time Search Results for '{query}' (Retrieved: {search_time}):\n\n"
+        parts = [f"🔍 Real-time Search Results for '{query}' (Retrieved: {search_time}):\n\n"]
         
         for i, result in enumerate(search_results["results"], 1):
-            context += f"{i}. **{result['title']}**\n"
-            context += f"   📍 Source: {result['source']}\n"
-            context += f"   🔗 URL: {result['link']}\n"
-            context += f"   📄 Summary: {result['snippet']}\n"
+            parts.append(
+                f"{i}. **{result['title']}**\n"
+                f"   📍 Source: {result['source']}\n"
+                f"   🔗 URL: {result['link']}\n"
+                f"   📄 Summary: {result['snippet']}\n"
+            )
             
             if result.get('publish_date'):
-                context += f"   📅 Published: {result['publish_date']}\n"
+                parts.append(f"   📅 Published: {result['publish_date']}\n")
             
-            context += "\n"
+            parts.append("\n")
         
-        context += f"🚀 Search powered by NovaX Search Engine\n"
-        context += f"📊 Total results available: {search_results.get('total_results', 'Unknown')}\n"
-        context += f"⏰ Search completed at: {search_time}"
+        parts.append(
+            f"🚀 Search powered by NovaX Search Engine\n"
+            f"📊 Total results available: {search_results.get('total_results', 'Unknown')}\n"
+            f"⏰ Search completed at: {search_time}"
+        )
         
-        return context
+        return "".join(parts)
     
     def generate_citations(self, search_results: Dict) -> List[str]:
         """Generate citation format for search results with timestamps"""
@@ -173,11 +206,8 @@ class NovaXSearch:
         search_time = search_results.get('search_time', datetime.now(timezone.utc).isoformat())
         
         for i, result in enumerate(search_results.get("results", []), 1):
-            citation = f"[{i}] {result['title']} - {result['source']}"
-            if result.get('publish_date'):
-                citation += f" (Published: {result['publish_date'][:10]})"
-            citation += f" - {result['link']}"
-            citations.append(citation)
+            published = f" (Published: {result['publish_date'][:10]})" if result.get('publish_date') else ""
+            citations.append(f"[{i}] {result['title']} - {result['source']}{published} - {result['link']}")
         
         citations.append(f"\n🕐 Search performed: {search_time[:19]} UTC")
         return citations
@@ -53,9 +53,12 @@ async def test_database():
         )
         print("✅ Message saved successfully")
         
-        # Test retrieving messages
-        print("\n📖 Testing message retrieval...")
-        messages = await database.get_chat_messages(chat_id)
+        # Test retrieving messages and user chats (independent reads, run together)
+        print("\n📖 Testing message and chat history retrieval...")
+        messages, chats = await asyncio.gather(
+            database.get_chat_messages(chat_id),
+            database.get_user_chats(user_id)
+        )
         print(f"✅ Retrieved {len(messages)} messages")
         
         if messages:
@@ -63,9 +66,6 @@ async def test_database():
                 print(f"   - Message: {msg['message'][:50]}...")
                 print(f"   - Response: {msg['response'][:50]}...")
         
-        # Test retrieving user chats
-        print("\n📂 Testing chat history retrieval...")
-        chats = await database.get_user_chats(user_id)
         print(f"✅ Retrieved {len(chats)} chats for user")
         
         if chats:
@@ -4,17 +4,18 @@ Test script for NovaX AI real-time features
 """
 
 import asyncio
-import requests
+import httpx
 import json
+import time
 from datetime import datetime
 
 BASE_URL = "http://localhost:8000"
 
-def test_health_endpoint():
+async def test_health_endpoint(client: httpx.AsyncClient):
     """Test the health endpoint with real-time info"""
-    print("🔍 Testing Health Endpoint...")
     try:
-        response = requests.get(f"{BASE_URL}/health")
+        response = await client.get("/health")
+        print("🔍 Testing Health Endpoint...")
         if response.status_code == 200:
             data = response.json()
             print("✅ Health Check Passed")
@@ -24,13 +25,14 @@ def test_health_endpoint():
         else:
             print(f"❌ Health check failed: {response.status_code}")
     except Exception as e:
+        print("🔍 Testing Health Endpoint...")
         print(f"❌ Health check error: {e}")
 
-def test_realtime_endpoint():
+async def test_realtime_endpoint(client: httpx.AsyncClient):
     """Test the real-time information endpoint"""
-    print("\n🕐 Testing Real-time Endpoint...")
     try:
-        response = requests.get(f"{BASE_URL}/api/realtime")
+        response = await client.get("/api/realtime")
+        print("\n🕐 Testing Real-time Endpoint...")
         if response.status_code == 200:
             data = response.json()
             print("✅ Real-time Info Retrieved")
@@ -43,18 +45,19 @@ def test_realtime_endpoint():
         else:
             print(f"❌ Real-time endpoint failed: {response.status_code}")
     except Exception as e:
+        print("\n🕐 Testing Real-time Endpoint...")
         print(f"❌ Real-time endpoint error: {e}")
 
-def test_search_endpoint():
+async def test_search_endpoint(client: httpx.AsyncClient):
     """Test the enhanced search endpoint"""
-    print("\n🔍 Testing Enhanced Search Endpoint...")
     try:
         search_data = {
             "query": "latest AI news today",
             "num_results": 3,
             "include_datetime": True
         }
-        response = requests.post(f"{BASE_URL}/api/search", json=search_data)
+        response = await client.post("/api/search", json=search_data)
+        print("\n🔍 Testing Enhanced Search Endpoint...")
         if response.status_code == 200:
             data = response.json()
             print("✅ Search Completed")
@@ -74,11 +77,11 @@ def test_search_endpoint():
             print(f"❌ Search failed: {response.status_code}")
             print(f"   Response: {response.text}")
     except Exception as e:
+        print("\n🔍 Testing Enhanced Search Endpoint...")
         print(f"❌ Search error: {e}")
 
-def test_chat_with_realtime():
+async def test_chat_with_realtime(client: httpx.AsyncClient):
     """Test chat endpoint with real-time queries"""
-    print("\n💬 Testing Chat with Real-time Queries...")
     
     # Test queries that should trigger NovaX Explorer
     test_queries = [
@@ -88,14 +91,24 @@ def test_chat_with_realtime():
         "What's happening in AI today?"
     ]
     
-    for query in test_queries:
-        print(f"\n   Testing: '{query}'")
+    async def timed_chat(query: str):
+        start = time.perf_counter()
         try:
-            chat_data = {
-                "message": query,
-                "token": "demo_token"  # Using demo mode
-            }
-            response = requests.post(f"{BASE_URL}/chat", json=chat_data)
+            return await client.post("/chat", json={"message": query, "token": "demo_token"}), time.perf_counter() - start
+        except Exception as e:
+            return e, time.perf_counter() - start
+    
+    # Using demo mode; all queries are in flight at once so the server can batch them
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed_chat(query) for query in test_queries))
+    wall_time = time.perf_counter() - start
+    
+    print("\n💬 Testing Chat with Real-time Queries...")
+    for query, (response, latency) in zip(test_queries, results):
+        print(f"\n   Testing: '{query}' ({latency:.2f}s)")
+        try:
+            if isinstance(response, Exception):
+                raise response
             if response.status_code == 200:
                 data = response.json()
                 print(f"   ✅ Agent: {data['agent_type']}")
@@ -106,16 +119,24 @@ def test_chat_with_realtime():
                 print(f"   ❌ Chat failed: {response.status_code}")
         except Exception as e:
             print(f"   ❌ Chat error: {e}")
+    
+    serial_time = sum(latency for _, latency in results)
+    print(f"\n   ⏱️ Wall time: {wall_time:.2f}s for {len(test_queries)} concurrent chats "
+          f"(sum of latencies: {serial_time:.2f}s)")
 
-def main():
+async def main():
     """Run all tests"""
     print("🚀 NovaX AI Real-time Features Test Suite")
     print("=" * 50)
     
-    test_health_endpoint()
-    test_realtime_endpoint()
-    test_search_endpoint()
-    test_chat_with_realtime()
+    # One keep-alive client shared by every test; independent probes run concurrently
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=30) as client:
+        await asyncio.gather(
+            test_health_endpoint(client),
+            test_realtime_endpoint(client),
+            test_search_endpoint(client),
+            test_chat_with_realtime(client)
+        )
     
     print("\n" + "=" * 50)
     print("✨ Test Suite Completed!")
@@ -123,4 +144,4 @@ def main():
     print("cd backend && uvicorn main:app --reload --port 8000")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
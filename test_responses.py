@@ -3,7 +3,7 @@
 Test script to demonstrate NovaX AI's adaptive response complexity
 """
 
-from main import analyze_query_complexity
+from main import analyze_query_complexity, analyze_topic_relevance, filter_brand_unsafe_content
 
 def test_query_complexity():
     """Test different types of queries and their complexity classification"""
@@ -59,5 +59,25 @@ def test_query_complexity():
     else:
         print("⚠️  Some tests failed. Check the complexity analysis logic.")
 
+def test_topic_relevance_empty_message():
+    """Empty or whitespace-only messages (e.g. image-only uploads) with history must not crash"""
+    history = [{'role': 'user', 'content': 'hi there'}]
+    
+    for message in ("", "   "):
+        result = analyze_topic_relevance(message, history)
+        assert result['reason'] != 'short_response', result
+    
+    print("✅ Empty messages with chat history are handled")
+
+def test_brand_filter_sentence_openers():
+    """Capitalized sentence openers are ordinary prose, not provider mentions"""
+    text = "Based on your question, here is an answer. Powered by curiosity, we dig in."
+    assert filter_brand_unsafe_content(text) == text
+    assert filter_brand_unsafe_content("I am based on Gemini, a language model.") == "I am NovaX AI NovaX AI, a NovaX AI system."
+    
+    print("✅ Brand filter leaves sentence openers alone")
+
 if __name__ == "__main__":
-    test_query_complexity()
\ No newline at end of file
+    test_query_complexity()
+    test_topic_relevance_empty_message()
+    test_brand_filter_sentence_openers()
\ No newline at end of file
@@ -8,66 +8,62 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+REQUIRED_VARS = (
+    "GEMINI_API_KEY",
+    "FIREBASE_SERVICE_ACCOUNT",
+    "GOOGLE_SEARCH_API_KEY",
+    "GOOGLE_SEARCH_ENGINE_ID"
+)
+
+FEATURES = (
+    "6-part structured response format",
+    "Deep multi-step analysis",
+    "Confidence scoring system",
+    "Adaptive expertise matching",
+    "Cross-domain intelligence",
+    "Real-time information access",
+    "Multi-agent routing system"
+)
+
+AGENTS = (
+    "NovaX Assistant - General help with structured reasoning",
+    "NovaX Explorer - Real-time web search and current information",
+    "NovaX Developer - Advanced coding solutions and architecture",
+    "NovaX Writer - Professional content creation and communication",
+    "NovaX Analyst - Deep data analysis and strategic insights",
+    "NovaX Creator - Innovative design and user experience",
+    "NovaX Tutor - Educational explanations and learning support"
+)
+
+def env_status(var: str) -> str:
+    """One report line for an environment variable, with its value masked"""
+    value = os.getenv(var)
+    if not value:
+        return f"  ❌ {var}: Not set"
+    return f"  ✅ {var}: {value[:10] + '...' if len(value) > 10 else value}"
+
 def verify_system():
     """Verify the enhanced NovaX AI system configuration"""
     
-    print("🌟 NovaX AI Enhanced System Verification")
-    print("=" * 50)
-    
-    # Check environment variables
-    required_vars = [
-        "GEMINI_API_KEY",
-        "FIREBASE_SERVICE_ACCOUNT", 
-        "GOOGLE_SEARCH_API_KEY",
-        "GOOGLE_SEARCH_ENGINE_ID"
-    ]
-    
-    print("🔧 Environment Configuration:")
-    for var in required_vars:
-        value = os.getenv(var)
-        status = "✅" if value else "❌"
-        masked_value = f"{value[:10]}..." if value and len(value) > 10 else value
-        print(f"  {status} {var}: {masked_value if value else 'Not set'}")
-    
-    # Check system prompt features
-    print("\n🧠 Enhanced AI Features:")
-    features = [
-        "6-part structured response format",
-        "Deep multi-step analysis", 
-        "Confidence scoring system",
-        "Adaptive expertise matching",
-        "Cross-domain intelligence",
-        "Real-time information access",
-        "Multi-agent routing system"
-    ]
-    
-    for feature in features:
-        print(f"  ✅ {feature}")
-    
-    # Check agent types
-    print("\n🤖 Available NovaX AI Agents:")
-    agents = [
-        "NovaX Assistant - General help with structured reasoning",
-        "NovaX Explorer - Real-time web search and current information", 
-        "NovaX Developer - Advanced coding solutions and architecture",
-        "NovaX Writer - Professional content creation and communication",
-        "NovaX Analyst - Deep data analysis and strategic insights",
-        "NovaX Creator - Innovative design and user experience",
-        "NovaX Tutor - Educational explanations and learning support"
+    # Build the whole report, then write it once
+    lines = [
+        "🌟 NovaX AI Enhanced System Verification",
+        "=" * 50,
+        "🔧 Environment Configuration:",
+        *(env_status(var) for var in REQUIRED_VARS),
+        "\n🧠 Enhanced AI Features:",
+        *(f"  ✅ {feature}" for feature in FEATURES),
+        "\n🤖 Available NovaX AI Agents:",
+        *(f"  🎯 {agent}" for agent in AGENTS),
+        "\n📊 System Information:",
+        "  🏢 Company: NovaX Technologies",
+        "  👨💼 CEO: Rishav Kumar Jha",
+        "  📦 Version: 2.1.0",
+        "  🧠 Intelligence Type: Next-generation AI with structured reasoning",
+        "\n✅ Enhanced NovaX AI system verification complete!",
+        "🚀 System is ready for advanced intelligent responses"
     ]
-    
-    for agent in agents:
-        print(f"  🎯 {agent}")
-    
-    # System information
-    print("\n📊 System Information:")
-    print("  🏢 Company: NovaX Technologies")
-    print("  👨💼 CEO: Rishav Kumar Jha") 
-    print("  📦 Version: 2.1.0")
-    print("  🧠 Intelligence Type: Next-generation AI with structured reasoning")
-    
-    print("\n✅ Enhanced NovaX AI system verification complete!")
-    print("🚀 System is ready for advanced intelligent responses")
+    print("\n".join(lines))
 
 if __name__ == "__main__":
     verify_system()
\ No newline at end of file
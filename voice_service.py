@@ -1,9 +1,120 @@
 """NovaX AI Voice Service - Deployment-safe version"""
 
-import base64
-from typing import Dict, Any
-from gtts import gTTS
+import asyncio
+import logging
+try:
+    import pybase64 as base64  # SIMD-accelerated drop-in for the stdlib module
+except ImportError:
+    import base64
+import os
+import re
+import threading
+import urllib.request
+import wave
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Any, Optional, Tuple
+import requests
+from gtts import gTTS, gTTSError
+from gtts.lang import _fallback_deprecated_lang, tts_langs
 from io import BytesIO
+from fast_cache import hash_key_parts, tts_cache
+from parallel_utils import SingleFlight, run_blocking
+
+try:
+    from piper import PiperVoice
+except ImportError:  # Local synthesis is optional; speech comes from gTTS without it
+    PiperVoice = None
+
+tts_slots = asyncio.Semaphore(16)  # Caps concurrent synthesis threads and gTTS requests
+tts_flight = SingleFlight()  # Concurrent requests for the same speech share one synthesis
+TTS_CACHE_MAX_TEXT = 2000  # Longer texts are rarely repeated; don't let them crowd the cache
+PIPER_VOICE_PATH = os.getenv("NOVAX_PIPER_VOICE")  # Path to a piper .onnx voice, e.g. en_US-amy-medium.onnx
+PIPER_LANGUAGE = os.getenv("NOVAX_PIPER_LANGUAGE", "en")
+piper_voice = None
+piper_lock = threading.Lock()
+
+def load_piper_voice() -> Optional["PiperVoice"]:
+    """Load the configured piper voice once; None if piper or the voice is unavailable"""
+    global piper_voice, PIPER_VOICE_PATH
+    with piper_lock:
+        if piper_voice is None and PiperVoice is not None and PIPER_VOICE_PATH:
+            try:
+                piper_voice = PiperVoice.load(PIPER_VOICE_PATH)
+            except Exception as e:
+                logging.getLogger("novax").warning("Piper voice unavailable, using gTTS: %s", e)
+                PIPER_VOICE_PATH = None
+        return piper_voice
+
+TTS_LANGS = frozenset(tts_langs())
+TTS_AUDIO_PATTERN = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+# One keep-alive pool shared by every synthesis thread (sized to the tts_slots cap)
+tts_session = requests.Session()
+tts_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+# gTTS sends with verify=False (for proxies) and silences urllib3's warning about it; so do we
+requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
+
+@lru_cache(maxsize=64)
+def tts_language(language: str) -> str:
+    """Resolve and validate a gTTS language once, not on every synthesis"""
+    lang = _fallback_deprecated_lang(language)
+    if lang not in TTS_LANGS:
+        raise ValueError(f"Language not supported: {language}")
+    return lang
+
+class PooledTTS(gTTS):
+    """gTTS that sends on the shared keep-alive session instead of opening a new
+    connection (and TLS handshake) for every request"""
+    
+    def fetch(self, prepared: requests.PreparedRequest) -> bytes:
+        """Send one of the text's requests and return its MP3 audio"""
+        try:
+            # Same request options as gTTS.stream
+            r = tts_session.send(request=prepared, proxies=urllib.request.getproxies(), verify=False)
+            r.raise_for_status()
+        except requests.exceptions.HTTPError:
+            raise gTTSError(tts=self, response=r)
+        except requests.exceptions.RequestException:
+            raise gTTSError(tts=self)
+        
+        audio = []
+        for line in r.iter_lines(chunk_size=1024):
+            decoded_line = line.decode("utf-8")
+            if "jQ1olc" in decoded_line:
+                audio_search = TTS_AUDIO_PATTERN.search(decoded_line)
+                if not audio_search:
+                    raise gTTSError(tts=self, response=r)
+                audio.append(base64.b64decode(audio_search.group(1).encode("ascii")))
+        return b"".join(audio)
+    
+    def stream(self):
+        for prepared in self._prepare_requests():
+            yield self.fetch(prepared)
+
+def render_piper(voice: "PiperVoice", text: str, slow: bool) -> memoryview:
+    """Render text to WAV with a local piper voice"""
+    audio_buffer = BytesIO()
+    with wave.open(audio_buffer, 'wb') as wav_file:
+        voice.synthesize(text, wav_file, length_scale=1.5 if slow else None)
+    return audio_buffer.getbuffer()  # A view of the audio, not a copy
+
+async def fetch_tts_chunk(tts: PooledTTS, prepared: requests.PreparedRequest) -> bytes:
+    async with tts_slots:
+        return await run_blocking(tts.fetch, prepared)
+
+async def synthesize_speech(text: str, language: str, slow: bool) -> Tuple[str, str]:
+    """Render text locally with piper (WAV) when a voice is configured for the
+    language, otherwise with gTTS (MP3, a network call); returns (base64, format)"""
+    voice = await run_blocking(load_piper_voice) if language == PIPER_LANGUAGE else None
+    if voice is not None:
+        async with tts_slots:
+            audio = await run_blocking(render_piper, voice, text, slow)
+        return base64.b64encode(audio).decode('utf-8'), 'wav'
+    
+    # gTTS splits long text at sentence boundaries and fetches the pieces one by
+    # one; fetch them all at once instead (MP3 frames concatenate cleanly)
+    tts = PooledTTS(text=text, lang=tts_language(language), slow=slow, lang_check=False)
+    parts = await asyncio.gather(*(fetch_tts_chunk(tts, prepared) for prepared in tts._prepare_requests()))
+    return base64.b64encode(b"".join(parts)).decode('utf-8'), 'mp3'
 
 class VoiceService:
     def __init__(self):
@@ -14,21 +125,87 @@ class VoiceService:
     
     async def text_to_speech(self, text: str, language: str = 'en', voice_speed: float = 1.0) -> Dict[str, Any]:
         try:
-            tts = gTTS(text=text, lang=language, slow=(voice_speed < 0.8))
-            audio_buffer = BytesIO()
-            tts.write_to_fp(audio_buffer)
-            audio_buffer.seek(0)
-            audio_base64 = base64.b64encode(audio_buffer.getvalue()).decode('utf-8')
+            # Reject unknown languages before touching the cache or the network
+            if language != PIPER_LANGUAGE:
+                tts_language(language)
+            
+            # Both engines only distinguish normal and slow speech, so that is all the key needs
+            slow = voice_speed < 0.8
+            cacheable = len(text) <= TTS_CACHE_MAX_TEXT
+            cache_key = hash_key_parts("tts", text, language, str(slow))
+            audio = await tts_cache.get(cache_key) if cacheable else None
+            if audio is None:
+                async def synthesize():
+                    result = await synthesize_speech(text, language, slow)
+                    if cacheable:
+                        await tts_cache.set(cache_key, result)
+                    return result
+                
+                audio = await tts_flight.do(cache_key, synthesize)
+            audio_base64, audio_format = audio
             
             return {
                 'success': True,
                 'audio_data': audio_base64,
-                'format': 'mp3',
+                'format': audio_format,
                 'language': language
             }
         except Exception as e:
             return {'success': False, 'error': str(e), 'audio_data': None}
     
+    async def text_to_speech_stream(self, text: str, language: str = 'en', voice_speed: float = 1.0) -> AsyncIterator[bytes]:
+        """Raw MP3 bytes, yielded as gTTS receives each chunk, for streaming straight to the client"""
+        lang = tts_language(language)  # Unknown languages fail before the cache or the network
+        slow = voice_speed < 0.8
+        cacheable = len(text) <= TTS_CACHE_MAX_TEXT
+        cache_key = hash_key_parts("tts", text, language, str(slow))
+        audio = await tts_cache.get(cache_key) if cacheable else None
+        if audio is not None and audio[1] == 'mp3':
+            yield base64.b64decode(audio[0])
+            return
+        
+        # gTTS runs on a worker thread and hands chunks to the loop as they arrive
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()  # Set when the client goes away; the thread stops between chunks
+        
+        def produce():
+            try:
+                for chunk in PooledTTS(text=text, lang=lang, slow=slow, lang_check=False).stream():
+                    if stop.is_set():
+                        return
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+            except Exception as e:
+                if not stop.is_set():
+                    loop.call_soon_threadsafe(chunks.put_nowait, e)
+        
+        received = []
+        # The slot is held until the worker thread finishes, even if the generator is closed first
+        await tts_slots.acquire()
+        producer = asyncio.ensure_future(run_blocking(produce))
+        producer.add_done_callback(lambda _: tts_slots.release())
+        try:
+            while (chunk := await chunks.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                received.append(chunk)
+                yield chunk
+            await producer
+        finally:
+            stop.set()
+        
+        if cacheable:
+            await tts_cache.set(cache_key, (base64.b64encode(b"".join(received)).decode('utf-8'), 'mp3'))
+    
+    def cache_info(self) -> Dict[str, Any]:
+        """Hit/miss counters and size of the synthesized speech cache"""
+        return tts_cache.get_stats()
+    
+    async def cache_clear(self) -> None:
+        """Drop all cached speech"""
+        await tts_cache.clear()
+    
     def get_supported_languages(self) -> Dict[str, str]:
         return self.tts_languages
 